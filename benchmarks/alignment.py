@@ -0,0 +1,160 @@
+"""Per-tick decode latency of the word-alignment paths, on a real model.
+
+Slides a live-style decode window over WAV files (growing from the start of
+each file up to --window, stepping by --tick) and times, for every window:
+
+  plain        transcribe() without word timestamps
+  two-phase    plain, then a second full transcribe(word_timestamps=True)
+               whenever the old trigger (any stop character in a segment) fired
+  lazy         AligningWhisperModel.transcribe_lazily with the server's trigger
+  align-all    both paths with alignment forced on every tick (worst case)
+
+align-all also checks that the lazily added words match what
+transcribe(word_timestamps=True) produces for every segment both decoded
+(with word timestamps, a window that doesn't end on a timestamp resumes from
+the last word rather than the last segment, so the tails can differ). The
+"alignment share" is what simulate_stream.py's --alignment-cost models.
+
+    PYTHONPATH=. python benchmarks/alignment.py --model tiny.en --device cpu
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+from faster_whisper import decode_audio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from alignment import AligningWhisperModel
+from finalization import SOFT_STOP, STRONG_STOP
+from model_registry import ModelRegistry
+from quality import FALLBACK_TEMPERATURES
+from transcriber import needs_word_alignment
+
+DEFAULT_AUDIO = os.path.join(os.path.dirname(__file__), "..", "experiments", "sample_audio_for_sst", "*.wav")
+SAMPLE_RATE = 16000
+
+
+def old_trigger(segments):
+    # The trigger the two-phase decode used
+    return any(
+        p in s.text for s in segments if not (s.no_speech_prob > 0.8 or s.avg_logprob < -1.0)
+        for p in STRONG_STOP + SOFT_STOP
+    )
+
+
+def windows(paths, window, tick):
+    for path in paths:
+        audio = decode_audio(path, sampling_rate=SAMPLE_RATE)
+        step = int(tick * SAMPLE_RATE)
+        for end in range(step, len(audio) + 1, step):
+            yield audio[max(0, end - int(window * SAMPLE_RATE)):end]
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def summary(name, seconds):
+    ms = sorted(s * 1000 for s in seconds)
+    p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+    print(f"  {name:<22} mean {statistics.mean(ms):7.1f}ms  p50 {statistics.median(ms):7.1f}ms  p95 {p95:7.1f}ms")
+
+
+def main(args):
+    paths = sorted(p for pattern in args.audio for p in glob.glob(pattern))
+    if not paths:
+        raise SystemExit("No audio files")
+    if os.path.isdir(args.model):
+        model = AligningWhisperModel(args.model, device=args.device, compute_type=args.compute_type)
+    else:
+        model = ModelRegistry().load(
+            args.model, model_class=AligningWhisperModel, device=args.device, compute_type=args.compute_type
+        )
+    # As WhisperTranscriber._decode at standard quality
+    options = dict(
+        language="en",
+        beam_size=args.beam_size,
+        temperature=0.0 if args.no_fallback else FALLBACK_TEMPERATURES,
+        vad_filter=True,
+        vad_parameters=dict(min_silence_duration_ms=500, speech_pad_ms=200),
+        no_speech_threshold=0.6,
+        log_prob_threshold=-0.5,
+        compression_ratio_threshold=2.4,
+        condition_on_previous_text=False,
+    )
+    if args.max_new_tokens:
+        options["max_new_tokens"] = args.max_new_tokens
+
+    def transcribe(audio, **extra):
+        segments, _ = model.transcribe(audio, **options, **extra)
+        return list(segments)
+
+    # Warm up the encoder and the VAD model
+    audio = next(windows(paths, args.window, args.tick))
+    transcribe(audio)
+    model.transcribe_lazily(audio, lambda segments: True, **options)
+
+    plain, two_phase, lazy, full, lazy_all = [], [], [], [], []
+    old_fired = new_fired = 0
+    drift = 0.0
+    compared = resumed = 0
+    for audio in windows(paths, args.window, args.tick):
+        segments, seconds = timed(lambda: transcribe(audio))
+        plain.append(seconds)
+        if old_trigger(segments):
+            old_fired += 1
+            seconds += timed(lambda: transcribe(audio, word_timestamps=True))[1]
+        two_phase.append(seconds)
+
+        (_, aligned), seconds = timed(lambda: model.transcribe_lazily(audio, needs_word_alignment, **options))
+        lazy.append(seconds)
+        new_fired += aligned
+
+        reference, seconds = timed(lambda: transcribe(audio, word_timestamps=True))
+        full.append(seconds)
+        (segments, _), seconds = timed(lambda: model.transcribe_lazily(audio, lambda segments: True, **options))
+        lazy_all.append(seconds)
+        expected = {(s.seek, tuple(s.tokens)): s.words for s in reference}
+        for s in segments:
+            words = expected.get((s.seek, tuple(s.tokens)))
+            if words is None:
+                resumed += 1
+                continue
+            if [w.word for w in s.words] != [w.word for w in words]:
+                raise SystemExit("Lazily aligned words differ from transcribe(word_timestamps=True)")
+            compared += 1
+            for a, b in zip(s.words, words):
+                drift = max(drift, abs(a.start - b.start), abs(a.end - b.end))
+
+    ticks = len(plain)
+    print(f"{ticks} ticks over {len(paths)} file(s), window {args.window:g}s, tick {args.tick:g}s")
+    print(f"per tick with the live triggers (old fired on {old_fired}, new on {new_fired}):")
+    summary("plain", plain)
+    summary("two-phase (before)", two_phase)
+    summary("lazy (after)", lazy)
+    print("per tick with alignment on every tick:")
+    summary("two-phase (before)", [p + f for p, f in zip(plain, full)])
+    summary("lazy (after)", lazy_all)
+    share = statistics.mean(lazy_all) / statistics.mean(plain) - 1
+    print(f"alignment share {share:.2f} of a plain decode; {compared} segments compared "
+          f"({resumed} decoded from a different seek), max word timing difference {drift * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="tiny.en", help="Model name in the local registry, or a model directory")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--compute-type", default="int8")
+    parser.add_argument("--audio", nargs="+", default=[DEFAULT_AUDIO], help="WAV files or glob patterns")
+    parser.add_argument("--window", type=float, default=12.0, help="Decode window (seconds)")
+    parser.add_argument("--tick", type=float, default=1.0, help="Window step (seconds)")
+    parser.add_argument("--beam-size", type=int, default=1)
+    parser.add_argument("--no-fallback", action="store_true", help="Decode at temperature 0 only")
+    parser.add_argument("--max-new-tokens", type=int, default=0, help="Cap tokens per window (0: no cap)")
+    main(parser.parse_args())
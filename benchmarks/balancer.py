@@ -0,0 +1,106 @@
+"""Bridge load balancing against stand-in servers: distribution and failover.
+
+Starts N in-process stand-in WhisperTranscriber servers that report their open
+streams through GetLoad, opens sessions through the bridge's LoadBalancer, then
+stops one server and measures how long until new sessions avoid it.
+
+    PYTHONPATH=. python benchmarks/balancer.py --servers 3 --sessions 60
+"""
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import time
+
+import grpc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from protos import transcription_pb2, transcription_pb2_grpc
+from balancer import LoadBalancer
+
+
+class StandInTranscriber(transcription_pb2_grpc.WhisperTranscriberServicer):
+    def __init__(self):
+        self.active_streams = 0
+
+    async def GetLoad(self, request, context):
+        return transcription_pb2.LoadReport(active_streams=self.active_streams)
+
+    async def StreamTranscription(self, request_iterator, context):
+        self.active_streams += 1
+        try:
+            async for _ in request_iterator:
+                yield transcription_pb2.TranscriptionResult(text="ok")
+        finally:
+            self.active_streams -= 1
+
+
+async def start_server():
+    servicer = StandInTranscriber()
+    server = grpc.aio.server()
+    transcription_pb2_grpc.add_WhisperTranscriberServicer_to_server(servicer, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    await server.start()
+    return server, servicer, f"127.0.0.1:{port}"
+
+
+async def open_session(balancer, done):
+    # Mirrors the bridge: pick a backend, stream until the session ends
+    backend = balancer.pick()
+
+    async def requests():
+        yield transcription_pb2.StreamRequest(audio=transcription_pb2.AudioChunk(data=b"\0" * 3200))
+        await done.wait()
+
+    call = backend.pool.stub().StreamTranscription(requests(), wait_for_ready=not balancer.has_alternatives)
+    try:
+        async for _ in call:
+            break
+    except grpc.RpcError:
+        balancer.mark_failed(backend)
+    return backend.target, call
+
+
+async def main(args):
+    servers = [await start_server() for _ in range(args.servers)]
+    targets = [target for _, _, target in servers]
+    balancer = LoadBalancer(targets, pool_size=1, poll_interval=args.poll_interval)
+    await balancer.start()
+    done = asyncio.Event()
+
+    # 1. Even distribution
+    sessions = [await open_session(balancer, done) for _ in range(args.sessions)]
+    counts = collections.Counter(target for target, _ in sessions)
+    print("Distribution:", {t: counts[t] for t in targets})
+    print("Server-side active:", [servicer.active_streams for _, servicer, _ in servers])
+    spread = max(counts.values()) - min(counts.get(t, 0) for t in targets)
+    print(f"  spread {spread} session(s) -> {'OK' if spread <= 1 else 'UNEVEN'}")
+
+    # 2. Failover: stop one server, time until the balancer stops choosing it
+    victim_server, _, victim = servers[0]
+    await victim_server.stop(None)
+    stopped = time.perf_counter()
+    while any(b.healthy for b in balancer.backends if b.target == victim):
+        await asyncio.sleep(0.01)
+    print(f"Failover: {victim} marked unhealthy after {(time.perf_counter() - stopped) * 1000:.0f} ms")
+
+    after = [await open_session(balancer, done) for _ in range(args.sessions // 2)]
+    misrouted = sum(1 for target, _ in after if target == victim)
+    print(f"  {misrouted} of {len(after)} new sessions sent to the stopped server -> {'OK' if misrouted == 0 else 'FAIL'}")
+
+    done.set()
+    for _, call in sessions + after:
+        call.cancel()
+    await balancer.close()
+    for server, _, _ in servers[1:]:
+        await server.stop(None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", type=int, default=3)
+    parser.add_argument("--sessions", type=int, default=60)
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,77 @@
+"""Session setup latency: a fresh gRPC channel per session vs the bridge's pool.
+
+Runs a stand-in WhisperTranscriber in-process that answers the first request
+immediately, then times open -> first result for sequential sessions.
+
+    PYTHONPATH=. python benchmarks/channel_setup.py --sessions 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import grpc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from protos import transcription_pb2, transcription_pb2_grpc
+from channels import CHANNEL_OPTIONS, ChannelPool
+
+
+class EchoTranscriber(transcription_pb2_grpc.WhisperTranscriberServicer):
+    async def StreamTranscription(self, request_iterator, context):
+        async for _ in request_iterator:
+            yield transcription_pb2.TranscriptionResult(text="ok", is_final=True)
+            return
+
+
+async def one_session(stub):
+    async def requests():
+        yield transcription_pb2.StreamRequest(audio=transcription_pb2.AudioChunk(data=b"\0" * 6400))
+
+    started = time.perf_counter()
+    async for _ in stub.StreamTranscription(requests(), wait_for_ready=True):
+        break
+    return time.perf_counter() - started
+
+
+async def fresh_channel_session(target):
+    started = time.perf_counter()
+    async with grpc.aio.insecure_channel(target, options=CHANNEL_OPTIONS) as channel:
+        await one_session(transcription_pb2_grpc.WhisperTranscriberStub(channel))
+    return time.perf_counter() - started
+
+
+def report(name, samples):
+    samples = sorted(s * 1000 for s in samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<16} mean {statistics.mean(samples):6.2f} ms   p50 {statistics.median(samples):6.2f} ms   p95 {p95:6.2f} ms")
+
+
+async def main(args):
+    server = grpc.aio.server()
+    transcription_pb2_grpc.add_WhisperTranscriberServicer_to_server(EchoTranscriber(), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    await server.start()
+    target = f"127.0.0.1:{port}"
+
+    fresh = [await fresh_channel_session(target) for _ in range(args.sessions)]
+
+    pool = ChannelPool(target, size=args.pool_size)
+    await pool.start()
+    await one_session(pool.stub())  # Warm-up, as the bridge does at startup
+    pooled = [await one_session(pool.stub()) for _ in range(args.sessions)]
+    await pool.close()
+    await server.stop(None)
+
+    report("fresh channel", fresh)
+    report("pooled channel", pooled)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=2)
+    asyncio.run(main(parser.parse_args()))
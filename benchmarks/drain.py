@@ -0,0 +1,278 @@
+"""Drain concurrent simulated streams, as a rolling restart would.
+
+Runs several live streams through the real servicer at once, each with its
+own synthetic speech and the scripted model from simulate_stream.py, all on
+one virtual clock. Part way in, WhisperTranscriber.drain starts while the
+clients keep talking, and the run checks what a zero-downtime restart
+relies on:
+
+  - a stream opened during the drain is refused with UNAVAILABLE
+  - every open stream ends with UNAVAILABLE (so its client reconnects
+    elsewhere), at an utterance boundary or at the latest the deadline,
+    telling the client exactly how much of its audio was used
+  - a stream ended at a boundary lost none of the words it had received
+  - recordings and transcript rows are all written, memory is released
+
+Exits non-zero if a check fails.
+
+    PYTHONPATH=. python benchmarks/drain.py --streams 8 --drain-at 40 --deadline 10
+"""
+import argparse
+import asyncio
+import difflib
+import logging
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from simulate_stream import (
+    DITHER_LEVEL, LOCATOR_SAMPLES, SAMPLE_RATE, SCRATCH, Locator, ScriptedModel, SimulatedClock, SimulatedTranscriber,
+    synthetic_audio, synthetic_script, tokens,
+)
+
+import grpc
+import inference
+import quality
+import sessions
+import transcriber
+from protos import transcription_pb2
+from transcript_store import TranscriptStore
+
+
+class ScriptedFleet:
+    # One scripted model per stream behind the servicer's single model: the
+    # window's trailing samples tell whose audio it is (see Locator)
+    def __init__(self, models):
+        self.models = models
+
+    def _model(self, audio):
+        for model in self.models:
+            if audio[-LOCATOR_SAMPLES:].tobytes() in model.locator._ends:
+                return model
+        raise KeyError("Window matches no stream")
+
+    def transcribe(self, audio, **options):
+        return self._model(audio).transcribe(audio, **options)
+
+    def transcribe_lazily(self, audio, needs_alignment, **options):
+        return self._model(audio).transcribe_lazily(audio, needs_alignment, **options)
+
+    @property
+    def decodes(self):
+        return sum(model.decodes for model in self.models)
+
+
+class Aborted(Exception):
+    pass
+
+
+class Context:
+    def __init__(self):
+        self.code = None
+
+    async def abort(self, code, details):
+        self.code = code
+        raise Aborted(f"{code} {details}")
+
+
+class Stream:
+    def __init__(self, servicer, script, audio, config):
+        self.servicer = servicer
+        self.script = script
+        self.audio = audio
+        self.config = config
+        self.context = Context()
+        self.feed = asyncio.Queue()
+        self.fed = 0  # Chunks handed to the server
+        self.session = None
+        self.finals = []
+        self.drained_offset = None
+        self.done = False
+        self.task = None
+
+    async def requests(self):
+        yield transcription_pb2.StreamRequest(config=self.config)
+        while (chunk := await self.feed.get()) is not None:
+            yield transcription_pb2.StreamRequest(audio=transcription_pb2.AudioChunk(data=chunk.tobytes()))
+
+    async def run(self):
+        try:
+            async for result in self.servicer.StreamTranscription(self.requests(), self.context):
+                if result.session_id:
+                    self.session = self.servicer.sessions.get(result.session_id)
+                elif result.drained:
+                    self.drained_offset = result.resume_offset
+                elif result.is_final:
+                    self.finals.append(result)
+        except Aborted:
+            pass
+        finally:
+            self.done = True
+
+    def busy(self):
+        return self.session is not None and not self.session.input.empty() and not self.done
+
+    def consumed_bytes(self, chunk_samples):
+        # Audio the decode loop took off its input before it stopped
+        undecoded = 0
+        while not self.session.input.empty():
+            undecoded += self.session.input.get_nowait() is not None
+        return min(len(self.audio), (self.fed - undecoded) * chunk_samples) * self.audio.itemsize
+
+
+async def settle(streams):
+    # Let every stream work through what it has (decodes advance the clock)
+    while any(stream.busy() for stream in streams):
+        await asyncio.sleep(0)
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def make_streams(args, chunk_samples, clock):
+    scripts, audios, models = [], [], []
+    for i in range(args.streams):
+        seed = args.seed + i
+        script = synthetic_script(args.seconds, args.wpm, seed)
+        audio = synthetic_audio(script, args.seconds, seed)
+        audio += (np.random.default_rng(seed).standard_normal(len(audio)) * DITHER_LEVEL).astype(np.float32)
+        scripts.append(script)
+        audios.append(audio)
+        models.append(ScriptedModel(script, Locator(audio, chunk_samples), clock, args))
+    return scripts, audios, ScriptedFleet(models)
+
+
+async def run(args, drain_at, db_path):
+    # All streams for --seconds, starting a drain at drain_at (None: never)
+    clock = SimulatedClock()
+    for module in (transcriber, inference, sessions, quality):
+        module.time = clock
+    chunk_samples = int(args.chunk_ms * SAMPLE_RATE / 1000)
+    scripts, audios, fleet = make_streams(args, chunk_samples, clock)
+
+    servicer = SimulatedTranscriber(fleet, clock)
+    servicer.store = TranscriptStore(db_path)
+    await servicer.store.start()
+
+    config = transcription_pb2.StreamConfig(sample_rate=SAMPLE_RATE)
+    streams = [Stream(servicer, script, audio, config) for script, audio in zip(scripts, audios)]
+    for stream in streams:
+        stream.task = asyncio.create_task(stream.run())
+    await settle(streams)
+
+    drain = drain_started = late = None
+    for start in range(0, len(audios[0]), chunk_samples):
+        arrival = (start + chunk_samples) / SAMPLE_RATE
+        await settle(streams)
+        clock.now = max(clock.now, arrival)
+        if drain_at is not None and drain is None and arrival >= drain_at:
+            drain_started = clock.now
+            drain = asyncio.create_task(servicer.drain(args.deadline))
+            await asyncio.sleep(0)
+            late = Stream(servicer, scripts[0], audios[0], config)
+            await late.run()
+        if drain is not None and drain.done():
+            break
+        # Clients keep talking until their stream is closed on them
+        for stream in streams:
+            if not stream.done:
+                stream.feed.put_nowait(stream.audio[start:start + chunk_samples])
+                stream.fed += 1
+    if drain_at is not None and drain is None:
+        raise SystemExit(f"--drain-at {drain_at} is past the end of the audio")
+    for stream in streams:
+        stream.feed.put_nowait(None)
+    if drain is not None:
+        await drain
+    await asyncio.gather(*(stream.task for stream in streams))
+    await servicer.store.close()
+    return servicer, streams, late, drain_started
+
+
+async def main(args):
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    # Nothing here drops a stream, so a half-close needs no settling time
+    transcriber.HALF_CLOSE_SETTLE_SECONDS = 0
+    chunk_samples = int(args.chunk_ms * SAMPLE_RATE / 1000)
+
+    # The same streams left to run to the end: what each would have finalized
+    _, reference, _, _ = await run(args, None, os.path.join(SCRATCH.name, "reference.db"))
+    db_path = os.path.join(SCRATCH.name, "drained.db")
+    servicer, streams, late, drain_started = await run(args, args.drain_at, db_path)
+
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+
+    print(f"{args.streams} streams, drain from {drain_started:.1f}s (deadline {args.deadline:g}s), "
+          f"done at {servicer.clock.now:.1f}s")
+    check(late.context.code == grpc.StatusCode.UNAVAILABLE, f"stream opened while draining got {late.context.code}")
+
+    reference_db = sqlite3.connect(os.path.join(SCRATCH.name, "reference.db"))
+    conn = sqlite3.connect(db_path)
+    for i, (stream, undrained) in enumerate(zip(streams, reference)):
+        consumed_bytes = stream.consumed_bytes(chunk_samples)
+        consumed = consumed_bytes / stream.audio.itemsize / SAMPLE_RATE
+        ended = consumed - drain_started
+        forced = ended >= args.deadline
+        # Finals the undrained stream made of audio this one had received
+        expected = [
+            t for (text,) in reference_db.execute(
+                "SELECT text FROM segments WHERE session_id = ? AND end_time <= ? ORDER BY id",
+                (undrained.session.id, consumed),
+            )
+            for t in tokens(text)
+        ]
+        got = [t for r in stream.finals for t in tokens(r.text)]
+        dropped = sum(
+            i2 - i1 for op, i1, i2, _, _ in difflib.SequenceMatcher(None, expected, got, autojunk=False).get_opcodes()
+            if op in ("delete", "replace")
+        )
+        stored, = conn.execute("SELECT COUNT(*) FROM segments WHERE session_id = ?", (stream.session.id,)).fetchone()
+        recording, = conn.execute("SELECT recording_path FROM sessions WHERE id = ?", (stream.session.id,)).fetchone()
+        print(f"stream {i}: ended {ended:5.2f}s into the drain{' (deadline)' if forced else ''}, "
+              f"{len(stream.finals)} finals ({stored} stored), {len(got)} words, {dropped}/{len(expected)} dropped")
+        if stream.fed * chunk_samples < len(stream.audio):
+            # Still talking when it was closed (otherwise the client just finished)
+            check(stream.context.code == grpc.StatusCode.UNAVAILABLE, f"stream {i} ended with {stream.context.code}")
+            check(stream.session.drained, f"stream {i} was not drained")
+            check(stream.drained_offset == consumed_bytes,
+                  f"stream {i} was told to resend from byte {stream.drained_offset}, not {consumed_bytes}")
+        check(ended <= args.deadline + args.chunk_ms / 1000, f"stream {i} outlived the deadline")
+        check(stored == len(stream.finals), f"stream {i}: {stored} of {len(stream.finals)} finals stored")
+        check(recording is not None and os.path.exists(recording), f"stream {i}: recording {recording} not written")
+        if not forced:
+            check(dropped == 0, f"stream {i} dropped {dropped} words at its boundary")
+    conn.close()
+    reference_db.close()
+
+    check(not servicer._closing_recordings, "recordings still being written after the drain")
+    check(servicer.active_streams == 0 and not servicer.sessions.live(), "streams still open after the drain")
+    check(servicer.memory.total == 0, f"{servicer.memory.total} bytes still accounted to streams")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    print("OK" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=90.0, help="Length of each stream's synthetic audio")
+    parser.add_argument("--drain-at", type=float, default=40.0, help="Virtual time the drain starts")
+    parser.add_argument("--deadline", type=float, default=transcriber.DRAIN_DEADLINE_SECONDS, help="Drain deadline (seconds)")
+    parser.add_argument("--wpm", type=float, default=150.0, help="Synthetic speaking rate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-ms", type=float, default=100.0, help="Audio per StreamRequest")
+    parser.add_argument("--decode-latency", type=float, default=0.02, help="Virtual seconds per decode")
+    parser.add_argument("--decode-rtf", type=float, default=0.005, help="Extra virtual seconds per second of window")
+    parser.add_argument("--alignment-cost", type=float, default=0.05, help="Alignment cost as a fraction of the decode it aligns")
+    parser.add_argument("--unstable-tail", type=float, default=0.3, help="Words ending this close to the window edge are withheld")
+    parser.add_argument("--verbose", action="store_true", help="Show the server's own logging")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,98 @@
+"""Finalization engine throughput on decoded windows.
+
+Builds word-timed decodes of a sliding window over a synthetic script (the
+shape Whisper returns with word timestamps: segments split at sentence ends
+and long pauses) and times Finalizer.tick on each, i.e. the per-tick Python
+cost of deciding finals, splits and partials, without any model.
+
+    PYTHONPATH=. python benchmarks/finalization.py --window 12 --wpm 150
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from finalization import Finalizer
+
+WORDS = "the a and of to in is that it was for on are as with his they at be this from have or by one had not".split()
+
+
+def script(seconds, wpm, seed):
+    # (word, start, end) with sentence punctuation, the odd comma and pauses
+    rng = random.Random(seed)
+    word_seconds = 60.0 / wpm
+    words, t = [], 0.5
+    while t < seconds:
+        n = rng.randint(4, 20)
+        for i in range(n):
+            text = rng.choice(WORDS)
+            if i == n - 1:
+                text += rng.choice("...?!")
+            elif i > 2 and rng.random() < 0.08:
+                text += ","
+            words.append((text, t, t + word_seconds * rng.uniform(0.55, 0.85)))
+            t += word_seconds
+        t += rng.choice((0.4, 0.6, 0.8, 1.0, 1.5, 3.0))
+    return words
+
+
+def segment(words):
+    return types.SimpleNamespace(
+        text="".join(w.word for w in words), start=words[0].start, end=words[-1].end,
+        words=words, no_speech_prob=0.05, avg_logprob=-0.2,
+    )
+
+
+def window(words, end, duration):
+    # Segments for the words inside [end - duration, end), relative to the window
+    start = end - duration
+    segments, current = [], []
+    for text, word_start, word_end in words:
+        if word_start < start or word_end > end:
+            continue
+        word = types.SimpleNamespace(word=" " + text, start=word_start - start, end=word_end - start, probability=0.9)
+        if current and word.start - current[-1].end > 1.0:
+            segments.append(segment(current))
+            current = []
+        current.append(word)
+        if text.endswith((".", "?", "!")):
+            segments.append(segment(current))
+            current = []
+    if current:
+        segments.append(segment(current))
+    return segments
+
+
+def main(args):
+    words = script(args.seconds + args.window, args.wpm, args.seed)
+    windows = [
+        window(words, args.window + i * args.tick, args.window)
+        for i in range(int(args.seconds / args.tick))
+    ]
+    window_words = sum(len(s.words) for segments in windows for s in segments)
+    print(f"{len(windows)} windows of {args.window:.0f}s, {window_words / len(windows):.1f} words each")
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        finalizer = Finalizer()
+        started = time.perf_counter()
+        for segments in windows:
+            finalizer.tick(segments, 0.0, 0.0, args.window, False, 0)
+        best = min(best, time.perf_counter() - started)
+    print(f"{len(windows) / best:,.0f} ticks/s, {best / len(windows) * 1e6:.1f} us/tick, "
+          f"{best / window_words * 1e6:.2f} us/word (best of {args.repeat})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=600.0, help="Script length to slide over")
+    parser.add_argument("--window", type=float, default=12.0, help="Decode window (seconds)")
+    parser.add_argument("--tick", type=float, default=1.0, help="Window step (seconds)")
+    parser.add_argument("--wpm", type=float, default=150.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
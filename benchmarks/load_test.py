@@ -0,0 +1,323 @@
+"""End-to-end load test: N concurrent StreamTranscription streams against a server.
+
+Each stream replays WAV files at real-time pace (a chunk is sent once its audio
+would have been captured), with a pause between files so every utterance can
+finalize. Streams start one by one over the ramp, so one run covers every
+concurrency level up to --streams. Per stream it records:
+
+  first partial           first speech sent -> first partial received
+  final after speech end  utterance's last speech sent -> first final that heard it
+  result lag              result received - when the audio it covers was sent
+
+and prints p50/p95/p99 overall and per concurrency level, plus the server's own
+load reports. --report writes everything as JSON; --compare prints the deltas
+against an earlier report, e.g. from the previous build.
+
+    PYTHONPATH=. python benchmarks/load_test.py --target localhost:50051 --streams 32 --ramp 120 --hold 60
+"""
+import argparse
+import asyncio
+import collections
+import glob
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import wave
+from datetime import datetime, timezone
+
+import grpc
+import numpy as np
+
+from protos import transcription_pb2, transcription_pb2_grpc
+
+DEFAULT_AUDIO = os.path.join(os.path.dirname(__file__), "..", "experiments", "sample_audio_for_sst", "*.wav")
+ENCODINGS = {
+    "f32": transcription_pb2.AUDIO_ENCODING_F32LE,
+    "s16": transcription_pb2.AUDIO_ENCODING_S16LE,
+}
+METRICS = {
+    "first_partial": "first partial (s)",
+    "final_after_speech_end": "final after speech end (s)",
+    "lag": "result lag (s)",
+}
+# Energy-based speech detection over 20 ms frames
+FRAME_SECONDS = 0.02
+
+
+class Clip:
+    # One WAV file at the stream's sample rate, with where its speech starts and ends
+    def __init__(self, path, sample_rate):
+        with wave.open(path) as f:
+            if f.getsampwidth() != 2:
+                raise SystemExit(f"{path}: only 16-bit PCM WAV is supported")
+            audio = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2").astype(np.float32) / 32768.0
+            audio = audio.reshape(-1, f.getnchannels()).mean(axis=1)
+            rate = f.getframerate()
+        if rate != sample_rate:
+            target = int(len(audio) * sample_rate / rate)
+            audio = np.interp(np.linspace(0, len(audio) - 1, target), np.arange(len(audio)), audio).astype(np.float32)
+        self.name = os.path.basename(path)
+        self.audio = audio
+        self.duration = len(audio) / sample_rate
+
+        frame = int(FRAME_SECONDS * sample_rate)
+        frames = audio[: len(audio) // frame * frame].reshape(-1, frame)
+        rms = np.sqrt(np.mean(np.square(frames), axis=1))
+        speech = np.flatnonzero(rms > max(0.01, 0.1 * np.percentile(rms, 95)))
+        self.speech_start = speech[0] * FRAME_SECONDS if len(speech) else 0.0
+        self.speech_end = (speech[-1] + 1) * FRAME_SECONDS if len(speech) else self.duration
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+
+    def rank(p):
+        return samples[min(len(samples) - 1, max(0, math.ceil(p / 100 * len(samples)) - 1))]
+
+    return {"count": len(samples), "p50": rank(50), "p95": rank(95), "p99": rank(99), "max": samples[-1]}
+
+
+class LoadTest:
+    def __init__(self, args, clips):
+        self.args = args
+        self.clips = clips
+        self.active = 0
+        self.started = 0
+        self.completed = 0
+        self.errors = collections.Counter()
+        # metric -> [(value, concurrency when measured)]
+        self.samples = {name: [] for name in METRICS}
+        self.server_load = []
+        self.test_started = None
+        self.stop_at = None
+
+    def record(self, metric, value):
+        self.samples[metric].append((value, self.active))
+
+    def schedule(self, index):
+        # (clip, offset into the stream) for every clip this stream plays,
+        # starting at a different clip per stream
+        schedule, offset, i = [], 0.0, index
+        while offset < self.args.hold + self.args.ramp:
+            clip = self.clips[i % len(self.clips)]
+            schedule.append((clip, offset))
+            offset += clip.duration + self.args.gap
+            i += 1
+        return schedule
+
+    def stream_audio(self, index):
+        rate = self.args.sample_rate
+        gap = np.zeros(int(self.args.gap * rate), dtype=np.float32)
+        schedule = self.schedule(index)
+        parts = []
+        for clip, _ in schedule:
+            parts.extend((clip.audio, gap))
+        return np.concatenate(parts), schedule
+
+    def encode(self, chunk):
+        if self.args.encoding == "s16":
+            return (np.clip(chunk, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+        return chunk.astype("<f4").tobytes()
+
+    async def run_stream(self, index, stub):
+        args = self.args
+        audio, schedule = self.stream_audio(index)
+        chunk_samples = int(args.chunk_ms * args.sample_rate / 1000)
+        config = transcription_pb2.StreamConfig(
+            sample_rate=args.sample_rate, encoding=ENCODINGS[args.encoding], language=args.language
+        )
+        # Speech boundaries in stream seconds, waiting for their first partial/final
+        onsets = collections.deque(offset + clip.speech_start for clip, offset in schedule)
+        ends = collections.deque(offset + clip.speech_end for clip, offset in schedule)
+        state = {"t0": None, "sent": 0.0}
+
+        async def requests():
+            yield transcription_pb2.StreamRequest(config=config)
+            t0 = state["t0"] = time.perf_counter()
+            for start in range(0, len(audio), chunk_samples):
+                chunk = audio[start:start + chunk_samples]
+                send_at = t0 + (start + len(chunk)) / args.sample_rate
+                if send_at > self.stop_at:
+                    break
+                await asyncio.sleep(max(0.0, send_at - time.perf_counter()))
+                yield transcription_pb2.StreamRequest(audio=transcription_pb2.AudioChunk(data=self.encode(chunk)))
+                state["sent"] = (start + len(chunk)) / args.sample_rate
+
+        self.active += 1
+        self.started += 1
+        try:
+            async for result in stub.StreamTranscription(requests()):
+                if state["t0"] is None or not result.text:
+                    continue
+                now = time.perf_counter() - state["t0"]
+                audio_end = result.timing.audio_end
+                self.record("lag", now - audio_end)
+                # A speech boundary counts once a result has heard the audio past it
+                heard = min(audio_end, state["sent"])
+                pending = ends if result.is_final else onsets
+                metric = "final_after_speech_end" if result.is_final else "first_partial"
+                while pending and pending[0] <= heard:
+                    self.record(metric, now - pending.popleft())
+                if result.is_final:
+                    # Utterances finalized without a partial have nothing left to time
+                    while onsets and onsets[0] <= heard:
+                        onsets.popleft()
+            self.completed += 1
+        except grpc.RpcError as e:
+            self.errors[e.code().name] += 1
+        finally:
+            self.active -= 1
+
+    async def poll_load(self, stub):
+        while True:
+            try:
+                report = await stub.GetLoad(transcription_pb2.LoadRequest(), timeout=2.0)
+                self.server_load.append({
+                    "t": round(time.perf_counter() - self.test_started, 1),
+                    "client_streams": self.active,
+                    "active_streams": report.active_streams,
+                    "queue_depth": report.queue_depth,
+                    "rtf": round(report.rtf, 3),
+                    "quality_level": report.quality_level,
+                    "memory_bytes": report.memory_bytes,
+                })
+            except grpc.RpcError:
+                pass
+            await asyncio.sleep(1.0)
+
+    async def run(self):
+        args = self.args
+        channels = [grpc.aio.insecure_channel(args.target) for _ in range(args.channels)]
+        stubs = [transcription_pb2_grpc.WhisperTranscriberStub(c) for c in channels]
+        await asyncio.gather(*(c.channel_ready() for c in channels))
+        self.test_started = time.perf_counter()
+        self.stop_at = self.test_started + args.ramp + args.hold
+        poller = asyncio.create_task(self.poll_load(stubs[0]))
+        streams = []
+        try:
+            for i in range(args.streams):
+                start_at = self.test_started + (args.ramp * i / max(1, args.streams - 1) if args.streams > 1 else 0)
+                await asyncio.sleep(max(0.0, start_at - time.perf_counter()))
+                streams.append(asyncio.create_task(self.run_stream(i, stubs[i % len(stubs)])))
+                print(f"\r{i + 1}/{args.streams} streams started", end="", file=sys.stderr, flush=True)
+            await asyncio.gather(*streams)
+        finally:
+            print(file=sys.stderr)
+            poller.cancel()
+            for c in channels:
+                await c.close()
+
+    def report(self):
+        bucket = self.args.bucket or max(1, self.args.streams // 8)
+        by_concurrency = []
+        levels = sorted({(n - 1) // bucket for values in self.samples.values() for _, n in values if n})
+        for level in levels:
+            low, high = level * bucket + 1, (level + 1) * bucket
+            by_concurrency.append({
+                "streams": [low, min(high, self.args.streams)],
+                **{
+                    name: percentiles([v for v, n in values if low <= n <= high])
+                    for name, values in self.samples.items()
+                },
+            })
+        return {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "build": git_revision(),
+            "config": vars(self.args),
+            "streams": {"started": self.started, "completed": self.completed, "errors": dict(self.errors)},
+            "metrics": {name: percentiles([v for v, _ in values]) for name, values in self.samples.items()},
+            "by_concurrency": by_concurrency,
+            "server_load": self.server_load,
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def fmt(value):
+    return f"{value:7.2f}" if value is not None else "      -"
+
+
+def print_report(report, baseline=None):
+    streams = report["streams"]
+    print(f"build {report['build']}: {streams['started']} streams started, {streams['completed']} completed"
+          + (f", errors {streams['errors']}" if streams["errors"] else ""))
+    print(f"\n{'':<28}{'count':>7}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}")
+    for name, label in METRICS.items():
+        m = report["metrics"][name]
+        print(f"{label:<28}{m['count']:>7}" + "".join(f" {fmt(m.get(k))}" for k in ("p50", "p95", "p99", "max")))
+        if baseline and baseline["metrics"].get(name, {}).get("count"):
+            b = baseline["metrics"][name]
+            deltas = "".join(
+                f" {(m[k] - b[k]) / b[k] * 100:+6.0f}%" if m.get(k) is not None and b.get(k) else "       -"
+                for k in ("p50", "p95", "p99", "max")
+            )
+            print(f"{'  vs ' + str(baseline['build']):<28}{b['count']:>7}{deltas}")
+
+    print(f"\n{'streams':<10}" + "".join(f"{name:>24}" for name in METRICS))
+    print(f"{'':<10}" + "p50/p95/p99 (s)".rjust(24) * len(METRICS))
+    for row in report["by_concurrency"]:
+        low, high = row["streams"]
+        cells = []
+        for name in METRICS:
+            m = row[name]
+            cells.append(f"{m['p50']:.2f}/{m['p95']:.2f}/{m['p99']:.2f}" if m["count"] else "-")
+        label = f"{low}-{high}" if high > low else str(low)
+        print(f"{label:<10}" + "".join(f"{c:>24}" for c in cells))
+
+    if report["server_load"]:
+        worst = max(report["server_load"], key=lambda r: (r["queue_depth"], r["rtf"]))
+        lowest = min(r["quality_level"] for r in report["server_load"])
+        memory = max(report["server_load"], key=lambda r: r.get("memory_bytes", 0))
+        print(f"\nserver: peak queue depth {worst['queue_depth']} with rtf {worst['rtf']} at "
+              f"{worst['client_streams']} streams, lowest quality level {lowest}, "
+              f"peak stream memory {memory.get('memory_bytes', 0) / 2**20:.1f} MiB at {memory['client_streams']} streams")
+
+
+async def main(args):
+    paths = sorted(p for pattern in args.audio for p in glob.glob(pattern))
+    if not paths:
+        raise SystemExit(f"No WAV files match {args.audio}")
+    clips = [Clip(path, args.sample_rate) for path in paths]
+    test = LoadTest(args, clips)
+    await test.run()
+    report = test.report()
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", default="localhost:50051")
+    parser.add_argument("--audio", nargs="+", default=[DEFAULT_AUDIO], help="WAV files or glob patterns to replay")
+    parser.add_argument("--streams", type=int, default=8, help="Concurrent streams at the end of the ramp")
+    parser.add_argument("--ramp", type=float, default=60.0, help="Seconds over which streams are started")
+    parser.add_argument("--hold", type=float, default=30.0, help="Seconds to keep all streams running after the ramp")
+    parser.add_argument("--gap", type=float, default=2.0, help="Silence between replayed files (s)")
+    parser.add_argument("--chunk-ms", type=float, default=100.0, help="Audio per StreamRequest")
+    parser.add_argument("--sample-rate", type=int, default=16000, help="Rate the audio is sent at")
+    parser.add_argument("--encoding", choices=sorted(ENCODINGS), default="f32")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--channels", type=int, default=4, help="gRPC channels the streams are spread over")
+    parser.add_argument("--bucket", type=int, default=0, help="Streams per concurrency row (default: streams/8)")
+    parser.add_argument("--report", help="Write the full report as JSON here")
+    parser.add_argument("--compare", help="Earlier --report to compare against")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,124 @@
+"""Bridge result path under slow WebSocket consumers.
+
+Feeds bursts of partial/final results into many sockets whose send() is slow,
+comparing an unbounded FIFO (every result queued) with the bridge's
+ResultSender (superseded partials dropped, finals kept up to --max-finals,
+then the socket is closed). Reports producer throughput, peak queue length,
+traced memory and closed sockets.
+
+    PYTHONPATH=. python benchmarks/result_sender.py --sockets 200 --results 2000
+"""
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from protos import transcription_pb2
+from results import MAX_QUEUED_FINALS, ResultSender, encode_result
+
+
+class SlowWebSocket:
+    def __init__(self, delay):
+        self.delay = delay
+        self.received = 0
+        self.finals = 0
+        self.close_code = None
+
+    async def send_bytes(self, data):
+        await asyncio.sleep(self.delay)
+        self.received += 1
+        self.finals += data[1] & 0x01
+
+    async def close(self, code=1000, reason=None):
+        self.close_code = code
+
+
+class UnboundedSender:
+    # Baseline: every result queued and sent in order
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self._queue = collections.deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.seq = 0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, result):
+        self.seq += 1
+        self._queue.append(encode_result(self.seq, result))
+        self._ready.set()
+
+    def close(self):
+        self._closed = True
+        self._ready.set()
+
+    async def run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self._queue:
+                await self.websocket.send_bytes(self._queue.popleft())
+            if self._closed:
+                return
+
+
+def make_results(n, final_every):
+    text = "the quick brown fox jumps over the lazy dog " * 3
+    return [
+        transcription_pb2.TranscriptionResult(text=text, is_final=(i % final_every == final_every - 1), start_time=i * 0.1)
+        for i in range(n)
+    ]
+
+
+async def run(kind, args, results):
+    sockets = [SlowWebSocket(args.send_delay) for _ in range(args.sockets)]
+    senders = [(ResultSender(ws, binary=True, max_finals=args.max_finals) if kind == "ResultSender" else UnboundedSender(ws)) for ws in sockets]
+    tasks = [asyncio.create_task(sender.run()) for sender in senders]
+
+    tracemalloc.start()
+    peak_queue = 0
+    started = time.perf_counter()
+    for i, result in enumerate(results):
+        for sender in senders:
+            sender.put(result)
+        if i % 50 == 0:
+            peak_queue = max(peak_queue, max(len(s) for s in senders))
+            await asyncio.sleep(0)  # Let senders make progress, as the gRPC loop would
+    produce_seconds = time.perf_counter() - started
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for sender in senders:
+        sender.close()
+    await asyncio.gather(*tasks)
+
+    finals_expected = sum(r.is_final for r in results)
+    finals_delivered = min(ws.finals for ws in sockets)
+    delivered = sum(ws.received for ws in sockets) / len(sockets)
+    closed = sum(ws.close_code is not None for ws in sockets)
+    print(f"{kind:<16} put {len(results) * len(sockets) / produce_seconds:>10,.0f} msg/s   "
+          f"peak queue {peak_queue:>5}   peak mem/socket {peak_memory / len(sockets) / 1024:7.1f} KiB   "
+          f"sent/socket {delivered:6.0f}   finals {finals_delivered}/{finals_expected}   closed {closed}")
+
+
+async def main(args):
+    results = make_results(args.results, args.final_every)
+    await run("unbounded FIFO", args, results)
+    await run("ResultSender", args, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sockets", type=int, default=200)
+    parser.add_argument("--results", type=int, default=2000)
+    parser.add_argument("--final-every", type=int, default=10)
+    parser.add_argument("--send-delay", type=float, default=0.005, help="Seconds per send on the slow consumer")
+    parser.add_argument("--max-finals", type=int, default=MAX_QUEUED_FINALS, help="ResultSender's finals limit")
+    asyncio.run(main(parser.parse_args()))
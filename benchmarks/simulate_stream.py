@@ -0,0 +1,381 @@
+"""Deterministic simulation of a live stream through StreamTranscription.
+
+Drives the real servicer (session handling, catch-up, quality ladder and the
+segmentation/finalization logic) with synthetic or recorded audio, as fast as
+the CPU allows. The Whisper model is replaced by a scripted stand-in that
+returns the script's words falling inside each decode window, and all server
+time is virtual: audio "arrives" at its real-time pace and every decode costs
+a configurable latency. Runs with the same inputs emit the same results, so
+the trace digest works as a regression check.
+
+Reports what was emitted (and how well the finals reproduce the script),
+caption latency in virtual time, and how many decode ticks per second the
+pure-Python logic sustains.
+
+    PYTHONPATH=. python benchmarks/simulate_stream.py --seconds 600
+    PYTHONPATH=. python benchmarks/simulate_stream.py --audio rec.flac --script rec.transcript.json \\
+        --decode-latency 0.3 --trace trace.jsonl
+"""
+import argparse
+import asyncio
+import difflib
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+# Keep side effects out of the way: recordings go to a scratch directory,
+# nothing is persisted or re-transcribed
+SCRATCH = tempfile.TemporaryDirectory(prefix="simulate-stream-")
+os.environ["RECORDINGS_DIR"] = SCRATCH.name
+os.environ["RECORDING_CODEC"] = "wav"
+os.environ["TRANSCRIPT_DB"] = ""
+os.environ["SECOND_PASS_MODEL"] = ""
+
+import inference
+import quality
+import sessions
+import transcriber
+from protos import transcription_pb2
+
+SAMPLE_RATE = 16000
+# Audible enough for the amplitude gate, well below clipping
+SPEECH_LEVEL = 0.1
+# Below the amplitude gate; also makes every chunk boundary unique (see Locator)
+DITHER_LEVEL = 1e-4
+LOCATOR_SAMPLES = 64
+
+WORDS = (
+    "the a and of to in is that it was for on are as with his they at be this from have or by one had not "
+    "but what all were when we there can an your which their said if do will each about how up out them "
+    "then she many some so these would other into has more her two like him see time could no make than "
+    "first been its who now people my made over did down only way find use may water long little very after "
+    "words called just where most know get through back much before go good new write our used me man too "
+    "any day same right look think also around another came come work three word must because does part"
+).split()
+
+
+class SimulatedClock:
+    # Stands in for the time module inside the server: monotonic and
+    # perf_counter are virtual seconds since the stream started
+    def __init__(self, epoch=1_700_000_000.0):
+        self.now = 0.0
+        self.epoch = epoch
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def time(self):
+        return self.epoch + self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class Word:
+    def __init__(self, word, start, end, probability=0.9):
+        self.word, self.start, self.end, self.probability = word, start, end, probability
+
+
+class Segment:
+    def __init__(self, words, with_words):
+        self.text = "".join(w.word for w in words)
+        self.start = words[0].start
+        self.end = words[-1].end
+        self.words = words if with_words else None
+        self.no_speech_prob = 0.05
+        self.avg_logprob = -0.2
+        self.tokens = []
+
+
+class Locator:
+    # The model only sees a window of samples. Every decode window ends on a
+    # chunk boundary, and dithered audio makes the samples just before each
+    # boundary unique, so they identify where the window sits in the stream.
+    def __init__(self, audio, chunk_samples):
+        self._ends = {}
+        for end in range(chunk_samples, len(audio) + chunk_samples, chunk_samples):
+            end = min(end, len(audio))
+            self._ends[audio[end - LOCATOR_SAMPLES:end].tobytes()] = end
+
+    def window_end(self, window):
+        return self._ends[window[-LOCATOR_SAMPLES:].tobytes()]
+
+
+class ScriptedModel:
+    # Stand-in for WhisperModel. A decode returns the script words that lie
+    # inside the window (minus an unstable tail, as Whisper tends to drop a
+    # word still being spoken), grouped into segments at sentence ends and
+    # pauses, and advances the virtual clock by the configured latency.
+    def __init__(self, script, locator, clock, args):
+        self.script = script
+        self.starts = np.array([w[1] for w in script])
+        self.locator = locator
+        self.clock = clock
+        self.latency = args.decode_latency
+        self.rtf = args.decode_rtf
+        self.alignment_cost = args.alignment_cost
+        self.tail = args.unstable_tail
+        self.decodes = 0
+        self.aligned = 0
+
+    def transcribe(self, audio, word_timestamps=False, **options):
+        self.decodes += 1
+        self.aligned += bool(word_timestamps)
+        segments, window_seconds = self._segments(audio, word_timestamps)
+        cost = self.latency + self.rtf * window_seconds
+        self.clock.advance(cost * (1.0 + self.alignment_cost if word_timestamps else 1.0))
+        return iter(segments), types.SimpleNamespace(language="en", duration=window_seconds)
+
+    def transcribe_lazily(self, audio, needs_alignment, **options):
+        # AligningWhisperModel.transcribe_lazily: the alignment pass only adds
+        # its own share of the decode cost
+        self.decodes += 1
+        segments, window_seconds = self._segments(audio, False)
+        cost = self.latency + self.rtf * window_seconds
+        aligned = needs_alignment(segments)
+        if aligned:
+            self.aligned += 1
+            segments, _ = self._segments(audio, True)
+            cost *= 1.0 + self.alignment_cost
+        self.clock.advance(cost)
+        return segments, aligned
+
+    def _segments(self, audio, with_words):
+        window_seconds = len(audio) / SAMPLE_RATE
+        end = self.locator.window_end(audio) / SAMPLE_RATE
+        start = end - window_seconds
+
+        segments, current = [], []
+        first = np.searchsorted(self.starts, start)
+        for text, word_start, word_end in self.script[first:]:
+            if word_end > end - self.tail:
+                break
+            word = Word(" " + text, word_start - start, word_end - start)
+            if current and word.start - current[-1].end > 1.0:
+                segments.append(Segment(current, with_words))
+                current = []
+            current.append(word)
+            if text.endswith((".", "?", "!")):
+                segments.append(Segment(current, with_words))
+                current = []
+        if current:
+            segments.append(Segment(current, with_words))
+        return segments, window_seconds
+
+
+def synthetic_script(seconds, wpm, seed):
+    # Sentences of 4-20 words with the odd comma, natural gaps between words,
+    # and pauses between sentences that now and then run long
+    rng = random.Random(seed)
+    word_seconds = 60.0 / wpm
+    script, t = [], 0.5
+    while t < seconds - 2.0:
+        n = rng.randint(4, 20)
+        for i in range(n):
+            duration = word_seconds * rng.uniform(0.55, 0.85)
+            text = rng.choice(WORDS)
+            if i == n - 1:
+                text += rng.choice(".....?!")
+            elif i > 2 and rng.random() < 0.08:
+                text += ","
+            if t + duration > seconds - 1.0:
+                break
+            script.append((text, round(t, 3), round(t + duration, 3)))
+            t += word_seconds + (0.25 if text.endswith(",") else 0.0)
+        t += rng.choice((0.4, 0.6, 0.8, 1.0, 1.5, 3.0))
+    return script
+
+
+def synthetic_audio(script, seconds, seed):
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+    for _, start, end in script:
+        a, b = int(start * SAMPLE_RATE), int(end * SAMPLE_RATE)
+        audio[a:b] = rng.standard_normal(b - a) * SPEECH_LEVEL
+    return audio
+
+
+def load_audio(path):
+    import av
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+    chunks = []
+    with av.open(path) as container:
+        for frame in container.decode(audio=0):
+            chunks.extend(f.to_ndarray().reshape(-1) for f in resampler.resample(frame))
+        chunks.extend(f.to_ndarray().reshape(-1) for f in resampler.resample(None))
+    return np.concatenate(chunks).astype(np.float32)
+
+
+def load_script(path):
+    # A sidecar transcript as written by the second pass (second_pass.py)
+    with open(path) as f:
+        transcript = json.load(f)
+    script = []
+    for segment in transcript["segments"]:
+        for w in segment["words"]:
+            if w["word"].strip():
+                script.append((w["word"].strip(), w["start"], w["end"]))
+    if not script:
+        raise SystemExit(f"{path} has no word timings")
+    return script
+
+
+def tokens(text):
+    return re.findall(r"[\w']+", text.lower())
+
+
+class SimulatedTranscriber(transcriber.WhisperTranscriber):
+    # Records every result with the virtual time it left the stream
+    def __init__(self, model, clock):
+        super().__init__(model=model, inference_workers=0)
+        self.clock = clock
+        self.trace = []
+
+    async def _traced(self, results):
+        async for result in results:
+            self.trace.append((self.clock.now, result))
+            yield result
+
+    def _transcribe_stream(self, session, settings, model):
+        return self._traced(super()._transcribe_stream(session, settings, model))
+
+
+class Context:
+    async def abort(self, code, details):
+        raise RuntimeError(f"Stream aborted: {code} {details}")
+
+
+async def simulate(servicer, clock, audio, args):
+    chunk_samples = int(args.chunk_ms * SAMPLE_RATE / 1000)
+    config = transcription_pb2.StreamConfig(sample_rate=SAMPLE_RATE, partials=not args.no_partials)
+    if args.tick_interval:
+        config.tick_interval = args.tick_interval
+    state = {}
+
+    async def requests():
+        yield transcription_pb2.StreamRequest(config=config)
+        while "session" not in state:
+            await asyncio.sleep(0)
+        session = state["session"]
+        for start in range(0, len(audio), chunk_samples):
+            chunk = audio[start:start + chunk_samples]
+            arrival = (start + len(chunk)) / SAMPLE_RATE
+            if arrival > clock.now:
+                # Nothing else has arrived yet: let the stream drain what it
+                # has (decodes advance the clock), then jump to the next chunk
+                while not session.input.empty():
+                    await asyncio.sleep(0)
+                clock.now = max(clock.now, arrival)
+            yield transcription_pb2.StreamRequest(audio=transcription_pb2.AudioChunk(data=chunk.tobytes()))
+
+    async for result in servicer.StreamTranscription(requests(), Context()):
+        if result.session_id:
+            state["session"] = servicer.sessions.get(result.session_id)
+
+
+def trace_record(emitted_at, result):
+    return {
+        "t": round(emitted_at, 4),
+        "final": result.is_final,
+        "start": round(result.start_time, 3),
+        "text": result.text,
+        "audio_end": round(result.timing.audio_end, 3),
+        "decode": round(result.timing.decode_seconds, 4),
+    }
+
+
+def report(servicer, model, script, audio, wall_seconds, args):
+    records = [trace_record(t, r) for t, r in servicer.trace]
+    finals = [r for r in records if r["final"]]
+    if args.trace:
+        with open(args.trace, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+    digest = hashlib.sha256("\n".join(json.dumps(r, sort_keys=True) for r in records).encode()).hexdigest()
+
+    audio_seconds = len(audio) / SAMPLE_RATE
+    print(f"audio {audio_seconds:.1f}s, {len(script)} scripted words, virtual end {servicer.clock.now:.1f}s")
+    print(f"decodes {model.decodes} ({model.aligned} with word timings), "
+          f"results {len(records)} ({len(finals)} finals, {len(records) - len(finals)} partials)")
+
+    expected = [t for text, _, _ in script for t in tokens(text)]
+    got = [t for r in finals for t in tokens(r["text"])]
+    dropped = duplicated = substituted = 0
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, expected, got, autojunk=False).get_opcodes():
+        if op == "delete":
+            dropped += i2 - i1
+        elif op == "insert":
+            duplicated += j2 - j1
+        elif op == "replace":
+            substituted += max(i2 - i1, j2 - j1)
+    print(f"finals vs script: {len(got)}/{len(expected)} words, {dropped} dropped, "
+          f"{duplicated} extra, {substituted} substituted")
+
+    if finals:
+        # Caption latency: emitted (virtual) minus when the final's audio ended
+        latencies = sorted(r["t"] - r["audio_end"] for r in finals)
+        lengths = [len(r["text"].split()) for r in finals]
+        print(f"final latency p50 {latencies[len(latencies) // 2]:.2f}s p95 {latencies[int(len(latencies) * 0.95)]:.2f}s, "
+              f"words per final mean {statistics.mean(lengths):.1f} max {max(lengths)}")
+    print(f"wall {wall_seconds:.2f}s: {model.decodes / wall_seconds:,.0f} ticks/s, "
+          f"{audio_seconds / wall_seconds:,.0f}x real time")
+    print(f"trace sha256 {digest}")
+
+
+async def main(args):
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if args.audio:
+        audio = load_audio(args.audio)
+        script = load_script(args.script or os.path.splitext(args.audio)[0] + ".transcript.json")
+    else:
+        script = synthetic_script(args.seconds, args.wpm, args.seed)
+        audio = synthetic_audio(script, args.seconds, args.seed)
+    audio = audio + (np.random.default_rng(args.seed).standard_normal(len(audio)) * DITHER_LEVEL).astype(np.float32)
+
+    clock = SimulatedClock()
+    for module in (transcriber, inference, sessions, quality):
+        module.time = clock
+    # Nothing here drops a stream, so a half-close needs no settling time
+    transcriber.HALF_CLOSE_SETTLE_SECONDS = 0
+    chunk_samples = int(args.chunk_ms * SAMPLE_RATE / 1000)
+    model = ScriptedModel(script, Locator(audio, chunk_samples), clock, args)
+    servicer = SimulatedTranscriber(model, clock)
+
+    started = time.perf_counter()
+    await simulate(servicer, clock, audio, args)
+    wall_seconds = time.perf_counter() - started
+    report(servicer, model, script, audio, wall_seconds, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--audio", help="Recorded audio to stream instead of synthetic speech")
+    parser.add_argument("--script", help="Word-timed transcript for --audio (default: its .transcript.json sidecar)")
+    parser.add_argument("--seconds", type=float, default=300.0, help="Length of synthetic audio")
+    parser.add_argument("--wpm", type=float, default=150.0, help="Synthetic speaking rate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-ms", type=float, default=100.0, help="Audio per StreamRequest")
+    parser.add_argument("--tick-interval", type=float, default=0.0, help="Seconds between decodes (server default if 0)")
+    parser.add_argument("--no-partials", action="store_true")
+    parser.add_argument("--decode-latency", type=float, default=0.05, help="Virtual seconds per decode")
+    parser.add_argument("--decode-rtf", type=float, default=0.01, help="Extra virtual seconds per second of window")
+    parser.add_argument("--alignment-cost", type=float, default=0.05, help="Alignment cost as a fraction of the decode it aligns")
+    parser.add_argument("--unstable-tail", type=float, default=0.3, help="Words ending this close to the window edge are withheld")
+    parser.add_argument("--trace", help="Write every result as JSON lines here")
+    parser.add_argument("--verbose", action="store_true", help="Show the server's own logging")
+    asyncio.run(main(parser.parse_args()))
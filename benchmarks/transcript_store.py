@@ -0,0 +1,151 @@
+"""Transcript store write throughput under many concurrent streams.
+
+Simulates N live streams each finalizing sentences (with word timings) at
+speech-like intervals, compressed in time, and writes them through either a
+naive store (one transaction per final, on a worker thread) or the server's
+TranscriptStore (group commit from an async queue, lingering --linger-ms for a
+fuller batch). Reports committed rows per second, transactions, writer thread
+busy time, time to drain after the last final, and the worst event-loop stall
+seen by a 5 ms ticker.
+
+    PYTHONPATH=. python benchmarks/transcript_store.py --streams 300 --finals 40
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+import transcript_store
+from transcript_store import TranscriptStore, connect
+
+
+class PerFinalStore:
+    # Baseline: each final is its own transaction, awaited by the stream
+    def __init__(self, path):
+        self.path = path
+        self.transactions = 0
+
+    async def start(self):
+        self._conn = await asyncio.to_thread(connect, self.path)
+        self._lock = asyncio.Lock()
+
+    def _write(self, op):
+        with self._conn:
+            if op[0] == "session":
+                self._conn.execute("INSERT INTO sessions (id, started_at) VALUES (?, ?)", op[1])
+            else:
+                cursor = self._conn.execute(
+                    "INSERT INTO segments (session_id, start_time, end_time, text, kind) VALUES (?, ?, ?, ?, ?)", op[1]
+                )
+                self._conn.executemany(
+                    "INSERT INTO words (segment_id, session_id, start_time, end_time, word, probability) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(cursor.lastrowid, op[1][0], *w) for w in op[2]],
+                )
+        self.transactions += 1
+
+    async def session_started(self, session_id):
+        async with self._lock:  # One connection, one writer at a time
+            await asyncio.to_thread(self._write, ("session", (session_id, time.time())))
+
+    async def add_segment(self, session_id, start, end, text, kind, words):
+        async with self._lock:
+            await asyncio.to_thread(self._write, ("segment", (session_id, start, end, text, kind), words))
+
+    async def close(self):
+        await asyncio.to_thread(self._conn.close)
+
+
+def sentence(t, n_words):
+    words = [(t + i * 0.3, t + i * 0.3 + 0.25, f"word{i}", 0.9) for i in range(n_words)]
+    return " ".join(w[2] for w in words), words
+
+
+async def stream(store, session_id, args, batched):
+    rng = random.Random(session_id)
+    if batched:
+        store.session_started(session_id, "tiny.en", "en")
+    else:
+        await store.session_started(session_id)
+    t = 0.0
+    for _ in range(args.finals):
+        # A final every ~3 s of speech, played back args.speedup times faster
+        await asyncio.sleep(rng.uniform(2.0, 4.0) / args.speedup)
+        text, words = sentence(t, args.words)
+        if batched:
+            store.add_segment(session_id, t, words[-1][1], text, "word", words)
+        else:
+            await store.add_segment(session_id, t, words[-1][1], text, "word", words)
+        t = words[-1][1] + 0.5
+
+
+async def ticker(stalls, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.005)
+        stalls.append(time.perf_counter() - started - 0.005)
+
+
+async def run(kind, args, directory):
+    path = os.path.join(directory, f"{kind.split()[0]}.db")
+    batched = kind.startswith("TranscriptStore")
+    store = TranscriptStore(path) if batched else PerFinalStore(path)
+    await store.start()
+    # Time the writer thread spends in transactions
+    busy = [0.0]
+    write = store._write
+
+    def timed_write(*args):
+        started = time.perf_counter()
+        try:
+            return write(*args)
+        finally:
+            busy[0] += time.perf_counter() - started
+    store._write = timed_write
+
+    stalls, stop = [], asyncio.Event()
+    tick = asyncio.create_task(ticker(stalls, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(stream(store, f"s{i:04d}", args, batched) for i in range(args.streams)))
+    produced = time.perf_counter() - started
+    await store.close()
+    drained = time.perf_counter() - started
+    stop.set()
+    await tick
+
+    conn = connect(path)
+    segments = conn.execute("SELECT count(*) FROM segments").fetchone()[0]
+    rows = segments + conn.execute("SELECT count(*) FROM words").fetchone()[0] + args.streams
+    transactions = store.transactions if not batched else None
+    conn.close()
+    stalls.sort()
+    print(f"{kind:<16} {rows / drained:>9,.0f} rows/s   segments {segments:>6}   "
+          f"transactions {transactions if transactions is not None else 'see below':>9}   writer busy {busy[0]:5.2f}s   "
+          f"streams done {produced:5.1f}s, drained {drained - produced:5.2f}s later   "
+          f"loop stall p99 {stalls[int(len(stalls) * 0.99)] * 1000:5.1f} ms max {stalls[-1] * 1000:5.1f} ms")
+
+
+async def main(args):
+    import metrics
+    transcript_store.LINGER_SECONDS = args.linger_ms / 1000
+    with tempfile.TemporaryDirectory() as directory:
+        await run("per-final commit", args, directory)
+        before = metrics.TRANSCRIPT_STORE_BATCHES._value.get()
+        await run("TranscriptStore", args, directory)
+        batches = metrics.TRANSCRIPT_STORE_BATCHES._value.get() - before
+        print(f"TranscriptStore committed {args.streams * (args.finals + 1):,} operations in {batches:.0f} transactions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=300)
+    parser.add_argument("--finals", type=int, default=40, help="Finals per stream")
+    parser.add_argument("--words", type=int, default=12, help="Words per final")
+    parser.add_argument("--speedup", type=float, default=20.0, help="Simulated speech runs this many times real time")
+    parser.add_argument("--linger-ms", type=float, default=transcript_store.LINGER_SECONDS * 1000,
+                        help="TranscriptStore's wait for a fuller batch (0 commits whatever is queued)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,92 @@
+import asyncio
+import itertools
+import logging
+import os
+
+import grpc
+
+from protos import transcription_pb2
+from channels import ChannelPool
+
+LOAD_POLL_INTERVAL = float(os.environ.get("LOAD_POLL_INTERVAL", "0.5"))
+LOAD_POLL_TIMEOUT = 0.5
+
+
+class Backend:
+    def __init__(self, target, pool_size=None):
+        self.target = target
+        self.pool = ChannelPool(target) if pool_size is None else ChannelPool(target, size=pool_size)
+        self.load = None  # Last LoadReport
+        self.healthy = False
+        self.assigned_since_poll = 0  # Sessions sent here that the last report can't include yet
+
+    def score(self):
+        # Lower is better: open streams plus queued decodes, weighted towards queueing
+        return self.load.active_streams + self.assigned_since_poll + 2 * self.load.queue_depth + self.load.rtf
+
+
+class LoadBalancer:
+    # Sends each new session to the least-loaded healthy server, as reported
+    # by polling GetLoad. Falls back to round-robin when no load is known.
+    def __init__(self, targets, pool_size=None, poll_interval=LOAD_POLL_INTERVAL):
+        self.backends = [Backend(target, pool_size) for target in targets]
+        self.poll_interval = poll_interval
+        self._round_robin = itertools.cycle(self.backends)
+        self._poller = None
+
+    async def start(self):
+        for backend in self.backends:
+            await backend.pool.start()
+        await self.poll_once()
+        self._poller = asyncio.create_task(self._poll())
+
+    async def close(self):
+        if self._poller:
+            self._poller.cancel()
+        for backend in self.backends:
+            await backend.pool.close()
+
+    async def _poll_backend(self, backend):
+        try:
+            load = await backend.pool.stub().GetLoad(transcription_pb2.LoadRequest(), timeout=LOAD_POLL_TIMEOUT)
+            if load.draining and not (backend.load is not None and backend.load.draining):
+                logging.info(f"Backend {backend.target} is draining")
+            backend.load = load
+            backend.assigned_since_poll = 0
+            if not backend.healthy:
+                logging.info(f"Backend {backend.target} is healthy")
+            backend.healthy = True
+        except grpc.RpcError as e:
+            if backend.healthy:
+                logging.warning(f"Backend {backend.target} unhealthy: {e.code()}")
+            backend.healthy = False
+
+    async def poll_once(self):
+        await asyncio.gather(*(self._poll_backend(backend) for backend in self.backends))
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self.poll_once()
+
+    def mark_failed(self, backend):
+        # Called when a session hits UNAVAILABLE; don't wait for the next poll
+        backend.healthy = False
+
+    def pick(self):
+        # A draining server still answers polls but takes no new sessions
+        healthy = [b for b in self.backends if b.healthy and b.load is not None and not b.load.draining]
+        if healthy:
+            # Scan in round-robin order so ties rotate between servers
+            start = next(self._round_robin)
+            offset = self.backends.index(start)
+            ordered = sorted(healthy, key=lambda b: (b.score(), (self.backends.index(b) - offset) % len(self.backends)))
+            backend = ordered[0]
+        else:
+            backend = next(self._round_robin)
+        backend.assigned_since_poll += 1
+        return backend
+
+    @property
+    def has_alternatives(self):
+        return len(self.backends) > 1
@@ -0,0 +1,52 @@
+import asyncio
+import itertools
+import logging
+import os
+
+import grpc
+
+from protos import transcription_pb2_grpc
+
+CHANNEL_POOL_SIZE = int(os.environ.get("GRPC_CHANNEL_POOL_SIZE", "2"))
+
+CHANNEL_OPTIONS = [
+    # Detect dead connections (e.g. a restarted server) between sessions
+    ("grpc.keepalive_time_ms", 20000),
+    ("grpc.keepalive_timeout_ms", 5000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    # Reconnect quickly once the server is back
+    ("grpc.initial_reconnect_backoff_ms", 250),
+    ("grpc.max_reconnect_backoff_ms", 5000),
+    # Each pooled channel gets its own HTTP/2 connection instead of sharing
+    # the process-wide subchannel for the same target
+    ("grpc.use_local_subchannel_pool", 1),
+]
+
+
+class ChannelPool:
+    # Long-lived channels to one server, shared by every WebSocket session.
+    # Sessions are spread round-robin and multiplexed as HTTP/2 streams.
+    def __init__(self, target, size=CHANNEL_POOL_SIZE):
+        self.target = target
+        self.size = size
+        self._channels = []
+        self._stubs = []
+        self._next = None
+
+    async def start(self):
+        self._channels = [grpc.aio.insecure_channel(self.target, options=CHANNEL_OPTIONS) for _ in range(self.size)]
+        self._stubs = [transcription_pb2_grpc.WhisperTranscriberStub(channel) for channel in self._channels]
+        self._next = itertools.cycle(range(self.size))
+        # Start connecting now so the first session doesn't pay the handshake
+        for channel in self._channels:
+            channel.get_state(try_to_connect=True)
+        logging.info(f"Opened {self.size} gRPC channel(s) to {self.target}")
+
+    async def close(self):
+        await asyncio.gather(*(channel.close() for channel in self._channels))
+        self._channels = []
+        self._stubs = []
+
+    def stub(self):
+        return self._stubs[next(self._next)]
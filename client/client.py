@@ -1,78 +1,361 @@
+import asyncio
+import functools
+import json
+import math
 import os
 import logging
+import time
+from contextlib import asynccontextmanager
 from typing import Annotated
 
 import grpc
-from fastapi import FastAPI, Form, Request, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Form, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 
-from protos import transcription_pb2, transcription_pb2_grpc
+from protos import transcription_pb2
+from coalescer import coalesced_frames
+from balancer import LoadBalancer
+from results import ResultSender
+from peaks import PeaksFile
 
-app = FastAPI()
+# Configure gRPC connection(s): SERVER_ADDRESSES is a comma-separated fleet
+targets = os.environ.get("SERVER_ADDRESSES", os.environ.get("SERVER_ADDRESS", "server:50051")).split(",")
+balancer = LoadBalancer([t.strip() for t in targets if t.strip()])
+
+# Live session id -> backend hosting it, for routing subscribers
+session_backends = {}
+# Resume token -> (backend, detached at) for sessions whose browser dropped;
+# the server keeps them for SESSION_RESUME_GRACE_SECONDS
+RESUME_GRACE_SECONDS = float(os.environ.get("SESSION_RESUME_GRACE_SECONDS", "30"))
+resume_backends = {}
+
+# The servers' recordings directory, mounted read-only, so search hits can be played back
+RECORDINGS_DIR = os.environ.get("RECORDINGS_DIR", "/app/recordings")
+# Recordings and their peaks never change once written (retention only deletes them)
+IMMUTABLE = {"Cache-Control": "public, max-age=86400, immutable"}
+# One per recording codec the servers write (recordings.RECORDING_EXTENSIONS)
+AUDIO_MEDIA_TYPES = {".flac": "audio/flac", ".opus": "audio/ogg", ".wav": "audio/wav"}
+SEARCH_TIMEOUT_SECONDS = 5.0
+# How long a drained session's last results may take to reach the browser
+DRAIN_FLUSH_SECONDS = 5.0
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await balancer.start()
+    yield
+    await balancer.close()
+
+app = FastAPI(lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="client/static"), name="static")
 templates = Jinja2Templates(directory="client/templates")
 
 
-# Configure gRPC connection
-target = os.environ.get("SERVER_ADDRESS", "server:50051")
+ENCODINGS = {
+    "f32le": (transcription_pb2.AUDIO_ENCODING_F32LE, 4),
+    "s16le": (transcription_pb2.AUDIO_ENCODING_S16LE, 2),
+}
+
+# Anything above this is a malformed handshake, not a real input rate
+MAX_SAMPLE_RATE = 384000
+
+MODEL_TIERS = {
+    "fast": transcription_pb2.MODEL_TIER_FAST,
+    "balanced": transcription_pb2.MODEL_TIER_BALANCED,
+    "accurate": transcription_pb2.MODEL_TIER_ACCURATE,
+}
+
+# Closes a socket whose handshake can't start a stream; the browser gives up
+# rather than reconnecting with the same handshake
+CLOSE_BAD_HANDSHAKE = 1007
+
+class HandshakeError(ValueError):
+    pass
+
+def _number(init_data, key, default):
+    value = init_data.get(key, default)
+    # bool is an int to Python, but never a sensible setting here
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+        raise HandshakeError(f"{key} must be a non-negative number")
+    return value
+
+def parse_handshake(text):
+    # Validates the browser's first message, a JSON object with sample_rate
+    # and optional stream settings. Returns (init_data, StreamConfig); raises
+    # HandshakeError before anything is sent upstream.
+    try:
+        init_data = json.loads(text)
+    except ValueError:
+        raise HandshakeError("handshake is not JSON")
+    if not isinstance(init_data, dict):
+        raise HandshakeError("handshake must be a JSON object")
+    sample_rate = _number(init_data, "sample_rate", 16000)
+    if sample_rate != int(sample_rate) or not 0 < sample_rate <= MAX_SAMPLE_RATE:
+        raise HandshakeError(f"sample_rate must be a whole number of Hz up to {MAX_SAMPLE_RATE}")
+    _number(init_data, "tick_interval", 0)
+    _number(init_data, "window_duration", 0)
+    for key in ("language", "resume_token"):
+        if not isinstance(init_data.get(key, ""), str):
+            raise HandshakeError(f"{key} must be a string")
+    try:
+        return init_data, build_stream_config(init_data, int(sample_rate))
+    except (TypeError, ValueError) as e:
+        raise HandshakeError(f"invalid stream settings: {e}")
+
+def build_stream_config(init_data, sample_rate):
+    # Map the browser's JSON handshake onto the per-stream StreamConfig
+    encoding, _ = ENCODINGS.get(init_data.get("encoding"), ENCODINGS["f32le"])
+    config = transcription_pb2.StreamConfig(
+        encoding=encoding,
+        model_tier=MODEL_TIERS.get(init_data.get("model_tier"), transcription_pb2.MODEL_TIER_DEFAULT),
+        language=init_data.get("language", ""),
+        tick_interval=float(init_data.get("tick_interval", 0)),
+        window_duration=float(init_data.get("window_duration", 0)),
+        sample_rate=sample_rate,
+        resume_token=init_data.get("resume_token", ""),
+    )
+    if "partials" in init_data:
+        config.partials = bool(init_data["partials"])
+    return config
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse("recorder.html", {"request": request})
 
+def resume_backend(token):
+    # Backend still holding a dropped session, if this bridge routed it
+    now = time.monotonic()
+    for stale in [t for t, (_, dropped) in resume_backends.items() if now - dropped > RESUME_GRACE_SECONDS]:
+        del resume_backends[stale]
+    entry = resume_backends.pop(token, None) if token else None
+    return entry[0] if entry else None
+
 @app.websocket("/ws/audio")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+
+    # First message should be a JSON with sample_rate and optional stream settings
+    try:
+        init_data, config = parse_handshake(await websocket.receive_text())
+    except WebSocketDisconnect:
+        return
+    except HandshakeError as e:
+        logging.warning(f"Rejected WebSocket handshake: {e}")
+        await websocket.close(code=CLOSE_BAD_HANDSHAKE, reason=f"Invalid handshake: {e}"[:123])
+        return
+    sample_rate = config.sample_rate
+    _, bytes_per_sample = ENCODINGS.get(init_data.get("encoding"), ENCODINGS["f32le"])
+    logging.info(f"WebSocket input sample rate: {sample_rate}, encoding: {init_data.get('encoding', 'f32le')}")
+
+    # A resumed session goes back to the server holding it; new ones to the
+    # least-loaded server. Sessions share its channel pool (one HTTP/2 stream each)
+    backend = resume_backend(init_data.get("resume_token")) or balancer.pick()
+    stub = backend.pool.stub()
+
+    # Results go through a bounded queue so a slow browser never stalls the gRPC stream
+    sender = ResultSender(websocket, binary=init_data.get("protocol") == "binary")
+    sender_task = asyncio.create_task(sender.run())
     
-    async with grpc.aio.insecure_channel(target) as channel:
-        stub = transcription_pb2_grpc.WhisperTranscriberStub(channel)
-        
-        async def request_generator():
-            try:
-                # First message should be a JSON with sample_rate
-                msg = await websocket.receive_text()
-                import json
-                try:
-                    init_data = json.loads(msg)
-                    sample_rate = init_data.get("sample_rate", 16000)
-                except:
-                    sample_rate = 16000
-                
-                logging.info(f"WebSocket input sample rate: {sample_rate}")
-                
-                while True:
-                    data = await websocket.receive_bytes()
-                    yield transcription_pb2.AudioChunk(data=data, sample_rate=int(sample_rate))
-            except WebSocketDisconnect:
-                pass
-            except Exception as e:
-                logging.error(f"WebSocket error: {e}")
+    # Set when the browser drops without closing; the call is then cancelled
+    # rather than half-closed, which leaves the session resumable on the server
+    browser_dropped = False
 
+    async def request_generator():
+        nonlocal browser_dropped
         try:
-            responses = stub.StreamTranscription(request_generator())
-            async for response in responses:
-                await websocket.send_json({
-                    "text": response.text,
-                    "is_final": response.is_final,
-                    "start_time": response.start_time
-                })
-        except (WebSocketDisconnect, RuntimeError):
-            # Connection already closed or being closed
-            pass
-        except grpc.RpcError as e:
-            logging.error(f"gRPC error: {e}")
+            yield transcription_pb2.StreamRequest(config=config)
+            
+            # Coalesce 128-sample worklet frames into larger slices
+            async for data in coalesced_frames(websocket, sample_rate, bytes_per_sample):
+                yield transcription_pb2.StreamRequest(audio=transcription_pb2.AudioChunk(data=data))
+        except WebSocketDisconnect:
+            browser_dropped = True
+            raise
         except Exception as e:
-            logging.error(f"Bridge error: {e}")
-        finally:
+            logging.error(f"WebSocket error: {e}")
+
+    session_id = None
+    resume_token = None
+    finished = False
+    # Audio bytes the server finished with before draining the session
+    drained_offset = None
+    # 1000 tells the browser the session is over, 4503 that it should start a
+    # new one right away from the byte offset in the close reason; anything
+    # else invites a resume
+    close_code = 1000
+    try:
+        # With a single server, wait_for_ready queues the call while a channel
+        # reconnects; with a fleet, fail fast so the next session goes elsewhere
+        responses = stub.StreamTranscription(request_generator(), wait_for_ready=not balancer.has_alternatives)
+        async for response in responses:
+            if sender_task.done():
+                # Browser went away mid-send, or fell too far behind
+                break
+            if response.session_id:
+                session_id = response.session_id
+                resume_token = response.resume_token
+                session_backends[session_id] = backend
+            if response.drained:
+                drained_offset = response.resume_offset
+                continue
+            sender.put(response)
+        else:
+            finished = True
+        sender.close()
+        await sender_task
+        if sender.dropped_partials:
+            logging.info(f"Dropped {sender.dropped_partials} superseded partials for a slow client")
+        if sender.overflowed:
+            logging.warning(f"Closed session {session_id}: browser fell {sender.max_finals} finals behind")
+    except (WebSocketDisconnect, RuntimeError):
+        # Connection already closed or being closed
+        pass
+    except asyncio.CancelledError:
+        if not browser_dropped:
+            raise
+        logging.info(f"Browser dropped session {session_id}; resumable for {RESUME_GRACE_SECONDS:.0f}s")
+    except grpc.RpcError as e:
+        if drained_offset is not None:
+            # The backend is shutting down, not failing; its session can't be resumed
+            close_code = 4503
+            resume_token = None
+            logging.info(f"Session {session_id} drained by {backend.target} at byte {drained_offset}")
+            # The finals made before the drain go out ahead of the close
+            sender.close()
+            await asyncio.wait([sender_task], timeout=DRAIN_FLUSH_SECONDS)
+        else:
+            if e.code() == grpc.StatusCode.UNAVAILABLE:
+                balancer.mark_failed(backend)
+            # The session is gone if a resume was refused; otherwise let the browser try
+            close_code = 4404 if e.code() == grpc.StatusCode.NOT_FOUND else 1011
+            logging.error(f"gRPC error ({backend.target}): {e}")
+    except Exception as e:
+        logging.error(f"Bridge error: {e}")
+    finally:
+        sender_task.cancel()
+        session_backends.pop(session_id, None)
+        if resume_token and not finished:
+            # The server keeps the session for a while; remember where it lives
+            resume_backends[resume_token] = (backend, time.monotonic())
+        try:
+            # Only close if it's still open (though Starlette usually handles this)
+            # This is a bit redundant but helps with the 'after sending websocket.close' error
+            if websocket.client_state.name == "CONNECTED":
+                await websocket.close(code=close_code, reason=str(drained_offset) if close_code == 4503 else None)
+        except:
+            pass
+
+@app.websocket("/ws/subscribe/{session_id}")
+async def subscribe_endpoint(websocket: WebSocket, session_id: str):
+    # Viewers follow someone else's live session; no audio, no extra inference
+    await websocket.accept()
+    sender = ResultSender(websocket, binary=websocket.query_params.get("protocol") == "binary")
+    sender_task = asyncio.create_task(sender.run())
+
+    # Sessions started through this bridge are routed directly; otherwise ask each server
+    known = session_backends.get(session_id)
+    candidates = [known] if known else list(balancer.backends)
+    try:
+        for i, backend in enumerate(candidates):
             try:
-                # Only close if it's still open (though Starlette usually handles this)
-                # This is a bit redundant but helps with the 'after sending websocket.close' error
-                if websocket.client_state.name == "CONNECTED":
-                    await websocket.close()
-            except:
-                pass
+                async for result in backend.pool.stub().Subscribe(transcription_pb2.SubscribeRequest(session_id=session_id)):
+                    if sender_task.done():
+                        break
+                    sender.put(result)
+                break
+            except grpc.RpcError as e:
+                if e.code() == grpc.StatusCode.NOT_FOUND and i < len(candidates) - 1:
+                    continue
+                logging.error(f"Subscribe error ({backend.target}): {e.code()}")
+                break
+        sender.close()
+        await sender_task
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    except Exception as e:
+        logging.error(f"Subscribe bridge error: {e}")
+    finally:
+        sender_task.cancel()
+        try:
+            if websocket.client_state.name == "CONNECTED":
+                await websocket.close()
+        except:
+            pass
+
+@app.get("/api/search")
+async def search(q: str, limit: int = 50):
+    # Every server indexes only the sessions it transcribed, so ask them all
+    request = transcription_pb2.SearchRequest(query=q, limit=limit)
+
+    async def ask(backend):
+        try:
+            return await backend.pool.stub().Search(request, timeout=SEARCH_TIMEOUT_SECONDS)
+        except grpc.RpcError as e:
+            logging.error(f"Search error ({backend.target}): {e.code()}")
+            return None
+
+    responses = [r for r in await asyncio.gather(*(ask(b) for b in balancer.backends)) if r is not None]
+    if not responses and balancer.backends:
+        raise HTTPException(status_code=503, detail="No transcription server answered")
+    # Each server's hits are newest first; interleave them so none is crowded out
+    hits = []
+    for i in range(limit):
+        hits.extend(r.hits[i] for r in responses if i < len(r.hits))
+    return {
+        "total": sum(r.total for r in responses),
+        "hits": [
+            {
+                "session_id": hit.session_id,
+                "recording_url": f"/recordings/{hit.recording}" if hit.recording else None,
+                "start_time": hit.start_time,
+                "segment_start": hit.segment_start,
+                "text": hit.text,
+            }
+            for hit in hits[:limit]
+        ],
+    }
+
+def recording_file(name, extension=None):
+    # Only finished recordings (and their .peaks): files still being written
+    # (.part, .spill, .tmp) must not be served, let alone cached as immutable
+    if os.path.basename(name) != name or not name.startswith("recording_") \
+            or os.path.splitext(name)[1] not in AUDIO_MEDIA_TYPES:
+        raise HTTPException(status_code=404)
+    if extension is not None:
+        name = os.path.splitext(name)[0] + extension
+    path = os.path.join(RECORDINGS_DIR, name)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404)
+    return path
+
+@functools.lru_cache(maxsize=256)
+def open_peaks(path, mtime):
+    return PeaksFile(path)
+
+@app.get("/recordings/{name}")
+async def get_recording(name: str):
+    # FileResponse answers Range requests, so the browser streams and seeks on demand
+    path = recording_file(name)
+    media_type = AUDIO_MEDIA_TYPES.get(os.path.splitext(name)[1])
+    return FileResponse(path, media_type=media_type, headers=IMMUTABLE)
+
+@app.get("/recordings/{name}/peaks")
+async def get_peaks_info(name: str):
+    path = recording_file(name, ".peaks")
+    return JSONResponse(open_peaks(path, os.path.getmtime(path)).info(), headers=IMMUTABLE)
+
+@app.get("/recordings/{name}/peaks/{level}")
+async def get_peaks(name: str, level: int, start: float = 0.0, end: float | None = None):
+    # Interleaved int8 (min, max) pairs; X-Peaks-First is the index of the first one
+    path = recording_file(name, ".peaks")
+    peaks = open_peaks(path, os.path.getmtime(path))
+    if not 0 <= level < len(peaks.levels):
+        raise HTTPException(status_code=404, detail=f"Level must be 0-{len(peaks.levels) - 1}")
+    first, data = await asyncio.to_thread(peaks.read, level, start, end)
+    return Response(
+        data, media_type="application/octet-stream", headers={**IMMUTABLE, "X-Peaks-First": str(first)}
+    )
 
 @app.get("/recorder", response_class=HTMLResponse)
 async def read_recorder(request: Request):
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+import time
+
+from fastapi import WebSocketDisconnect
+
+# Audio is forwarded to the server in slices of this duration...
+SLICE_MS = int(os.environ.get("COALESCE_SLICE_MS", "100"))
+# ...or sooner if the oldest buffered byte has waited this long.
+MAX_DELAY_MS = int(os.environ.get("COALESCE_MAX_DELAY_MS", "150"))
+# Close codes for a deliberate stop (normal closure, page going away).
+# Anything else is a dropped connection the browser may resume.
+CLEAN_CLOSE_CODES = (1000, 1001)
+
+
+class ChunkCoalescer:
+    # Packs the browser's small worklet frames (128 samples each) into
+    # fixed-duration slices using a single preallocated buffer.
+    def __init__(self, sample_rate, bytes_per_sample=4, slice_ms=SLICE_MS):
+        slice_samples = max(1, sample_rate * slice_ms // 1000)
+        self._buffer = bytearray(slice_samples * bytes_per_sample)
+        self._view = memoryview(self._buffer)
+        self._size = 0
+        self.first_byte_at = None
+
+    @property
+    def empty(self):
+        return self._size == 0
+
+    def add(self, data):
+        # Returns any slices completed by this frame
+        slices = []
+        data = memoryview(data)
+        while data:
+            if self._size == 0:
+                self.first_byte_at = time.monotonic()
+            n = min(len(data), len(self._buffer) - self._size)
+            self._view[self._size:self._size + n] = data[:n]
+            self._size += n
+            data = data[n:]
+            if self._size == len(self._buffer):
+                slices.append(self.flush())
+        return slices
+
+    def flush(self):
+        data = bytes(self._view[:self._size])
+        self._size = 0
+        self.first_byte_at = None
+        return data
+
+
+async def read_frames(websocket, frames):
+    # Moves WebSocket frames into a queue so the coalescer can wait on it with a
+    # timeout without cancelling a receive in flight. None marks a clean end,
+    # a WebSocketDisconnect a dropped connection.
+    end = None
+    try:
+        while True:
+            frames.put_nowait(await websocket.receive_bytes())
+    except WebSocketDisconnect as e:
+        if e.code not in CLEAN_CLOSE_CODES:
+            end = e
+    except Exception as e:
+        logging.error(f"WebSocket error: {e}")
+    finally:
+        frames.put_nowait(end)
+
+
+async def coalesced_frames(websocket, sample_rate, bytes_per_sample=4):
+    # Yields audio slices of SLICE_MS, flushing early after MAX_DELAY_MS.
+    # Raises WebSocketDisconnect once buffered audio is out if the browser dropped.
+    coalescer = ChunkCoalescer(sample_rate, bytes_per_sample)
+    frames = asyncio.Queue()
+    reader = asyncio.create_task(read_frames(websocket, frames))
+    max_delay = MAX_DELAY_MS / 1000
+    try:
+        while True:
+            timeout = None
+            if not coalescer.empty:
+                timeout = max(0.0, coalescer.first_byte_at + max_delay - time.monotonic())
+            try:
+                data = await asyncio.wait_for(frames.get(), timeout)
+            except asyncio.TimeoutError:
+                yield coalescer.flush()
+                continue
+            if data is None or isinstance(data, WebSocketDisconnect):
+                break
+            for audio_slice in coalescer.add(data):
+                yield audio_slice
+        if not coalescer.empty:
+            yield coalescer.flush()
+        if data is not None:
+            raise data
+    finally:
+        reader.cancel()
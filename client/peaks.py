@@ -0,0 +1,55 @@
+import math
+import struct
+
+# Reader for the waveform peak files the server writes next to each recording
+# (see PeakBuilder in server/recordings.py): a header, then per level one
+# (min, max) int8 pair per block of samples, finest level first.
+PEAKS_MAGIC = b"PEAK"
+PEAKS_VERSION = 1
+# magic, version, levels, base samples per peak, factor, sample rate, samples
+PEAKS_HEADER = struct.Struct("<4sBBHHII")
+PEAK_BYTES = 2
+
+
+class PeaksFile:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(PEAKS_HEADER.size)
+        if len(header) != PEAKS_HEADER.size:
+            raise ValueError(f"{path}: truncated peaks header")
+        magic, version, levels, base, factor, self.sample_rate, self.samples = PEAKS_HEADER.unpack(header)
+        if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+            raise ValueError(f"{path}: not a version {PEAKS_VERSION} peaks file")
+        # (samples per peak, peak count, byte offset) per level
+        self.levels = []
+        offset = PEAKS_HEADER.size
+        count = math.ceil(self.samples / base)
+        for k in range(levels):
+            self.levels.append((base * factor ** k, count, offset))
+            offset += count * PEAK_BYTES
+            count = math.ceil(count / factor)
+
+    @property
+    def duration(self):
+        return self.samples / self.sample_rate
+
+    def info(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "samples": self.samples,
+            "duration": self.duration,
+            "levels": [{"samples_per_peak": spp, "count": count} for spp, count, _ in self.levels],
+        }
+
+    def read(self, level, start_time=0.0, end_time=None):
+        # Returns (index of the first peak, interleaved min/max bytes) covering
+        # [start_time, end_time) in seconds
+        samples_per_peak, count, offset = self.levels[level]
+        first = max(0, int(start_time * self.sample_rate) // samples_per_peak)
+        last = count if end_time is None else min(count, math.ceil(end_time * self.sample_rate / samples_per_peak))
+        if last <= first:
+            return first, b""
+        with open(self.path, "rb") as f:
+            f.seek(offset + first * PEAK_BYTES)
+            return first, f.read((last - first) * PEAK_BYTES)
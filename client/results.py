@@ -0,0 +1,133 @@
+import asyncio
+import collections
+import os
+import struct
+import time
+
+# Binary result frame: header, optional timing block, then the UTF-8 text.
+#   u8 message type | u8 flags | u32 sequence number | f32 start_time
+RESULT_HEADER = struct.Struct("<BBIf")
+# Present when FLAG_TIMING is set:
+#   f64 audio_end | f64 server receive time | f64 bridge forward time
+#   f32 decode seconds | f32 queue wait seconds
+RESULT_TIMING = struct.Struct("<dddff")
+MSG_RESULT = 1
+FLAG_FINAL = 0x01
+FLAG_TIMING = 0x02
+
+# Finals a socket may fall behind by before it is closed (as the server's
+# SUBSCRIBER_MAX_FINALS); the browser then resumes the session
+MAX_QUEUED_FINALS = int(os.environ.get("BRIDGE_MAX_QUEUED_FINALS", "200"))
+# WebSocket "Try Again Later"
+CLOSE_OVERLOADED = 1013
+
+
+def encode_result(seq, result, forwarded_at=None):
+    flags = FLAG_FINAL if result.is_final else 0
+    timing = b""
+    if result.HasField("timing"):
+        flags |= FLAG_TIMING
+        t = result.timing
+        timing = RESULT_TIMING.pack(
+            t.audio_end, t.receive_timestamp, forwarded_at or time.time(), t.decode_seconds, t.queue_wait_seconds
+        )
+    return RESULT_HEADER.pack(MSG_RESULT, flags, seq, result.start_time) + timing + result.text.encode("utf-8")
+
+
+def result_json(seq, result, forwarded_at=None):
+    message = {
+        "seq": seq,
+        "text": result.text,
+        "is_final": result.is_final,
+        "start_time": result.start_time,
+    }
+    if result.HasField("timing"):
+        t = result.timing
+        message["timing"] = {
+            "audio_end": t.audio_end,
+            "receive_timestamp": t.receive_timestamp,
+            "forward_timestamp": forwarded_at or time.time(),
+            "decode_seconds": t.decode_seconds,
+            "queue_wait_seconds": t.queue_wait_seconds,
+        }
+    return message
+
+
+def is_partial(result):
+    # Session announcements carry no text and must never be dropped
+    return not result.is_final and not result.session_id
+
+
+class ResultSender:
+    # Per-socket outbound queue between the gRPC response stream and a
+    # possibly slow browser. Finals are delivered in order; a queued partial
+    # is dropped as soon as anything newer arrives, so the queue holds at most
+    # one partial. A browser that falls max_finals finals behind is closed
+    # with CLOSE_OVERLOADED rather than buffered without limit. Sequence
+    # numbers are assigned on arrival, so the client can see where partials
+    # were skipped.
+    def __init__(self, websocket, binary=False, max_finals=MAX_QUEUED_FINALS):
+        self.websocket = websocket
+        self.binary = binary
+        self.max_finals = max_finals
+        self.seq = 0
+        self.dropped_partials = 0
+        self.overflowed = False
+        self._queue = collections.deque()
+        self._finals = 0
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, result):
+        if self.overflowed:
+            return
+        self.seq += 1
+        # Only the newest queued item can be a partial
+        if self._queue and is_partial(self._queue[-1][1]):
+            self._queue.pop()
+            self.dropped_partials += 1
+        self._queue.append((self.seq, result))
+        if result.is_final:
+            self._finals += 1
+            if self._finals > self.max_finals:
+                self.overflowed = True
+                self._queue.clear()
+                self.close()
+        self._ready.set()
+
+    def close(self):
+        # Flush what's queued, then stop
+        self._closed = True
+        self._ready.set()
+
+    async def _send(self, seq, result):
+        if result.session_id:
+            # Control message: always a JSON text frame
+            await self.websocket.send_json({
+                "seq": seq,
+                "session_id": result.session_id,
+                "resume_token": result.resume_token,
+                "resume_offset": result.resume_offset,
+            })
+        elif self.binary:
+            await self.websocket.send_bytes(encode_result(seq, result, time.time()))
+        else:
+            await self.websocket.send_json(result_json(seq, result, time.time()))
+
+    async def run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self._queue:
+                seq, result = self._queue.popleft()
+                if result.is_final:
+                    self._finals -= 1
+                await self._send(seq, result)
+            if self.overflowed:
+                await self.websocket.close(code=CLOSE_OVERLOADED, reason="Too many undelivered results")
+                return
+            if self._closed:
+                return
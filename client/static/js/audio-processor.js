@@ -1,10 +1,101 @@
+// Windowed-sinc (Blackman) low-pass FIR. cutoff is a fraction of the input rate.
+function designLowpass(numTaps, cutoff) {
+  const taps = new Float32Array(numTaps);
+  const mid = (numTaps - 1) / 2;
+  let sum = 0;
+  for (let i = 0; i < numTaps; i++) {
+    const n = i - mid;
+    const sinc = n === 0 ? 2 * cutoff : Math.sin(2 * Math.PI * cutoff * n) / (Math.PI * n);
+    const window = 0.42 - 0.5 * Math.cos((2 * Math.PI * i) / (numTaps - 1)) + 0.08 * Math.cos((4 * Math.PI * i) / (numTaps - 1));
+    taps[i] = sinc * window;
+    sum += taps[i];
+  }
+  // Unity gain at DC
+  for (let i = 0; i < numTaps; i++) taps[i] /= sum;
+  return taps;
+}
+
 class AudioProcessor extends AudioWorkletProcessor {
+  constructor(options) {
+    super();
+    const opts = (options && options.processorOptions) || {};
+    // Without a target rate we post raw float32 at the context rate (legacy behaviour)
+    this.targetRate = opts.targetRate || 0;
+    if (!this.targetRate) return;
+
+    // Input samples per output sample (sampleRate is the worklet global)
+    this.step = sampleRate / this.targetRate;
+    this.resample = this.step !== 1;
+    if (this.resample) {
+      // Cut off a little below the new Nyquist to keep aliasing out of the speech band
+      this.taps = designLowpass(63, (0.45 * this.targetRate) / sampleRate);
+      // Carried filter state: the last taps.length input samples
+      this.history = new Float32Array(this.taps.length);
+      this.buffer = new Float32Array(this.taps.length + 128);
+      // Fractional input position of the next output sample, relative to the current block
+      this.position = 0;
+    }
+  }
+
+  // FIR output at block index j (j >= -1), read from [history | block]
+  filtered(j) {
+    const taps = this.taps;
+    const base = taps.length + j;
+    let acc = 0;
+    for (let k = 0; k < taps.length; k++) {
+      acc += taps[k] * this.buffer[base - k];
+    }
+    return acc;
+  }
+
+  downsample(block) {
+    const historyLength = this.taps.length;
+    if (this.buffer.length < historyLength + block.length) {
+      this.buffer = new Float32Array(historyLength + block.length);
+    }
+    this.buffer.set(this.history, 0);
+    this.buffer.set(block, historyLength);
+
+    const out = new Float32Array(Math.ceil(block.length / this.step) + 1);
+    let count = 0;
+    while (this.position < block.length - 1) {
+      // Linear interpolation between two band-limited samples
+      const i = Math.floor(this.position);
+      const frac = this.position - i;
+      const a = this.filtered(i);
+      const b = this.filtered(i + 1);
+      out[count++] = a + (b - a) * frac;
+      this.position += this.step;
+    }
+    this.position -= block.length;
+
+    this.history.set(this.buffer.subarray(block.length, block.length + historyLength));
+    return out.subarray(0, count);
+  }
+
+  quantize(samples) {
+    const pcm = new Int16Array(samples.length);
+    for (let i = 0; i < samples.length; i++) {
+      const s = Math.max(-1, Math.min(1, samples[i]));
+      pcm[i] = Math.round(s * 32767);
+    }
+    return pcm;
+  }
+
   process(inputs, outputs, parameters) {
     const input = inputs[0];
     if (input.length > 0) {
       const channelData = input[0];
-      // We send a copy of the buffer to avoid issues with SharedArrayBuffer or neutered buffers
-      this.port.postMessage(channelData.slice());
+      if (!this.targetRate) {
+        // We send a copy of the buffer to avoid issues with SharedArrayBuffer or neutered buffers
+        this.port.postMessage(channelData.slice());
+      } else {
+        const samples = this.resample ? this.downsample(channelData) : channelData;
+        if (samples.length > 0) {
+          const pcm = this.quantize(samples);
+          this.port.postMessage(pcm, [pcm.buffer]);
+        }
+      }
     }
     return true;
   }
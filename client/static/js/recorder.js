@@ -58,6 +58,10 @@ class Recorder extends HTMLElement {
                 <button id="stream-btn" title="Start Transcribing (t)">Start Transcribing</button>
                 <button id="visualizer-btn" title="Toggle Visualizer (v)">Show Visualizer</button>
             </div>
+            <div class="row" style="margin-top: 10px;">
+                <input id="search" type="search" placeholder='Search transcripts: "exact phrase", prefix*' style="width: 100%;">
+            </div>
+            <div id="search-results" style="text-align: left;"></div>
         </div>
 
         <div id="visualizer-container" style="display: none; margin-bottom: 20px;">
@@ -101,6 +105,8 @@ class Recorder extends HTMLElement {
         this.recordingSelector = this.querySelector('#recordingSelector');
         this.statusDisplay = this.querySelector('#status');
         this.visualizerContainer = this.querySelector('#visualizer-container');
+        this.searchInput = this.querySelector('#search');
+        this.searchResults = this.querySelector('#search-results');
     }
 
     bindEvents() {
@@ -119,6 +125,12 @@ class Recorder extends HTMLElement {
         this.deleteButton.addEventListener('click', () => this.delete());
         this.recordingSelector.addEventListener('change', (event) => this.selectRecording(event.target.value));
 
+        // Search as you type, once typing pauses
+        this.searchInput.addEventListener('input', () => {
+            clearTimeout(this.searchTimer);
+            this.searchTimer = setTimeout(() => this.search(this.searchInput.value), 200);
+        });
+
         // Hotkeys
         document.addEventListener('keydown', (e) => this.handleHotkey(e));
     }
@@ -435,14 +447,18 @@ class Recorder extends HTMLElement {
         if (!preserveDetails && this.recordingDetails) this.recordingDetails.clear();
 
         const recording = await this.database.getRecording(value);
+        await this.loadAudio(recording.blob);
+    }
+
+    async loadAudio(blob) {
         this.audioUrl && URL.revokeObjectURL(this.audioUrl);
-        this.audioUrl = URL.createObjectURL(recording.blob);
+        this.audioUrl = URL.createObjectURL(blob);
         this.audio = new Audio(this.audioUrl);
 
         if (this.waveform) {
             try {
                 const context = new AudioContext();
-                const arrayBuffer = await recording.blob.arrayBuffer();
+                const arrayBuffer = await blob.arrayBuffer();
                 if (arrayBuffer.byteLength === 0) throw new Error("Empty audio buffer");
 
                 const audioBuffer = await context.decodeAudioData(arrayBuffer);
@@ -461,6 +477,75 @@ class Recorder extends HTMLElement {
         }
     }
 
+    async search(query) {
+        query = query.trim();
+        const requestId = (this.searchRequestId = (this.searchRequestId || 0) + 1);
+        if (!query) {
+            this.searchResults.replaceChildren();
+            return;
+        }
+        let results;
+        try {
+            const response = await fetch(`/api/search?q=${encodeURIComponent(query)}&limit=50`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            results = await response.json();
+        } catch (err) {
+            console.error('Search failed:', err);
+            return;
+        }
+        if (requestId !== this.searchRequestId) return; // A newer query is in flight
+
+        const summary = document.createElement('div');
+        summary.textContent = `${results.total} match${results.total === 1 ? '' : 'es'}`;
+        const items = results.hits.map(hit => {
+            const item = document.createElement('div');
+            item.className = 'search-hit';
+            item.style.cursor = hit.recording_url ? 'pointer' : 'default';
+            item.textContent = `[${this.formatTime(hit.start_time)}] ${hit.text}`;
+            item.title = hit.recording_url ? `Play from ${this.formatTime(hit.start_time)}` : 'Recording not available';
+            if (hit.recording_url) item.addEventListener('click', () => this.seekToHit(hit));
+            return item;
+        });
+        this.searchResults.replaceChildren(summary, ...items);
+    }
+
+    async seekToHit(hit) {
+        // Server recordings aren't in the local database. Their audio streams
+        // through range requests and the waveform comes from precomputed
+        // peaks, so playback doesn't wait for a full download and decode.
+        if (this.audio && !this.audio.paused) this.play();
+        if (this.recordingDetails) this.recordingDetails.clear();
+        this.recordingSelector.value = '';
+        this.audioUrl && URL.revokeObjectURL(this.audioUrl);
+        this.audioUrl = null;
+
+        const audio = new Audio();
+        audio.preload = 'metadata';
+        audio.src = hit.recording_url;
+        this.audio = audio;
+        this.audioDuration = NaN;
+        audio.addEventListener('error', () => {
+            this.statusDisplay.textContent = 'Error: Recording is no longer available.';
+        });
+
+        if (this.waveform) {
+            if (await this.waveform.loadPeaks(hit.recording_url)) {
+                this.audioDuration = this.waveform.staticDuration;
+            } else {
+                this.waveform.clear();
+            }
+        }
+        if (this.audio !== audio) return; // Another hit was picked meanwhile
+        if (this.waveform && this.waveform.hasStatic()) this.waveform.bindAudio(audio);
+        audio.addEventListener('timeupdate', () => {
+            if (audio.paused) this.renderPlayerInfo();
+        });
+
+        // Start a moment early so the match isn't clipped
+        audio.currentTime = Math.max(0, hit.start_time - 0.5);
+        this.play();
+    }
+
     play() {
         if (!this.audio) return;
 
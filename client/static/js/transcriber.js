@@ -1,12 +1,32 @@
 class Transcriber {
     constructor() {
         this.socket = null;
+        this.sessionId = null;
         this.isStreaming = false;
         this.historyDiv = document.getElementById('transcript-history');
         this.partialDiv = document.getElementById('partial-result');
         this.audioContext = null;
         this.processor = null;
         this.inputSource = null;
+        // Downsampled and quantized in the AudioWorklet before sending
+        this.targetSampleRate = 16000;
+        // Caption latency: how long after its audio was sent a result arrived.
+        // sendTimes holds [audio seconds, sent at] from the newest acknowledged
+        // result on, covering at most maxSendTimeSeconds of audio
+        this.latency = null;
+        this.samplesSent = 0;
+        this.sendTimes = [];
+        this.maxSendTimeSeconds = 30;
+        // Resumption: audio is kept (byte offsets from the session start) until
+        // it falls out of the server's grace window, so a reconnect can resend
+        // whatever the server did not receive
+        this.resumeToken = null;
+        this.retainedAudio = [];
+        this.retainedBytes = 0;
+        this.bytesPosted = 0;
+        this.maxRetainedBytes = 30 * this.targetSampleRate * 2;
+        this.live = false;
+        this.reconnectDelay = 500;
     }
 
     async start(stream, audioContext) {
@@ -24,40 +44,142 @@ class Transcriber {
         if (this.historyDiv) this.historyDiv.innerHTML = '';
         if (this.partialDiv) this.partialDiv.textContent = '';
 
-        try {
-            // Initialize WebSocket
-            const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-            this.socket = new WebSocket(`${protocol}//${window.location.host}/ws/audio`);
-            
-            this.socket.onopen = () => {
-                console.log('Transcriber WebSocket connected');
-                this.socket.send(JSON.stringify({ sample_rate: this.audioContext.sampleRate }));
-            };
-
-            this.socket.onclose = () => {
-                console.log('Transcriber WebSocket disconnected');
-                this.isStreaming = false;
-            };
+        this.lastSeq = 0;
+        this.samplesSent = 0;
+        this.sendTimes = [];
+        this.resetSession();
 
-            this.socket.onmessage = (event) => this.handleMessage(event);
+        try {
+            this.isStreaming = true;
+            this.connect();
 
             // Load AudioWorklet
             await this.audioContext.audioWorklet.addModule('/static/js/audio-processor.js');
-            this.processor = new AudioWorkletNode(this.audioContext, 'audio-processor');
+            this.processor = new AudioWorkletNode(this.audioContext, 'audio-processor', {
+                processorOptions: { targetRate: this.targetSampleRate }
+            });
 
             this.inputSource.connect(this.processor);
             this.processor.connect(this.audioContext.destination);
 
-            this.processor.port.onmessage = (event) => {
-                if (this.socket && this.socket.readyState === WebSocket.OPEN) {
-                    this.socket.send(event.data.buffer);
-                }
-            };
-
-            this.isStreaming = true;
+            this.processor.port.onmessage = (event) => this.postAudio(event.data);
         } catch (err) {
             console.error('Transcriber start error:', err);
+            this.isStreaming = false;
+        }
+    }
+
+    resetSession() {
+        this.resumeToken = null;
+        this.retainedAudio = [];
+        this.retainedBytes = 0;
+        this.bytesPosted = 0;
+    }
+
+    connect() {
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const socket = new WebSocket(`${protocol}//${window.location.host}/ws/audio`);
+        socket.binaryType = 'arraybuffer';
+        this.socket = socket;
+        // Audio waits in retainedAudio until the server says where to start
+        this.live = false;
+
+        socket.onopen = () => {
+            console.log('Transcriber WebSocket connected');
+            const handshake = { sample_rate: this.targetSampleRate, encoding: 's16le', protocol: 'binary' };
+            if (this.resumeToken) handshake.resume_token = this.resumeToken;
+            socket.send(JSON.stringify(handshake));
+        };
+
+        socket.onclose = (event) => {
+            if (this.socket !== socket) return;
+            this.socket = null;
+            this.live = false;
+            if (!this.isStreaming || event.code === 1000) {
+                console.log('Transcriber WebSocket disconnected');
+                this.isStreaming = false;
+                return;
+            }
+            if (event.code === 1007) {
+                // The bridge rejected the handshake; resending it won't help
+                console.error(`Transcriber handshake rejected: ${event.reason}`);
+                this.isStreaming = false;
+                return;
+            }
+            if (event.code === 4503) {
+                // The server shut down after finishing the audio up to the byte
+                // offset in the reason: carry on in a new session elsewhere
+                console.log(`Server draining at byte ${event.reason}, starting a new session`);
+                this.restartFrom(parseInt(event.reason, 10) || 0);
+                this.connect();
+                return;
+            }
+            if (event.code === 4404) {
+                // The server no longer has the session: start a new one
+                console.log('Session expired, starting a new one');
+                this.resetSession();
+            }
+            console.log(`Transcriber WebSocket dropped (${event.code}), reconnecting in ${this.reconnectDelay}ms`);
+            setTimeout(() => { if (this.isStreaming) this.connect(); }, this.reconnectDelay);
+            this.reconnectDelay = Math.min(this.reconnectDelay * 2, 5000);
+        };
+
+        socket.onmessage = (event) => this.handleMessage(event);
+    }
+
+    postAudio(pcm) {
+        this.retainedAudio.push([this.bytesPosted, pcm]);
+        this.bytesPosted += pcm.byteLength;
+        this.retainedBytes += pcm.byteLength;
+        while (this.retainedBytes > this.maxRetainedBytes) {
+            this.retainedBytes -= this.retainedAudio.shift()[1].byteLength;
+        }
+        this.samplesSent += pcm.length;
+        const sentSeconds = this.samplesSent / this.targetSampleRate;
+        this.sendTimes.push([sentSeconds, performance.now()]);
+        // Results without timing never prune the map; nothing this old will be matched
+        while (this.sendTimes[0][0] < sentSeconds - this.maxSendTimeSeconds) {
+            this.sendTimes.shift();
+        }
+
+        if (this.live && this.socket.readyState === WebSocket.OPEN) {
+            this.socket.send(pcm.buffer);
+        }
+    }
+
+    // A new session picks up at `offset` bytes into the current one: keep
+    // only the audio from there, counted from the new session's start
+    restartFrom(offset) {
+        const retained = [];
+        let retainedBytes = 0;
+        for (const [start, pcm] of this.retainedAudio) {
+            const end = start + pcm.byteLength;
+            if (end <= offset) continue;
+            const kept = start >= offset ? pcm : new Int16Array(pcm.buffer.slice(offset - start));
+            retained.push([Math.max(start, offset) - offset, kept]);
+            retainedBytes += kept.byteLength;
+        }
+        this.resumeToken = null;
+        this.retainedAudio = retained;
+        this.retainedBytes = retainedBytes;
+        this.bytesPosted -= offset;
+        // Result timings restart from zero as well
+        const shift = offset / 2 / this.targetSampleRate;
+        this.samplesSent -= offset / 2;
+        this.sendTimes = this.sendTimes
+            .filter(([seconds]) => seconds > shift)
+            .map(([seconds, sentAt]) => [seconds - shift, sentAt]);
+    }
+
+    // The server holds `offset` bytes of this session: send the rest and go live
+    resumeFrom(offset) {
+        for (const [start, pcm] of this.retainedAudio) {
+            const end = start + pcm.byteLength;
+            if (end <= offset) continue;
+            this.socket.send(start >= offset ? pcm.buffer : pcm.buffer.slice(offset - start));
         }
+        this.live = true;
+        this.reconnectDelay = 500;
     }
 
     stop() {
@@ -74,16 +196,77 @@ class Transcriber {
             this.inputSource = null;
         }
 
+        this.isStreaming = false;
+        this.live = false;
+
         if (this.socket) {
-            this.socket.close();
+            this.socket.close(1000);
             this.socket = null;
         }
-        
-        this.isStreaming = false;
+    }
+
+    // Binary result frame: u8 type | u8 flags | u32 seq | f32 start_time,
+    // then (flag 0x02) f64 audio_end | f64 receive | f64 forward | f32 decode | f32 queue wait,
+    // then UTF-8 text
+    decodeResult(buffer) {
+        const view = new DataView(buffer);
+        const flags = view.getUint8(1);
+        const result = {
+            is_final: (flags & 0x01) !== 0,
+            seq: view.getUint32(2, true),
+            start_time: view.getFloat32(6, true)
+        };
+        let offset = 10;
+        if (flags & 0x02) {
+            result.timing = {
+                audio_end: view.getFloat64(10, true),
+                receive_timestamp: view.getFloat64(18, true),
+                forward_timestamp: view.getFloat64(26, true),
+                decode_seconds: view.getFloat32(34, true),
+                queue_wait_seconds: view.getFloat32(38, true)
+            };
+            offset = 42;
+        }
+        result.text = new TextDecoder().decode(new Uint8Array(buffer, offset));
+        return result;
+    }
+
+    // End-to-end lag for a result: now minus when the last audio it covers was sent.
+    // Every figure is a duration measured on one clock: caption_seconds on the
+    // browser's, decode and queue wait on the server's. Overhead is what the
+    // caption took beyond those (network, bridge, waiting for the next tick),
+    // so it never mixes timestamps from machines whose clocks may disagree.
+    recordLatency(timing) {
+        // Audio up to audio_end is acknowledged; keep only the entry it ends in
+        while (this.sendTimes.length > 1 && this.sendTimes[1][0] <= timing.audio_end) {
+            this.sendTimes.shift();
+        }
+        if (!this.sendTimes.length || this.sendTimes[0][0] > timing.audio_end + 0.1) return;
+        const captionSeconds = (performance.now() - this.sendTimes[0][1]) / 1000;
+        this.latency = {
+            caption_seconds: captionSeconds,
+            decode_seconds: timing.decode_seconds,
+            queue_wait_seconds: timing.queue_wait_seconds,
+            overhead_seconds: Math.max(0, captionSeconds - timing.decode_seconds - timing.queue_wait_seconds)
+        };
+        window.dispatchEvent(new CustomEvent('transcription-latency', { detail: this.latency }));
     }
 
     handleMessage(event) {
-        const data = JSON.parse(event.data);
+        const data = event.data instanceof ArrayBuffer ? this.decodeResult(event.data) : JSON.parse(event.data);
+        if (data.seq) {
+            // Gaps are partials the bridge dropped because newer results superseded them
+            this.lastSeq = data.seq;
+        }
+        if (data.session_id) {
+            // Viewers can follow along at /ws/subscribe/<session_id>
+            this.sessionId = data.session_id;
+            this.resumeToken = data.resume_token;
+            console.log('Transcription session:', this.sessionId, 'from byte', data.resume_offset);
+            this.resumeFrom(data.resume_offset || 0);
+            return;
+        }
+        if (data.timing) this.recordLatency(data.timing);
         const transcriptionDiv = document.getElementById('transcription'); 
         
         if (data.is_final) {
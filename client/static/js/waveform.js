@@ -15,6 +15,8 @@ class WaveformDisplay {
         this.analyser = null;
         this.peaks = []; // Store live peaks
         this.staticBuffer = null; // AudioBuffer for static display
+        this.remotePeaks = null; // Server-side peak pyramid for static display
+        this.staticDuration = 0;
         this.audioElement = null; // Associated audio element for playhead
         this.isLive = false;
         this.animationId = null;
@@ -24,13 +26,13 @@ class WaveformDisplay {
         
         // Click to seek
         this.canvas.addEventListener('click', e => {
-            if (this.isLive || !this.staticBuffer || !this.audioElement) return;
+            if (this.isLive || !this.hasStatic() || !this.audioElement) return;
             
             const rect = this.canvas.getBoundingClientRect();
             const x = e.clientX - rect.left;
             const progress = x / rect.width;
             
-            const duration = this.staticBuffer.duration;
+            const duration = this.staticDuration;
             if (Number.isFinite(duration)) {
                 this.audioElement.currentTime = progress * duration;
                 // Redraw immediately for responsiveness
@@ -51,14 +53,22 @@ class WaveformDisplay {
         // Redraw if we have static content
         if (!this.isLive && this.staticBuffer) {
             this.drawStatic();
+        } else if (!this.isLive && this.remotePeaks) {
+            // A wider canvas may need a finer level
+            this.fetchPeaks().then(() => this.drawStatic());
         }
     }
 
+    hasStatic() {
+        return Boolean(this.staticBuffer || this.remotePeaks);
+    }
+
     connect(analyser) {
         this.analyser = analyser;
         this.timeData = new Uint8Array(analyser.fftSize); // Use Uint8 for byte data as per recorder.html
         this.isLive = true;
         this.staticBuffer = null;
+        this.remotePeaks = null;
         this.peaks = [];
         this.startLoop();
     }
@@ -68,15 +78,95 @@ class WaveformDisplay {
         this.isLive = false;
         this.analyser = null;
         this.staticBuffer = audioBuffer;
+        this.remotePeaks = null;
+        this.staticDuration = audioBuffer.duration;
         this.audioElement = null; // Clear old audio element to prevent stale playhead
         this.drawStatic();
     }
 
+    // Draws a server recording from its precomputed peaks instead of decoding
+    // the audio. Resolves false if the recording has no peaks.
+    async loadPeaks(recordingUrl) {
+        this.stopLoop();
+        this.isLive = false;
+        this.analyser = null;
+        this.staticBuffer = null;
+        this.audioElement = null;
+        let info;
+        try {
+            const response = await fetch(`${recordingUrl}/peaks`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            info = await response.json();
+        } catch (err) {
+            console.warn('No waveform peaks for recording:', err);
+            this.remotePeaks = null;
+            return false;
+        }
+        this.remotePeaks = { url: recordingUrl, info, level: -1, first: 0, data: new Int8Array(0) };
+        this.staticDuration = info.duration;
+        await this.fetchPeaks();
+        this.drawStatic();
+        return true;
+    }
+
+    async fetchPeaks(start = 0, end = null) {
+        const remote = this.remotePeaks;
+        if (!remote) return;
+        // Coarsest level that still has a peak for every pixel of the range
+        const duration = (end ?? remote.info.duration) - start;
+        const pixelSamples = duration * remote.info.sample_rate / Math.max(1, this.width);
+        let level = 0;
+        remote.info.levels.forEach((l, i) => {
+            if (l.samples_per_peak <= pixelSamples) level = i;
+        });
+        if (level === remote.level) return;
+
+        const params = new URLSearchParams({ start });
+        if (end !== null) params.set('end', end);
+        const response = await fetch(`${remote.url}/peaks/${level}?${params}`);
+        if (!response.ok || this.remotePeaks !== remote) return;
+        remote.data = new Int8Array(await response.arrayBuffer());
+        remote.first = Number(response.headers.get('X-Peaks-First') || 0);
+        remote.level = level;
+    }
+
+    // Loudest absolute sample per pixel column, 0-1
+    columnAmplitudes() {
+        const amplitudes = new Float32Array(Math.max(0, Math.floor(this.width)));
+        if (this.staticBuffer) {
+            const data = this.staticBuffer.getChannelData(0);
+            const step = Math.ceil(data.length / this.width);
+            for (let i = 0; i < amplitudes.length; i++) {
+                let maxAmp = 0;
+                for (let j = 0; j < step; j++) {
+                    const datum = Math.abs(data[(i * step) + j]);
+                    if (datum > maxAmp) maxAmp = datum;
+                }
+                amplitudes[i] = maxAmp;
+            }
+        } else if (this.remotePeaks && this.remotePeaks.level >= 0) {
+            const { info, level, first, data } = this.remotePeaks;
+            const samplesPerPeak = info.levels[level].samples_per_peak;
+            const peaksPerPixel = info.samples / samplesPerPeak / amplitudes.length;
+            for (let i = 0; i < amplitudes.length; i++) {
+                const from = Math.floor(i * peaksPerPixel) - first;
+                const to = Math.max(from + 1, Math.floor((i + 1) * peaksPerPixel) - first);
+                let maxAmp = 0;
+                for (let p = Math.max(0, from); p < to && p * 2 + 1 < data.length; p++) {
+                    maxAmp = Math.max(maxAmp, -data[p * 2], data[p * 2 + 1]);
+                }
+                amplitudes[i] = maxAmp / 127;
+            }
+        }
+        return amplitudes;
+    }
+
     clear() {
         this.stopLoop();
         this.isLive = false;
         this.analyser = null;
         this.staticBuffer = null;
+        this.remotePeaks = null;
         this.audioElement = null;
         this.peaks = [];
         this.ctx.fillStyle = this.fillStyle;
@@ -87,13 +177,13 @@ class WaveformDisplay {
         this.audioElement = audioElement;
         
         // Immediate redraw to show playhead at current time (usually 0)
-        if (!this.isLive && this.staticBuffer) {
+        if (!this.isLive && this.hasStatic()) {
            this.drawStatic();
         }
 
         // Re-draw on timeupdate to move playhead
         this.audioElement.addEventListener('timeupdate', () => {
-            if (!this.isLive && this.staticBuffer) {
+            if (!this.isLive && this.hasStatic()) {
                 this.drawStatic();
             }
         });
@@ -101,7 +191,7 @@ class WaveformDisplay {
         // Also animation loop for smoother playhead? 
         // For now, timeupdate might be enough, or we requestAnimationFrame during play
         this.audioElement.addEventListener('play', () => {
-             if (!this.isLive && this.staticBuffer) {
+             if (!this.isLive && this.hasStatic()) {
                  this.startPlayheadLoop();
              }
         });
@@ -190,28 +280,25 @@ class WaveformDisplay {
     }
 
     drawStatic() {
-        if (!this.staticBuffer) return;
+        if (!this.hasStatic()) return;
         
         // Clear
         this.ctx.fillStyle = this.fillStyle;
         this.ctx.fillRect(0, 0, this.width, this.height);
 
-        const data = this.staticBuffer.getChannelData(0);
-        const step = Math.ceil(data.length / this.width);
-        // const amp = this.height / 2;
+        // Columns only change with the content or size, not with the playhead
+        const key = `${this.width}:${this.remotePeaks ? this.remotePeaks.level : 'buffer'}`;
+        if (this.columnsKey !== key || this.columnsSource !== (this.staticBuffer || this.remotePeaks)) {
+            this.columns = this.columnAmplitudes();
+            this.columnsKey = key;
+            this.columnsSource = this.staticBuffer || this.remotePeaks;
+        }
 
         this.ctx.fillStyle = '#0f0'; // Consistent style
-        // this.ctx.lineWidth = 1;
-        // this.ctx.strokeStyle = this.strokeStyle;
         this.ctx.beginPath();
 
-        for (let i = 0; i < this.width; i++) {
-            let maxAmp = 0;
-            for (let j = 0; j < step; j++) {
-                const datum = Math.abs(data[(i * step) + j]);
-                if (datum > maxAmp) maxAmp = datum;
-            }
-            
+        for (let i = 0; i < this.columns.length; i++) {
+            const maxAmp = this.columns[i];
             const barHeight = Math.max(1, maxAmp * this.height);
             const y = (this.height - barHeight) / 2;
             this.ctx.fillRect(i, y, 1, barHeight);
@@ -223,7 +310,7 @@ class WaveformDisplay {
             // Use element's duration if valid to ensure progress matches currentTime/duration ratio exactly
             // Fallback to buffer duration (fixing Infinity issue)
             const duration = Number.isFinite(this.audioElement.duration) ? this.audioElement.duration : 
-                           (this.staticBuffer ? this.staticBuffer.duration : 0);
+                           this.staticDuration;
             
             let progress = this.audioElement.currentTime / duration;
             
@@ -0,0 +1,153 @@
+import dataclasses
+import inspect
+import threading
+
+import numpy as np
+from faster_whisper import WhisperModel, __version__ as FASTER_WHISPER_VERSION
+from faster_whisper.transcribe import Word, restore_speech_timestamps
+from faster_whisper.vad import VadOptions, collect_chunks, get_speech_timestamps
+
+SAMPLE_RATE = 16000
+
+# transcribe()'s own defaults, so aligned words split off punctuation the same way
+_TRANSCRIBE_DEFAULTS = inspect.signature(WhisperModel.transcribe).parameters
+PREPEND_PUNCTUATIONS = _TRANSCRIBE_DEFAULTS["prepend_punctuations"].default
+APPEND_PUNCTUATIONS = _TRANSCRIBE_DEFAULTS["append_punctuations"].default
+
+# Private WhisperModel methods AligningWhisperModel overrides or calls, with
+# the parameters it passes. generate_segments must reach the first two
+# through self, once per window, for the overrides to see every window.
+_HOOKS = {
+    "encode": ["self", "features"],
+    "_split_segments_by_timestamps": [
+        "self", "tokenizer", "tokens", "time_offset", "segment_size", "segment_duration", "seek",
+    ],
+    "add_word_timestamps": [
+        "self", "segments", "tokenizer", "encoder_output", "num_frames",
+        "prepend_punctuations", "append_punctuations", "last_speech_timestamp",
+    ],
+}
+
+
+def _check_hooks():
+    # Fails at import, rather than decoding without word timings, when a
+    # faster-whisper upgrade moves the internals this module depends on
+    def mismatch(detail):
+        return RuntimeError(
+            f"faster-whisper {FASTER_WHISPER_VERSION} is incompatible with AligningWhisperModel "
+            f"(written against 1.2.1): {detail}"
+        )
+
+    for name, expected in _HOOKS.items():
+        method = getattr(WhisperModel, name, None)
+        if not callable(method):
+            raise mismatch(f"WhisperModel.{name} is missing")
+        params = list(inspect.signature(method).parameters)
+        if params != expected:
+            raise mismatch(f"WhisperModel.{name} takes {params}, expected {expected}")
+    generate_segments = inspect.getsource(WhisperModel.generate_segments)
+    for name in ("encode", "_split_segments_by_timestamps"):
+        if f"self.{name}(" not in generate_segments:
+            raise mismatch(f"generate_segments no longer calls self.{name}")
+
+
+_check_hooks()
+
+
+class AligningWhisperModel(WhisperModel):
+    # WhisperModel that can add word timestamps to a decode after the fact.
+    # transcribe_lazily decodes without them, keeping each window's encoder
+    # output and token split, and only runs the cross-attention alignment
+    # (add_word_timestamps) over those when the caller finds it needs word
+    # timings. Nothing is encoded or decoded twice.
+    #
+    # The split is captured by wrapping _split_segments_by_timestamps, which
+    # generate_segments calls once per window right after encoding it; that
+    # hook is specific to the pinned faster-whisper (1.2.1), so _check_hooks
+    # verifies it at import and _align checks each decode against it.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._capture = threading.local()  # Per inference worker
+
+    def encode(self, features):
+        encoder_output = super().encode(features)
+        if getattr(self._capture, "windows", None) is not None:
+            self._capture.encoder_output = encoder_output
+        return encoder_output
+
+    def _split_segments_by_timestamps(self, tokenizer, tokens, time_offset, segment_size, segment_duration, seek):
+        split = super()._split_segments_by_timestamps(
+            tokenizer=tokenizer,
+            tokens=tokens,
+            time_offset=time_offset,
+            segment_size=segment_size,
+            segment_duration=segment_duration,
+            seek=seek,
+        )
+        windows = getattr(self._capture, "windows", None)
+        if windows is not None:
+            windows.append((tokenizer, self._capture.encoder_output, segment_size, split[0]))
+        return split
+
+    def transcribe_lazily(self, audio, needs_alignment, vad_filter=False, vad_parameters=None, **options):
+        # Returns (segments, aligned): segments carry words only if
+        # needs_alignment(segments) said so for the plain decode.
+        # VAD runs here rather than in transcribe() so timestamps can be mapped
+        # back to the original audio after alignment as well.
+        speech_chunks = None
+        if vad_filter:
+            if isinstance(vad_parameters, dict):
+                vad_parameters = VadOptions(**vad_parameters)
+            speech_chunks = get_speech_timestamps(audio, vad_parameters or VadOptions())
+            audio = np.concatenate(collect_chunks(audio, speech_chunks)[0])
+
+        windows = self._capture.windows = []
+        try:
+            segments, _ = self.transcribe(audio, word_timestamps=False, **options)
+            segments = list(segments)  # Decoding happens while consuming the generator
+        finally:
+            self._capture.windows = None
+            self._capture.encoder_output = None
+
+        aligned = needs_alignment(segments)
+        if aligned:
+            segments = self._align(windows, segments, options)
+        if speech_chunks:
+            segments = list(restore_speech_timestamps(segments, speech_chunks, SAMPLE_RATE))
+        return segments, aligned
+
+    def _align(self, windows, segments, options):
+        # Same alignment transcribe(word_timestamps=True) does per window
+        last_speech_timestamp = 0.0
+        raw = {}
+        for tokenizer, encoder_output, segment_size, window_segments in windows:
+            if not window_segments:
+                continue
+            last_speech_timestamp = self.add_word_timestamps(
+                [window_segments],
+                tokenizer,
+                encoder_output,
+                segment_size,
+                options.get("prepend_punctuations", PREPEND_PUNCTUATIONS),
+                options.get("append_punctuations", APPEND_PUNCTUATIONS),
+                last_speech_timestamp=last_speech_timestamp,
+            )
+            # A yielded Segment shares its tokens list with the raw segment
+            raw.update((id(segment["tokens"]), segment) for segment in window_segments)
+
+        aligned = []
+        for s in segments:
+            segment = raw.get(id(s.tokens))
+            if segment is None:
+                # generate_segments copied the tokens, or skipped the split hook
+                raise RuntimeError(
+                    f"faster-whisper {FASTER_WHISPER_VERSION}: no captured window for segment "
+                    f"{s.id} ({s.start:.2f}-{s.end:.2f}s); the alignment hooks no longer match"
+                )
+            aligned.append(dataclasses.replace(
+                s,
+                start=segment["start"],
+                end=segment["end"],
+                words=[Word(**word) for word in segment["words"]],
+            ))
+        return aligned
@@ -0,0 +1,149 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from faster_whisper import decode_audio
+
+from model_registry import ModelRegistry
+from second_pass import (
+    SAMPLE_RATE,
+    SECOND_PASS_MODEL,
+    file_sha256,
+    transcribe_offline,
+    transcript_is_current,
+    transcript_path,
+    transcript_to_dict,
+    write_transcript,
+)
+
+# Offline re-transcription of a recordings directory, e.g.
+#   python server/batch_transcribe.py /app/recordings --workers 2
+# Files whose sidecar transcript already matches their content hash and the
+# model version are skipped, so an interrupted run picks up where it stopped.
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".ogg", ".opus", ".mp3", ".m4a")
+
+# Set once per worker process by _init_worker
+_model = None
+_model_name = None
+
+
+def find_audio(directory):
+    paths = [
+        entry.path
+        for entry in os.scandir(directory)
+        if entry.is_file() and entry.name.lower().endswith(AUDIO_EXTENSIONS)
+    ]
+    # Largest files first so one big file doesn't start last and hold up the run
+    return sorted(paths, key=os.path.getsize, reverse=True)
+
+
+def _init_worker(model_name, device, compute_type, replicas=1):
+    global _model, _model_name
+    logging.basicConfig(level=logging.INFO, format=f"[worker {os.getpid()}] %(message)s")
+    # Replicas of one model share its weights, so N threads on one instance
+    # hold a single copy where N processes hold N
+    _model = ModelRegistry().load(model_name, device=device, compute_type=compute_type, num_workers=replicas)
+    _model_name = model_name
+
+
+def _transcribe_file(audio_path, audio_sha256):
+    started = time.perf_counter()
+    segments, info = transcribe_offline(_model, decode_audio(audio_path, sampling_rate=SAMPLE_RATE))
+    segments = list(segments)  # Decoding happens while consuming the generator
+    transcript = transcript_to_dict(audio_path, _model_name, info, segments, audio_sha256)
+    write_transcript(transcript_path(audio_path), transcript)
+    return info.duration, time.perf_counter() - started
+
+
+def pending_files(paths, model_name, force):
+    # (path, sha256) for every file without a current transcript
+    with ThreadPoolExecutor() as pool:
+        hashes = list(pool.map(file_sha256, paths))
+    return [
+        (path, digest)
+        for path, digest in zip(paths, hashes)
+        if force or not transcript_is_current(path, digest, model_name)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-transcribe a directory of recordings into JSON sidecar transcripts.")
+    parser.add_argument("directory", nargs="?", default="/app/recordings")
+    parser.add_argument("--model", default=SECOND_PASS_MODEL or "small.en")
+    parser.add_argument("--workers", type=int, default=1, help="processes, each with its own model instance")
+    parser.add_argument(
+        "--shared-model", action="store_true",
+        help="run the workers as threads on one model instance (one copy of the weights in memory)",
+    )
+    parser.add_argument("--device", default="cuda")
+    parser.add_argument("--compute-type", default="float16")
+    parser.add_argument("--force", action="store_true", help="redo files that already have a current transcript")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    paths = find_audio(args.directory)
+    jobs = pending_files(paths, args.model, args.force)
+    logging.info(f"{len(paths)} recordings in {args.directory}, {len(paths) - len(jobs)} up to date, {len(jobs)} to transcribe")
+    if not jobs:
+        return 0
+
+    audio_seconds = 0.0
+    done = 0
+    failed = 0
+    started = time.perf_counter()
+    if args.shared_model:
+        _init_worker(args.model, args.device, args.compute_type, replicas=args.workers)
+        executor = ThreadPoolExecutor(max_workers=args.workers)
+    else:
+        # Checksums are verified here once rather than racing in every worker
+        ModelRegistry().resolve(args.model)
+        # spawn, not fork: CUDA can't be initialised in a forked child
+        executor = ProcessPoolExecutor(
+            max_workers=args.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(args.model, args.device, args.compute_type),
+        )
+    interrupted = False
+    try:
+        futures = {executor.submit(_transcribe_file, path, digest): path for path, digest in jobs}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                duration, elapsed = future.result()
+            except Exception as e:
+                failed += 1
+                logging.error(f"Failed {os.path.basename(path)}: {e}")
+                continue
+            done += 1
+            audio_seconds += duration
+            logging.info(
+                f"[{done + failed}/{len(jobs)}] {os.path.basename(path)}: "
+                f"{duration:.1f}s audio in {elapsed:.1f}s ({duration / max(elapsed, 1e-9):.1f}x)"
+            )
+    except KeyboardInterrupt:
+        # Finished transcripts are already on disk; the next run resumes from there
+        logging.warning("Interrupted, stopping workers")
+        interrupted = True
+        executor.shutdown(wait=False, cancel_futures=True)
+    else:
+        executor.shutdown()
+
+    wall_seconds = time.perf_counter() - started
+    logging.info(
+        f"Transcribed {done} files ({audio_seconds / 3600:.2f} h of audio) in {wall_seconds:.1f}s with "
+        f"{args.workers} worker(s): {audio_seconds / max(wall_seconds, 1e-9):.1f} audio-hours per wall-clock hour"
+        + (f", {failed} failed" if failed else "")
+    )
+    if interrupted:
+        return 130
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
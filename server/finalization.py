@@ -0,0 +1,269 @@
+import collections
+import itertools
+import re
+from collections import namedtuple
+
+import numpy as np
+
+# Split hierarchies
+STRONG_STOP = [".", "?", "!", "..."]
+SOFT_STOP = [",", ";", ":", "-"] # Commas allow splitting but with more patience
+
+# Split strength keyed on a word's last character (every stop above is a
+# suffix ending in one of these)
+STRONG = 2
+SOFT = 1
+SPLIT_STRENGTH = {**{p[-1]: SOFT for p in SOFT_STOP}, **{p[-1]: STRONG for p in STRONG_STOP}}
+HAS_STRONG_STOP = re.compile(r"[.?!]")
+
+# A sentence end followed by a segment starting with one of these is held
+# back. Matched as a prefix of the lowercased segment text.
+CONTINUATIONS = ["when", "and", "which", "but", "while", "that", "because", "the", "a"]
+CONTINUATION_RE = re.compile("|".join(CONTINUATIONS))
+
+# Whisper often hallucinates these single "politeness" words during silence gaps
+SINK_WORDS = frozenset(["please", "thanks", "thank you", "bye", "you", "it", "with", "the"])
+
+# A word followed by another this soon (seconds) is never a split point
+NEXT_WORD_GAP = 0.4
+# Cut this far past a split word so its tail isn't decoded again
+SPLIT_CUSHION = 0.05
+
+# What the stream does with its utterance buffer after a tick
+FORCED = "forced"  # Everything left was finalized; start a new utterance
+SPLIT = "split"  # Keep only the audio after split_at
+RESET = "reset"  # Drop a silent/stuck buffer without a final
+PARTIAL = "partial"  # Nothing final yet; text is the current partial
+
+# A final result. start_time is what the client gets (for word finals, the
+# start of the word that ended the sentence); span is the (start, end) stored
+# with it; words are (start, end, word, probability) on the stream clock.
+Final = namedtuple("Final", ["kind", "text", "start_time", "span", "words"])
+Decision = namedtuple("Decision", ["finals", "action", "text", "split_at", "silence", "window_words"])
+
+
+def is_confident(segment):
+    # Low-confidence segments are hallucinations
+    return not (segment.no_speech_prob > 0.8 or segment.avg_logprob < -1.0)
+
+
+class Finalizer:
+    # Per-stream finalization. Each tick gets the decoded segments of the
+    # current utterance window and decides which sentences become finals,
+    # whether the remainder is forced out, and what the stream keeps.
+    #
+    # Word-level splits are checked on NumPy arrays of the window's word
+    # timings: only words ending in punctuation with a gap behind them can
+    # split, so the sequential pass visits just those and slices the words
+    # in between.
+    def __init__(self):
+        # Session-wide speaking rate
+        self.total_words = 0
+        self.total_speech_seconds = 0.0
+        self.history = collections.deque(maxlen=5)  # Recent finals, for the prompt
+        # Stall tracking, in seconds since the utterance started
+        self.last_speech_text = ""
+        self.last_text_change_time = 0.0
+
+    @property
+    def wpm(self):
+        return (self.total_words / (self.total_speech_seconds / 60)) if self.total_speech_seconds > 5 else 150
+
+    def prompt(self):
+        # Contextual Prompting: Pass recent history to maintain quality
+        # More history helps with slow narrators
+        history_prompt = " ".join(self.history)[-500:].strip()
+        return f"I am transcribing live speech. Context: {history_prompt}" if history_prompt else "I am transcribing live speech."
+
+    def _thresholds(self, segments, total_duration, wpm):
+        # Calculate rough WPM from the window for heuristics
+        window_text = " ".join([s.text.strip() for s in segments if s.no_speech_prob < 0.4]).strip()
+        window_words = len(window_text.split())
+        has_strong_punctuation = window_text.endswith((".", "?", "!"))
+
+        # Dynamic Thresholds
+        if wpm > 180: # Fast (YouTube style)
+            base_required_silence = 0.6
+            stall_threshold = 1.0 if has_strong_punctuation else 1.4
+        elif wpm < 85: # Gothic Narrator (Wizard of Oz style)
+            # Deep patience for dramatic pauses
+            base_required_silence = 4.0
+            stall_threshold = 5.0 if has_strong_punctuation else 7.0
+        elif wpm < 110: # Narrator (Books)
+            base_required_silence = 2.5
+            stall_threshold = 3.0 if has_strong_punctuation else 4.0
+        elif wpm < 140: # Slow
+            base_required_silence = 1.5
+            stall_threshold = 2.0 if has_strong_punctuation else 2.8
+        else: # Normal
+            base_required_silence = 1.0
+            stall_threshold = 1.5 if has_strong_punctuation else 2.2
+
+        required_silence = base_required_silence
+        if has_strong_punctuation:
+            # If someone just said a period, we can be much snappier
+            required_silence = min(required_silence, 0.4 if wpm < 130 else 0.3)
+
+        if window_words > 15 or total_duration > 15.0:
+            required_silence = min(required_silence, 0.6)
+        return required_silence, stall_threshold, window_words
+
+    def _finalize(self, kind, text, start_time, span, words=()):
+        self.history.append(text)
+        return Final(kind, text, start_time, span, words)
+
+    def tick(self, segments, start_time, window_offset, total_duration, utterance_full, quiet_intervals):
+        # segments: one decode of the window starting window_offset seconds
+        # into the utterance; start_time is where the utterance starts on the
+        # stream clock and total_duration its length so far
+        wpm = self.wpm
+        required_silence, stall_threshold, window_words = self._thresholds(segments, total_duration, wpm)
+        offset = start_time + window_offset
+        finals = []
+        last_finalized_end_rel = 0.0
+
+        # --- Word-Level Incremental Finalization ---
+        # Flatten the words of every confident segment that has them. A
+        # segment's last word looks ahead to the next segment, even one
+        # filtered out here.
+        last = len(segments) - 1
+        word_segments = [i for i, s in enumerate(segments) if s.words and is_confident(s)]
+        words = [w for i in word_segments for w in segments[i].words]
+        texts = [w.word.strip() for w in words]
+        if words:
+            n = len(words)
+            ends = np.fromiter([w.end for w in words], np.float64, n)
+            next_start = np.empty(n)
+            next_start[:-1] = np.fromiter([w.start for w in words[1:]], np.float64, n - 1)
+            segment_ends = list(itertools.accumulate(len(segments[i].words) for i in word_segments))
+            next_start[[e - 1 for e in segment_ends]] = [segments[i + 1].start if i < last else np.inf for i in word_segments]
+            strength = np.fromiter([SPLIT_STRENGTH.get(t[-1], 0) if t else 0 for t in texts], np.int8, n)
+            # --- Contextual Split Protection ---
+            # Only punctuated words with no word IMMEDIATELY after them can split
+            candidates = np.flatnonzero((strength > 0) & ~(next_start - ends < NEXT_WORD_GAP)).tolist()
+            # Words kept in the current sentence before each position
+            kept = [0, *itertools.accumulate(map(bool, texts))]
+            absolute_last = n - 1 if word_segments[-1] == last else -1
+        else:
+            candidates = []
+        # Higher word count for narrators to keep paragraphs whole
+        min_words = 12 if wpm < 100 else 6
+
+        cut = 0  # First word of the current sentence
+        first = 0  # First word of the current segment
+        next_candidate = 0
+        all_speech_text_parts = []
+        for s_idx, s in enumerate(segments):
+            if not is_confident(s):
+                continue
+
+            if not s.words:
+                s_text = s.text.strip()
+                if not s_text: continue
+                if s_text.endswith(tuple(STRONG_STOP)):
+                    finals.append(self._finalize(
+                        "segment", s_text, offset + s.start, (offset + s.start, offset + s.end)
+                    ))
+                    last_finalized_end_rel = s.end
+                    self.total_words += len(s_text.split())
+                    self.total_speech_seconds += max(0.2, s.end - s.start)
+                else:
+                    all_speech_text_parts.append(s_text)
+                continue
+
+            end = first + len(s.words)
+            is_followed_by_continuation = s_idx < last and \
+                CONTINUATION_RE.match(segments[s_idx + 1].text.strip().lower()) is not None
+            while next_candidate < len(candidates) and candidates[next_candidate] < end:
+                j = candidates[next_candidate]
+                next_candidate += 1
+                sentence_words = kept[j + 1] - kept[cut]
+                is_too_short = sentence_words < min_words
+                w = words[j]
+                silence_at_edge = total_duration - (window_offset + w.end)
+                if strength[j] == STRONG:
+                    if j == absolute_last:
+                        # Edge word: require massive silence for narrators
+                        required = (2.5 if wpm < 100 else 1.5) if is_too_short else 0.8
+                        is_stop = silence_at_edge >= required
+                    else:
+                        # Mid-segment: inhibit split if it's followed by a continuation
+                        # or if it's too short
+                        is_stop = not (is_too_short or is_followed_by_continuation)
+                else:
+                    # Soft split (comma)
+                    is_stop = silence_at_edge >= (1.5 if j == absolute_last else 1.0)
+                if not is_stop:
+                    continue
+
+                timings = [
+                    (offset + v.start, offset + v.end, t, v.probability)
+                    for v, t in zip(words[cut:j + 1], texts[cut:j + 1]) if t
+                ]
+                finals.append(self._finalize(
+                    "word", " ".join(t[2] for t in timings), offset + w.start,
+                    (timings[0][0], timings[-1][1]), timings
+                ))
+                self.total_words += sentence_words
+                duration_finalized = w.end - (w.start if sentence_words == 1 else s.words[0].start)
+                self.total_speech_seconds += max(0.1, duration_finalized)
+                # Slicing cushion
+                last_finalized_end_rel = min(total_duration - window_offset, w.end + SPLIT_CUSHION)
+                cut = j + 1
+            first = end
+
+        # Remaining text for partial update or forced finalization
+        current_sentence_words = [t for t in texts[cut:] if t]
+        remaining_text = " ".join(current_sentence_words + all_speech_text_parts).strip()
+
+        # --- Force Finalization Check ---
+        latest_speech_timestamp_rel = 0.0
+        for s in segments:
+            if s.no_speech_prob < 0.4:
+                latest_speech_timestamp_rel = max(latest_speech_timestamp_rel, s.end)
+        total_silence = total_duration - (window_offset + latest_speech_timestamp_rel)
+
+        if remaining_text != self.last_speech_text:
+            self.last_speech_text = remaining_text
+            self.last_text_change_time = total_duration
+        total_stall = total_duration - self.last_text_change_time
+
+        # Fallback triggers (silence, stall, safety cap)
+        global_trigger = utterance_full or quiet_intervals >= 2
+        should_force_fallback = (total_silence >= required_silence) or \
+                               (total_stall >= stall_threshold and total_silence >= 0.4)
+
+        def decision(action, split_at=0.0):
+            return Decision(finals, action, remaining_text, split_at, total_silence, window_words)
+
+        if (global_trigger or should_force_fallback) and remaining_text:
+            # Anti-Hallucination Sink
+            remaining_words = remaining_text.split()
+            clean_text = remaining_text.lower().replace(".", "").replace("!", "").replace("?", "").strip()
+            is_hallucination = (len(remaining_words) == 1 and clean_text in SINK_WORDS)
+            is_junk = (len(remaining_words) < 3 and (not HAS_STRONG_STOP.search(remaining_text) or total_silence > 1.0)) or is_hallucination
+            if is_junk:
+                # Carry over, behind any sentence finalized above (otherwise
+                # its words are decoded and finalized again next tick)
+                if last_finalized_end_rel <= 0:
+                    return decision(None)
+            else:
+                # Finalize the entire remainder as one block
+                timings = [
+                    (offset + v.start, offset + v.end, t, v.probability)
+                    for v, t in zip(words[cut:], texts[cut:]) if t
+                ]
+                finals.append(Final("forced", remaining_text, offset, (offset, start_time + total_duration), timings))
+                self.last_speech_text = ""
+                self.last_text_change_time = total_duration
+                return decision(FORCED)
+        if last_finalized_end_rel > 0:
+            # Tail preservation based on last punctuation split
+            self.last_speech_text = ""
+            self.last_text_change_time = 0.0
+            return decision(SPLIT, window_offset + last_finalized_end_rel)
+        if global_trigger or quiet_intervals >= 10:
+            # Emergency Cleanup for silent/stuck buffers
+            self.last_speech_text = ""
+            return decision(RESET)
+        return decision(PARTIAL if remaining_text else None)
@@ -0,0 +1,112 @@
+import asyncio
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from functools import partial
+
+import metrics
+
+SAMPLE_RATE = 16000
+
+# Work priorities (lower runs first)
+LIVE = 0
+BACKGROUND = 1
+
+# The RTF reported as load drops to 0 this long after the last live decode
+LIVE_COOLDOWN_SECONDS = 2.0
+# Background steps wait while live decodes are queued, or while recent live
+# decodes used more than this share of real time
+BACKGROUND_MAX_RTF = float(os.environ.get("BACKGROUND_MAX_RTF", "0.5"))
+
+
+# Segments of one live decode plus where its time went, and whether they
+# carry word timestamps
+Decode = namedtuple("Decode", ["segments", "queue_wait", "decode_seconds", "aligned"])
+
+
+class InferenceScheduler:
+    # Runs blocking model calls on dedicated worker threads so the event loop
+    # keeps receiving audio, and tracks the load signals the server adapts to.
+    # Live decodes always jump ahead of queued background work. With no
+    # workers, calls run inline on the event loop instead, which keeps
+    # simulated streams deterministic.
+    def __init__(self, model, workers=1):
+        self.model = model
+        self.workers = workers
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self.in_flight = 0  # Live work submitted and not finished
+        self.rtf = 0.0
+        self.last_live_finished = 0.0
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"inference-{i}", daemon=True).start()
+
+    @property
+    def queue_depth(self):
+        # Submitted live decodes that are not running yet (inline runs one at a time)
+        return max(0, self.in_flight - max(self.workers, 1))
+
+    def recent_rtf(self):
+        # The smoothed RTF only updates on decodes; report 0 once live work stops
+        if self.in_flight or time.monotonic() - self.last_live_finished < LIVE_COOLDOWN_SECONDS:
+            return self.rtf
+        return 0.0
+
+    def live_busy(self):
+        # Live demand background work yields to
+        return self.queue_depth > 0 or self.recent_rtf() > BACKGROUND_MAX_RTF
+
+    def _worker(self):
+        while True:
+            _, _, fn, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+
+    async def run(self, fn, priority=LIVE):
+        if not self.workers:
+            return fn()
+        future = Future()
+        self._queue.put((priority, next(self._seq), fn, future))
+        return await asyncio.wrap_future(future)
+
+    def _run(self, model, audio, needs_alignment, options, submitted):
+        started = time.perf_counter()
+        if needs_alignment is None:
+            segments, _ = model.transcribe(audio, **options)
+            segments_list, aligned = list(segments), False  # Decoding happens while consuming the generator
+        else:
+            segments_list, aligned = model.transcribe_lazily(audio, needs_alignment, **options)
+        return Decode(segments_list, started - submitted, time.perf_counter() - started, aligned)
+
+    async def transcribe(self, audio, model=None, realtime_seconds=None, needs_alignment=None, **options):
+        # model: overrides the default model (per-stream model tiers).
+        # realtime_seconds: how much new audio this decode has to keep up with
+        # (the tick interval for live streams). Defaults to the audio length.
+        # needs_alignment: decode without word timestamps and add them only if
+        # this returns true for the segments (see alignment.py).
+        self.in_flight += 1
+        metrics.INFERENCE_QUEUE_DEPTH.set(self.queue_depth)
+        try:
+            decode = await self.run(partial(
+                self._run, model or self.model, audio, needs_alignment, options, time.perf_counter()
+            ))
+        finally:
+            self.in_flight -= 1
+            self.last_live_finished = time.monotonic()
+            metrics.INFERENCE_QUEUE_DEPTH.set(self.queue_depth)
+
+        if realtime_seconds is None:
+            realtime_seconds = len(audio) / SAMPLE_RATE
+        if realtime_seconds > 0:
+            rtf = decode.decode_seconds / realtime_seconds
+            self.rtf = rtf if self.rtf == 0.0 else 0.8 * self.rtf + 0.2 * rtf
+            metrics.INFERENCE_RTF.set(self.rtf)
+        return decode
@@ -0,0 +1,99 @@
+import os
+
+import metrics
+
+# Audio memory one stream may hold (bytes, 0 disables). A stream at the
+# default settings sits around 2 MiB: up to 30 s of utterance audio.
+STREAM_MEMORY_BUDGET = int(os.environ.get("STREAM_MEMORY_BUDGET_BYTES", str(8 << 20)))
+# Total across all streams (bytes, 0 disables), e.g. a share of the container limit
+MEMORY_BUDGET = int(os.environ.get("MEMORY_BUDGET_BYTES", "0"))
+# Under pressure, decode windows are capped at this length, and so are
+# utterances, so audio never slides out of the window before it is finalized
+PRESSURE_WINDOW_SECONDS = float(os.environ.get("MEMORY_PRESSURE_WINDOW_SECONDS", "6"))
+
+# What a stream holds
+UTTERANCE = "utterance"  # Audio since the last split
+INPUT = "input"  # Received audio waiting for the decode loop
+RECORDING = "recording"  # Audio queued for the recording encoder
+COMPONENTS = (UTTERANCE, INPUT, RECORDING)
+
+# Pressure steps, in the order they are taken
+NORMAL = 0
+SPILL = 1  # Recording audio goes to a spill file instead of memory
+DEGRADED = 2  # Also cap the decode window and utterance length
+PRESSURE_NAMES = ("normal", "spilling", "degraded")
+
+
+class StreamMemory:
+    # Byte counts for one stream, kept current by the decode loop
+    def __init__(self, budget):
+        self._budget = budget
+        self.parts = dict.fromkeys(COMPONENTS, 0)
+        self.peak = 0
+        self.pressure = NORMAL
+
+    @property
+    def total(self):
+        return sum(self.parts.values())
+
+    def set(self, component, nbytes):
+        self._budget.add(component, nbytes - self.parts[component])
+        self.parts[component] = nbytes
+        self.peak = max(self.peak, self.total)
+
+    def add(self, component, nbytes):
+        self.set(component, self.parts[component] + nbytes)
+
+    def over(self):
+        return self._budget.over(self)
+
+    def update_pressure(self):
+        # One step up per check while over budget (spilling frees recording
+        # memory, so only degrade if that wasn't enough); back to normal once
+        # the stream is under 3/4 of the budget again.
+        if self.over():
+            self._set_pressure(min(self.pressure + 1, DEGRADED))
+        elif self.pressure and not self._budget.over(self, 0.75):
+            self._set_pressure(NORMAL)
+        return self.pressure
+
+    def _set_pressure(self, pressure):
+        if pressure != self.pressure:
+            self._budget.pressured += (pressure > NORMAL) - (self.pressure > NORMAL)
+            metrics.MEMORY_PRESSURE_STREAMS.set(self._budget.pressured)
+            self.pressure = pressure
+
+    def close(self):
+        self._set_pressure(NORMAL)
+        for component in COMPONENTS:
+            self.set(component, 0)
+        self._budget.streams.discard(self)
+
+
+class MemoryBudget:
+    # Server-wide view: per-component totals (exported as metrics) and the
+    # per-stream and global limits
+    def __init__(self, stream_budget=STREAM_MEMORY_BUDGET, budget=MEMORY_BUDGET):
+        self.stream_budget = stream_budget
+        self.budget = budget
+        self.totals = dict.fromkeys(COMPONENTS, 0)
+        self.streams = set()
+        self.pressured = 0
+        metrics.STREAM_MEMORY_MAX_BYTES.set_function(lambda: max((s.total for s in self.streams), default=0))
+
+    @property
+    def total(self):
+        return sum(self.totals.values())
+
+    def open(self):
+        stream = StreamMemory(self)
+        self.streams.add(stream)
+        return stream
+
+    def add(self, component, delta):
+        self.totals[component] += delta
+        metrics.STREAM_MEMORY_BYTES.labels(component).set(self.totals[component])
+
+    def over(self, stream, fraction=1.0):
+        return (self.stream_budget > 0 and stream.total > self.stream_budget * fraction) or \
+            (self.budget > 0 and self.total > self.budget * fraction)
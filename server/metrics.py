@@ -0,0 +1,52 @@
+import logging
+import os
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Streams
+ACTIVE_STREAMS = Gauge("whisper_active_streams", "Open StreamTranscription calls")
+SUBSCRIBERS = Gauge("whisper_subscribers", "Listeners attached to live sessions via Subscribe")
+
+# Inference load
+INFERENCE_QUEUE_DEPTH = Gauge("whisper_inference_queue_depth", "Decodes waiting for an inference worker")
+INFERENCE_RTF = Gauge("whisper_inference_rtf", "Smoothed decode time per second of new audio")
+
+# Quality ladder
+QUALITY_LEVEL = Gauge("whisper_quality_level", "Index of the decode quality level in use (0 = cheapest)")
+
+# Stream lag / catch-up
+STREAM_LAG_SECONDS = Histogram(
+    "whisper_stream_lag_seconds",
+    "Wall-clock delay between receiving audio and its decode tick",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0),
+)
+SKIPPED_TICKS = Counter("whisper_skipped_ticks_total", "Partial decode ticks skipped to catch up with live audio")
+
+# Stream memory (see memory.py)
+STREAM_MEMORY_BYTES = Gauge("whisper_stream_memory_bytes", "Audio memory held by open streams", ["component"])
+STREAM_MEMORY_MAX_BYTES = Gauge("whisper_stream_memory_max_bytes", "Memory held by the largest open stream")
+MEMORY_PRESSURE_STREAMS = Gauge("whisper_memory_pressure_streams", "Streams spilling or degraded to stay within the memory budget")
+
+# Recording storage
+RECORDING_BYTES_WRITTEN = Counter("whisper_recording_bytes_written_total", "Encoded recording bytes written", ["codec"])
+RECORDING_BYTES_STORED = Gauge("whisper_recording_bytes_stored", "Bytes held in the recordings directory after retention")
+RECORDING_SPILLED_BYTES = Counter("whisper_recording_spilled_bytes_total", "Recording audio queued through a spill file instead of memory")
+RECORDINGS_EVICTED = Counter("whisper_recordings_evicted_total", "Recordings deleted by the retention policy")
+
+# Transcript store
+TRANSCRIPT_STORE_PENDING = Gauge("whisper_transcript_store_pending", "Transcript writes queued but not yet committed")
+TRANSCRIPT_STORE_BATCHES = Counter("whisper_transcript_store_batches_total", "Transactions committed by the transcript store")
+TRANSCRIPT_STORE_ROWS = Counter("whisper_transcript_store_rows_total", "Rows written by the transcript store")
+
+# Transcript search
+INDEXED_WORDS = Gauge("whisper_indexed_words", "Words held in the in-memory transcript index")
+SEARCH_SECONDS = Histogram(
+    "whisper_search_seconds", "Transcript index query time",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+
+
+def start_metrics_server():
+    port = int(os.environ.get("METRICS_PORT", "9100"))
+    start_http_server(port)
+    logging.info(f"Metrics exported on :{port}/metrics")
@@ -0,0 +1,208 @@
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from faster_whisper import WhisperModel
+from faster_whisper.utils import download_model
+
+# Converted CTranslate2 Whisper models, one directory per model name, e.g.
+#   python server/model_registry.py fetch tiny.en small.en
+# Each directory carries a checksums.sha256 manifest (sha256sum format).
+# Models found here load straight from disk without touching the Hugging Face
+# hub, so a populated directory starts fast and works offline.
+MODELS_DIR = os.environ.get("MODELS_DIR", "/app/models")
+# Refuse to fall back to the hub for models that aren't in MODELS_DIR
+MODELS_OFFLINE = os.environ.get("MODELS_OFFLINE", "0") == "1"
+
+MANIFEST = "checksums.sha256"
+# (size, mtime_ns, sha256) of each file as of its last successful check, so
+# later startups only stat files instead of hashing them again
+STAMPS = ".verified.json"
+# Files a Whisper model can't load without
+REQUIRED_FILES = ("model.bin", "config.json")
+
+
+def sha256_file(path):
+    # Hashed through a read-only mapping, straight from the page cache (which
+    # also warms it for the load that follows). hashlib releases the GIL on
+    # large buffers, so files hash in parallel.
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+
+def model_files(model_dir):
+    # Everything but the manifest and hidden bookkeeping (stamps, hub metadata)
+    return sorted(
+        entry.name for entry in os.scandir(model_dir)
+        if entry.is_file() and entry.name != MANIFEST and not entry.name.startswith(".")
+    )
+
+
+def read_manifest(model_dir):
+    manifest = {}
+    with open(os.path.join(model_dir, MANIFEST)) as f:
+        for line in f:
+            if line.strip():
+                digest, name = line.split(maxsplit=1)
+                manifest[name.strip().lstrip("*")] = digest.lower()
+    return manifest
+
+
+def write_manifest(model_dir):
+    files = model_files(model_dir)
+    with ThreadPoolExecutor() as pool:
+        digests = list(pool.map(lambda name: sha256_file(os.path.join(model_dir, name)), files))
+    with open(os.path.join(model_dir, MANIFEST + ".part"), "w") as f:
+        for name, digest in zip(files, digests):
+            f.write(f"{digest}  {name}\n")
+    os.replace(os.path.join(model_dir, MANIFEST + ".part"), os.path.join(model_dir, MANIFEST))
+    return dict(zip(files, digests))
+
+
+class ModelRegistry:
+    # Resolves model names to verified local directories and loads them.
+    # Verification runs once per process and model; across restarts, files
+    # whose size and mtime still match their stamp are not hashed again.
+    def __init__(self, directory=MODELS_DIR, offline=MODELS_OFFLINE):
+        self.directory = directory
+        self.offline = offline
+        self._verified = set()
+
+    def model_dir(self, name):
+        # Hub ids like "Systran/faster-whisper-small" become one directory
+        return os.path.join(self.directory, name.replace("/", "--"))
+
+    def names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            entry.name.replace("--", "/") for entry in os.scandir(self.directory)
+            if entry.is_dir() and os.path.exists(os.path.join(entry.path, MANIFEST))
+        )
+
+    def _read_stamps(self, model_dir):
+        try:
+            with open(os.path.join(model_dir, STAMPS)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_stamps(self, model_dir, stamps):
+        try:
+            with open(os.path.join(model_dir, STAMPS + ".part"), "w") as f:
+                json.dump(stamps, f)
+            os.replace(os.path.join(model_dir, STAMPS + ".part"), os.path.join(model_dir, STAMPS))
+        except OSError as e:
+            # Read-only mount: still verified, just hashed again next start
+            logging.info(f"Could not record verified checksums in {model_dir}: {e}")
+
+    def verify(self, name):
+        # Raises RuntimeError if the model's files don't match its manifest
+        model_dir = self.model_dir(name)
+        try:
+            manifest = read_manifest(model_dir)
+        except FileNotFoundError:
+            raise RuntimeError(
+                f"Model {name} in {model_dir} has no {MANIFEST}; "
+                f"create it with: python server/model_registry.py manifest {name}"
+            ) from None
+        missing = [f for f in REQUIRED_FILES if f not in manifest]
+        if missing:
+            raise RuntimeError(f"Model {name}: {MANIFEST} does not cover {', '.join(missing)}")
+
+        stamps = self._read_stamps(model_dir)
+        stale = {}
+        for file, digest in manifest.items():
+            try:
+                stat = os.stat(os.path.join(model_dir, file))
+            except FileNotFoundError:
+                raise RuntimeError(f"Model {name}: {file} is missing from {model_dir}") from None
+            stamp = [stat.st_size, stat.st_mtime_ns, digest]
+            if stamps.get(file) != stamp:
+                stale[file] = stamp
+
+        if stale:
+            started = time.perf_counter()
+            with ThreadPoolExecutor() as pool:
+                digests = pool.map(lambda file: sha256_file(os.path.join(model_dir, file)), stale)
+                corrupt = [file for file, digest in zip(stale, digests) if digest != manifest[file]]
+            if corrupt:
+                raise RuntimeError(f"Model {name}: checksum mismatch for {', '.join(corrupt)} in {model_dir}")
+            stamps.update(stale)
+            self._write_stamps(model_dir, stamps)
+            size = sum(stamp[0] for stamp in stale.values())
+            logging.info(
+                f"Verified {name}: {len(stale)} file(s), {size / 2**20:.0f} MiB in {time.perf_counter() - started:.1f}s"
+            )
+        self._verified.add(name)
+        return model_dir
+
+    def resolve(self, name):
+        # Local directory for a model, verified on first use; otherwise the
+        # name itself, which faster-whisper looks up on the hub
+        model_dir = self.model_dir(name)
+        if os.path.isdir(model_dir):
+            return model_dir if name in self._verified else self.verify(name)
+        if self.offline:
+            raise RuntimeError(f"Model {name} is not in {self.directory} and MODELS_OFFLINE is set")
+        logging.warning(f"Model {name} is not in {self.directory}; resolving it through the Hugging Face hub")
+        return name
+
+    def load(self, name, model_class=WhisperModel, **kwargs):
+        # kwargs go to the model class (device, compute_type, num_workers, ...)
+        path = self.resolve(name)
+        started = time.perf_counter()
+        model = model_class(path, **kwargs)
+        logging.info(f"Loaded model {name} from {path} in {time.perf_counter() - started:.1f}s")
+        return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local Whisper model directory.")
+    parser.add_argument("--dir", default=MODELS_DIR, help="models directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fetch = commands.add_parser("fetch", help="download converted models from the hub and checksum them")
+    fetch.add_argument("names", nargs="+")
+    manifest = commands.add_parser("manifest", help="(re)write the checksum manifest of a model directory")
+    manifest.add_argument("names", nargs="+")
+    verify = commands.add_parser("verify", help="check models against their manifests (all by default)")
+    verify.add_argument("names", nargs="*")
+    commands.add_parser("list", help="show models in the directory")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    registry = ModelRegistry(args.dir)
+    if args.command == "list":
+        for name in registry.names():
+            model_dir = registry.model_dir(name)
+            size = sum(os.path.getsize(os.path.join(model_dir, f)) for f in model_files(model_dir))
+            print(f"{name:<40} {size / 2**20:8.0f} MiB  {model_dir}")
+        return 0
+
+    failed = 0
+    for name in args.names or registry.names():
+        model_dir = registry.model_dir(name)
+        try:
+            if args.command == "fetch":
+                download_model(name, output_dir=model_dir)
+            if args.command in ("fetch", "manifest"):
+                files = write_manifest(model_dir)
+                logging.info(f"Wrote {MANIFEST} for {name} ({len(files)} files)")
+            registry.verify(name)
+        except Exception as e:
+            failed += 1
+            logging.error(f"{name}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
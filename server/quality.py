@@ -0,0 +1,90 @@
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+import metrics
+
+# faster-whisper's default temperature schedule (retry hotter on bad decodes)
+FALLBACK_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+
+
+@dataclass(frozen=True)
+class QualityLevel:
+    name: str
+    beam_size: int
+    window_duration: float
+    word_timestamps: bool
+    temperature_fallback: bool
+
+    @property
+    def temperature(self):
+        return FALLBACK_TEMPERATURES if self.temperature_fallback else 0.0
+
+
+# Cheapest first. "standard" matches the original fixed settings.
+QUALITY_LEVELS = [
+    QualityLevel("minimal", beam_size=1, window_duration=6.0, word_timestamps=False, temperature_fallback=False),
+    QualityLevel("fast", beam_size=1, window_duration=9.0, word_timestamps=True, temperature_fallback=False),
+    QualityLevel("standard", beam_size=1, window_duration=12.0, word_timestamps=True, temperature_fallback=True),
+    QualityLevel("accurate", beam_size=3, window_duration=16.0, word_timestamps=True, temperature_fallback=True),
+    QualityLevel("best", beam_size=5, window_duration=20.0, word_timestamps=True, temperature_fallback=True),
+]
+
+# Hysteresis: step down quickly when overloaded, step up only after load has
+# stayed low for a while, with a gap between the two RTF thresholds.
+STEP_DOWN_QUEUE_DEPTH = int(os.environ.get("QUALITY_STEP_DOWN_QUEUE_DEPTH", "2"))
+STEP_DOWN_RTF = float(os.environ.get("QUALITY_STEP_DOWN_RTF", "0.8"))
+STEP_UP_RTF = float(os.environ.get("QUALITY_STEP_UP_RTF", "0.3"))
+STEP_DOWN_HOLD_SECONDS = 2.0
+STEP_UP_HOLD_SECONDS = 15.0
+
+
+def level_index(name):
+    for i, level in enumerate(QUALITY_LEVELS):
+        if level.name == name:
+            return i
+    raise ValueError(f"Unknown quality level: {name}")
+
+
+class QualityLadder:
+    # Picks decode parameters per tick from global inference load.
+    def __init__(self, scheduler, start_level="standard", adaptive=True):
+        self.scheduler = scheduler
+        self.adaptive = adaptive
+        self.index = level_index(start_level)
+        self._last_change = time.monotonic()
+        metrics.QUALITY_LEVEL.set(self.index)
+
+    @property
+    def current(self):
+        return QUALITY_LEVELS[self.index]
+
+    @property
+    def next_down(self):
+        # The level the next select() may step down to
+        return QUALITY_LEVELS[self.index - 1] if self.adaptive and self.index > 0 else self.current
+
+    def select(self):
+        if self.adaptive:
+            self._update()
+        return QUALITY_LEVELS[self.index]
+
+    def _update(self):
+        held = time.monotonic() - self._last_change
+        depth = self.scheduler.queue_depth
+        rtf = self.scheduler.rtf
+
+        overloaded = depth >= STEP_DOWN_QUEUE_DEPTH or rtf >= STEP_DOWN_RTF
+        idle = depth == 0 and rtf <= STEP_UP_RTF
+
+        if overloaded and self.index > 0 and held >= STEP_DOWN_HOLD_SECONDS:
+            self._move(-1, f"queue={depth}, rtf={rtf:.2f}")
+        elif idle and self.index < len(QUALITY_LEVELS) - 1 and held >= STEP_UP_HOLD_SECONDS:
+            self._move(1, f"queue={depth}, rtf={rtf:.2f}")
+
+    def _move(self, step, reason):
+        self.index += step
+        self._last_change = time.monotonic()
+        metrics.QUALITY_LEVEL.set(self.index)
+        logging.info(f"Quality level -> {QUALITY_LEVELS[self.index].name} ({reason})")
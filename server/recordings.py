@@ -0,0 +1,338 @@
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+from datetime import datetime
+
+import av
+import numpy as np
+
+import metrics
+
+RECORDINGS_DIR = os.environ.get("RECORDINGS_DIR", "/app/recordings")
+# flac (lossless), opus (lossy, ~10x smaller than WAV at speech bitrates) or wav
+RECORDING_CODEC = os.environ.get("RECORDING_CODEC", "flac")
+OPUS_BITRATE = int(os.environ.get("RECORDING_OPUS_BITRATE", "24000"))
+# Retention: 0 disables either limit. Oldest recordings go first.
+MAX_AGE_DAYS = float(os.environ.get("RECORDING_MAX_AGE_DAYS", "0"))
+MAX_TOTAL_BYTES = int(os.environ.get("RECORDING_MAX_TOTAL_BYTES", "0"))
+# Age limits also apply while no new recordings are being written
+RETENTION_INTERVAL_SECONDS = 3600
+
+SAMPLE_RATE = 16000
+
+# codec -> (container format, encoder, file extension)
+CODECS = {
+    "flac": ("flac", "flac", ".flac"),
+    "opus": ("ogg", "libopus", ".opus"),
+    "wav": ("wav", "pcm_s16le", ".wav"),
+}
+RECORDING_EXTENSIONS = tuple(ext for _, _, ext in CODECS.values())
+
+# Waveform peak pyramid, written next to each recording as <name>.peaks so the
+# UI can draw it without downloading and decoding the audio. Level k holds one
+# (min, max) int8 pair per PEAKS_BASE_SAMPLES * PEAKS_FACTOR**k samples; the
+# client reads this layout in client/peaks.py.
+PEAKS_EXTENSION = ".peaks"
+PEAKS_MAGIC = b"PEAK"
+PEAKS_VERSION = 1
+# magic, version, levels, base samples per peak, factor, sample rate, samples
+PEAKS_HEADER = struct.Struct("<4sBBHHII")
+PEAKS_BASE_SAMPLES = 256  # 16 ms
+PEAKS_FACTOR = 4
+PEAKS_LEVELS = 6  # Coarsest is ~16 s per peak
+
+# Raw float32 audio waiting for the encoder while a writer is spilling
+SPILL_EXTENSION = ".spill"
+
+# Serialises retention passes from concurrent writers
+_retention_lock = threading.Lock()
+
+
+def peaks_path(recording_path):
+    return os.path.splitext(recording_path)[0] + PEAKS_EXTENSION
+
+
+class PeakBuilder:
+    # Accumulates finest-level peaks as audio arrives; the coarser levels are
+    # derived from them once the length is known
+    def __init__(self):
+        self._blocks = []
+        self._remainder = np.zeros(0, dtype=np.float32)
+
+    def add(self, chunk):
+        samples = np.concatenate((self._remainder, chunk)) if len(self._remainder) else chunk
+        whole = len(samples) - len(samples) % PEAKS_BASE_SAMPLES
+        if whole:
+            self._blocks.append(self._peaks(samples[:whole].reshape(-1, PEAKS_BASE_SAMPLES)))
+        self._remainder = samples[whole:]
+
+    @staticmethod
+    def _peaks(blocks):
+        quantized = np.clip(np.round(blocks * 127), -127, 127).astype(np.int8)
+        return np.stack((quantized.min(axis=1), quantized.max(axis=1)), axis=1)
+
+    def levels(self):
+        blocks = list(self._blocks)
+        if len(self._remainder):
+            blocks.append(self._peaks(self._remainder.reshape(1, -1)))
+        level = np.concatenate(blocks) if blocks else np.zeros((0, 2), dtype=np.int8)
+        levels = [level]
+        for _ in range(1, PEAKS_LEVELS):
+            pad = -len(level) % PEAKS_FACTOR
+            if pad:  # Repeat the last peak so the partial group keeps its extremes
+                level = np.concatenate((level, np.repeat(level[-1:], pad, axis=0)))
+            groups = level.reshape(-1, PEAKS_FACTOR, 2)
+            level = np.stack((groups[:, :, 0].min(axis=1), groups[:, :, 1].max(axis=1)), axis=1)
+            levels.append(level)
+        return levels
+
+
+def write_peaks(path, levels, samples):
+    with open(path + ".part", "wb") as f:
+        f.write(PEAKS_HEADER.pack(
+            PEAKS_MAGIC, PEAKS_VERSION, len(levels), PEAKS_BASE_SAMPLES, PEAKS_FACTOR, SAMPLE_RATE, samples
+        ))
+        for level in levels:
+            f.write(level.tobytes())
+    os.replace(path + ".part", path)
+
+
+def backfill_peaks(directory=RECORDINGS_DIR):
+    # Recordings saved before peaks existed (or copied in) get them decoded once
+    if not os.path.isdir(directory):
+        return
+    written = 0
+    for entry in os.scandir(directory):
+        if not (entry.name.startswith("recording_") and entry.name.endswith(RECORDING_EXTENSIONS)):
+            continue
+        if os.path.exists(peaks_path(entry.path)):
+            continue
+        try:
+            builder = PeakBuilder()
+            samples = 0
+            resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+            with av.open(entry.path) as container:
+                # A None frame flushes the resampler
+                for frame in itertools.chain(container.decode(audio=0), [None]):
+                    for resampled in resampler.resample(frame):
+                        chunk = resampled.to_ndarray().reshape(-1)
+                        builder.add(chunk)
+                        samples += len(chunk)
+            write_peaks(peaks_path(entry.path), builder.levels(), samples)
+            written += 1
+        except Exception as e:
+            logging.error(f"Could not compute peaks for {entry.name}: {e}")
+    if written:
+        logging.info(f"Computed waveform peaks for {written} existing recordings")
+
+
+def new_recording_path(directory, extension):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(directory, f"recording_{timestamp}{extension}")
+    n = 1
+    while os.path.exists(path) or os.path.exists(path + ".part"):
+        path = os.path.join(directory, f"recording_{timestamp}_{n}{extension}")
+        n += 1
+    return path
+
+
+class RecordingWriter:
+    # Encodes one stream's audio to disk on its own thread as it arrives, so
+    # neither a growing in-memory buffer nor the encode touches the event
+    # loop. The file is written as <name>.part and renamed once complete.
+    # While spilling, the thread moves queued audio to a raw <name>.spill
+    # file before each encode step instead of keeping it in memory, so a slow
+    # encoder can't grow the process.
+    def __init__(self, directory=RECORDINGS_DIR, codec=RECORDING_CODEC):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown recording codec {codec!r}, expected one of {sorted(CODECS)}")
+        self.codec = codec
+        self.format, self.encoder, extension = CODECS[codec]
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = new_recording_path(directory, extension)
+        self.samples = 0
+        self.bytes_written = 0
+        # Audio bytes handed to the writer / no longer held in memory by it
+        # (encoded or spilled). Each is only written by one side, so their
+        # difference is safe to read.
+        self.queued_bytes = 0
+        self.released_bytes = 0
+        self.spilling = False
+        self.closed = concurrent.futures.Future()
+        self._peaks = PeakBuilder()
+        self._chunks = queue.SimpleQueue()
+        # Placeholder so concurrent writers don't pick the same name
+        open(self.path + ".part", "wb").close()
+        threading.Thread(target=self._run, name=f"recording-{os.path.basename(self.path)}", daemon=True).start()
+
+    @property
+    def pending_bytes(self):
+        return self.queued_bytes - self.released_bytes
+
+    def spill(self, enabled):
+        self.spilling = enabled
+
+    def write(self, chunk):
+        # chunk: float32 samples at 16 kHz
+        self.samples += len(chunk)
+        self.queued_bytes += chunk.nbytes
+        self._chunks.put(chunk)
+
+    def close(self):
+        # Resolves `closed` with the final path (None if nothing was recorded)
+        self._chunks.put(None)
+        return self.closed
+
+    def _open(self):
+        container = av.open(self.path + ".part", "w", format=self.format)
+        stream = container.add_stream(self.encoder, rate=SAMPLE_RATE, layout="mono")
+        if self.codec == "opus":
+            stream.bit_rate = OPUS_BITRATE
+        return container, stream
+
+    def _mux(self, container, stream, frame):
+        for packet in stream.encode(frame):
+            container.mux(packet)
+            self.bytes_written += packet.size
+            metrics.RECORDING_BYTES_WRITTEN.labels(self.codec).inc(packet.size)
+
+    def _run(self):
+        part_path = self.path + ".part"
+        spill_path = self.path + SPILL_EXTENSION
+        spill_writer = spill_reader = None
+        # Audio taken off the queue, in order: arrays in memory, or sample
+        # counts to read back from the spill file
+        backlog = collections.deque()
+        finished = False
+        try:
+            container, stream = self._open()
+            try:
+                while backlog or not finished:
+                    # Take everything waiting, blocking only with nothing to encode
+                    while not finished:
+                        try:
+                            chunk = self._chunks.get(block=not backlog)
+                        except queue.Empty:
+                            break
+                        if chunk is None:
+                            finished = True
+                        elif self.spilling:
+                            if spill_writer is None:
+                                spill_writer = open(spill_path, "wb")
+                            data = np.asarray(chunk, dtype=np.float32).tobytes()
+                            spill_writer.write(data)
+                            self.released_bytes += chunk.nbytes
+                            metrics.RECORDING_SPILLED_BYTES.inc(len(data))
+                            backlog.append(len(chunk))
+                        else:
+                            backlog.append(chunk)
+                    if not backlog:
+                        continue
+                    chunk = backlog.popleft()
+                    if isinstance(chunk, int):
+                        if spill_reader is None:
+                            spill_reader = open(spill_path, "rb")
+                        spill_writer.flush()
+                        chunk = np.frombuffer(spill_reader.read(chunk * 4), dtype=np.float32)
+                    else:
+                        self.released_bytes += chunk.nbytes
+                    pcm = (np.clip(chunk, -1.0, 1.0) * 32767).astype(np.int16)
+                    frame = av.AudioFrame.from_ndarray(pcm.reshape(1, -1), format="s16", layout="mono")
+                    frame.sample_rate = SAMPLE_RATE
+                    self._mux(container, stream, frame)
+                    self._peaks.add(chunk)
+                self._mux(container, stream, None)  # Flush the encoder
+            finally:
+                container.close()
+                for f in (spill_writer, spill_reader):
+                    if f is not None:
+                        f.close()
+                if os.path.exists(spill_path):
+                    os.remove(spill_path)
+            if self.samples == 0:
+                os.remove(part_path)
+                self.closed.set_result(None)
+                return
+            # Peaks first, so a finished recording always has them
+            write_peaks(peaks_path(self.path), self._peaks.levels(), self.samples)
+            os.replace(part_path, self.path)
+            logging.info(
+                f"Saved {self.samples / SAMPLE_RATE:.2f}s of audio to {self.path} "
+                f"({os.path.getsize(self.path) / 1024:.0f} KiB {self.codec}, WAV would be {self.samples * 2 / 1024:.0f} KiB)"
+            )
+        except Exception as e:
+            logging.error(f"Failed to save recording {self.path}: {e}")
+            for path in (part_path, peaks_path(self.path), spill_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.closed.set_exception(e)
+            return
+        self.closed.set_result(self.path)
+        # The recording is saved whatever retention does, and is never the one evicted
+        try:
+            enforce_retention(self.directory, keep=self.path)
+        except Exception as e:
+            logging.error(f"Retention pass failed: {e}")
+
+
+def _recordings(directory):
+    # (mtime, total bytes, paths) per recording, counting its sidecar files
+    groups = {}
+    if not os.path.isdir(directory):
+        return []
+    for entry in os.scandir(directory):
+        if not entry.is_file() or not entry.name.startswith("recording_"):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            # Renamed or removed by another recording's writer since the scan
+            continue
+        base = entry.name.split(".", 1)[0]
+        mtime, size, paths = groups.get(base, (None, 0, []))
+        if entry.name.endswith(RECORDING_EXTENSIONS):
+            mtime = stat.st_mtime
+        groups[base] = (mtime, size + stat.st_size, paths + [entry.path])
+    # Skip in-progress recordings, which only have a .part file so far
+    return sorted(g for g in groups.values() if g[0] is not None)
+
+
+def enforce_retention(directory=RECORDINGS_DIR, max_age_days=MAX_AGE_DAYS, max_total_bytes=MAX_TOTAL_BYTES, keep=None):
+    # Deletes recordings (with their transcripts) older than max_age_days,
+    # then the oldest ones until the rest fit in max_total_bytes. keep: a
+    # recording path that is counted but never deleted (one just saved).
+    with _retention_lock:
+        recordings = _recordings(directory)
+        total = sum(size for _, size, _ in recordings)
+        cutoff = time.time() - max_age_days * 86400
+        for mtime, size, paths in recordings:
+            expired = max_age_days > 0 and mtime < cutoff
+            over_budget = max_total_bytes > 0 and total > max_total_bytes
+            if not (expired or over_budget) or keep in paths:
+                continue
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            metrics.RECORDINGS_EVICTED.inc()
+            logging.info(f"Retention removed {os.path.basename(paths[0])} ({size / 1024:.0f} KiB)")
+        metrics.RECORDING_BYTES_STORED.set(total)
+
+
+async def run_retention(interval=RETENTION_INTERVAL_SECONDS):
+    while True:
+        try:
+            await asyncio.to_thread(enforce_retention)
+        except Exception as e:
+            logging.error(f"Retention pass failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+import faster_whisper
+from faster_whisper import decode_audio
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from inference import BACKGROUND
+
+SAMPLE_RATE = 16000
+
+# Larger model for the offline pass. Empty disables second-pass jobs.
+SECOND_PASS_MODEL = os.environ.get("SECOND_PASS_MODEL", "small.en")
+# Recordings waiting for the pass; past this, new ones are left to
+# batch_transcribe.py
+SECOND_PASS_MAX_PENDING = int(os.environ.get("SECOND_PASS_MAX_PENDING", "1000"))
+IDLE_POLL_SECONDS = 0.5
+
+# Full-context decode used for every offline transcript
+OFFLINE_OPTIONS = dict(
+    beam_size=5,
+    word_timestamps=True,
+    condition_on_previous_text=True,
+)
+# Speech is decoded in windows of at most this long, cut at pauses, so one
+# background step holds the inference worker for a bounded time
+OFFLINE_WINDOW_SECONDS = float(os.environ.get("SECOND_PASS_WINDOW_SECONDS", "10"))
+# Bump when OFFLINE_OPTIONS or the transcript layout change, so existing
+# transcripts are treated as stale (the window length is part of the version)
+TRANSCRIPT_VERSION = 2
+
+
+def speech_clips(audio):
+    # VAD speech regions split at pauses to OFFLINE_WINDOW_SECONDS, as
+    # transcribe(clip_timestamps=...) takes them
+    chunks = get_speech_timestamps(audio, VadOptions(max_speech_duration_s=OFFLINE_WINDOW_SECONDS))
+    # No speech: one empty clip, rather than [] which means the whole file
+    return [t for c in chunks for t in (c["start"] / SAMPLE_RATE, c["end"] / SAMPLE_RATE)] or [0.0, 0.0]
+
+
+def transcribe_offline(model, audio):
+    # Lazy, like transcribe(): each next() decodes at most one window
+    return model.transcribe(audio, clip_timestamps=speech_clips(audio), **OFFLINE_OPTIONS)
+
+
+def transcript_path(audio_path):
+    return os.path.splitext(audio_path)[0] + ".transcript.json"
+
+
+def model_version(model_name):
+    # Identifies everything that changes a transcript besides the audio itself
+    return f"{model_name}/faster-whisper-{faster_whisper.__version__}/v{TRANSCRIPT_VERSION}/w{OFFLINE_WINDOW_SECONDS:g}"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def transcript_is_current(audio_path, audio_sha256, model_name):
+    # True if the sidecar transcript was made from this exact audio by this model
+    try:
+        with open(transcript_path(audio_path)) as f:
+            transcript = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return transcript.get("sha256") == audio_sha256 and transcript.get("model_version") == model_version(model_name)
+
+
+def transcript_to_dict(audio_path, model_name, info, segments, audio_sha256=None):
+    return {
+        "audio": os.path.basename(audio_path),
+        "sha256": audio_sha256 or file_sha256(audio_path),
+        "model": model_name,
+        "model_version": model_version(model_name),
+        "language": info.language,
+        "duration": info.duration,
+        "text": " ".join(s.text.strip() for s in segments).strip(),
+        "segments": [
+            {
+                "start": s.start,
+                "end": s.end,
+                "text": s.text.strip(),
+                "words": [
+                    {"start": w.start, "end": w.end, "word": w.word.strip(), "probability": w.probability}
+                    for w in (s.words or [])
+                ],
+            }
+            for s in segments
+        ],
+    }
+
+
+def write_transcript(path, transcript):
+    # Write to a temp file first so readers never see a half-written transcript
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(transcript, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class SecondPassQueue:
+    # Re-transcribes finished recordings with a larger model and full-context
+    # decoding. Each step decodes one window of at most OFFLINE_WINDOW_SECONDS
+    # at BACKGROUND priority, and only starts while the scheduler has live
+    # headroom (InferenceScheduler.live_busy), so a live tick waits for at most
+    # one short window.
+    def __init__(self, scheduler, get_model, model_name=SECOND_PASS_MODEL, max_pending=SECOND_PASS_MAX_PENDING):
+        self.scheduler = scheduler
+        self.get_model = get_model
+        self.model_name = model_name
+        self._jobs = asyncio.Queue(maxsize=max_pending)
+        self._task = None
+
+    @property
+    def enabled(self):
+        return bool(self.model_name)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, audio_path):
+        if not self.enabled:
+            return
+        try:
+            self._jobs.put_nowait(audio_path)
+        except asyncio.QueueFull:
+            logging.warning(f"Second pass backlog full ({self._jobs.maxsize}); leaving {audio_path} to batch_transcribe.py")
+
+    async def _wait_for_headroom(self):
+        while self.scheduler.live_busy():
+            await asyncio.sleep(IDLE_POLL_SECONDS)
+
+    async def _step(self, fn):
+        await self._wait_for_headroom()
+        return await self.scheduler.run(fn, priority=BACKGROUND)
+
+    async def _run(self):
+        while True:
+            audio_path = await self._jobs.get()
+            try:
+                await self._process(audio_path)
+            except Exception as e:
+                logging.error(f"Second pass failed for {audio_path}: {e}")
+
+    async def _process(self, audio_path):
+        started = time.perf_counter()
+        model = await self.get_model(self.model_name)
+        audio = await asyncio.to_thread(decode_audio, audio_path, sampling_rate=SAMPLE_RATE)
+
+        # VAD and the features of the whole recording are computed before
+        # transcribe() returns, all on the CPU; keep that off the inference
+        # worker so it never holds up a live decode
+        await self._wait_for_headroom()
+        segments_gen, info = await asyncio.to_thread(transcribe_offline, model, audio)
+
+        # The generator decodes lazily, one window per segment batch
+        segments = []
+        while True:
+            segment = await self._step(lambda: next(segments_gen, None))
+            if segment is None:
+                break
+            segments.append(segment)
+
+        output_path = transcript_path(audio_path)
+        transcript = await asyncio.to_thread(transcript_to_dict, audio_path, self.model_name, info, segments)
+        await asyncio.to_thread(write_transcript, output_path, transcript)
+        logging.info(f"Second pass ({self.model_name}) wrote {output_path} in {time.perf_counter() - started:.1f}s")
@@ -3,20 +3,52 @@ import logging
 from signal import SIGINT, SIGTERM
 
 import grpc
-from protos import transcription_pb2_grpc
+from grpc_health.v1 import health, health_pb2, health_pb2_grpc
+from protos import transcription_pb2, transcription_pb2_grpc
+from metrics import start_metrics_server
+from recordings import backfill_peaks, run_retention
 from transcriber import WhisperTranscriber
 
 async def serve():
     port = "50051"
-    server = grpc.aio.server()
-    transcription_pb2_grpc.add_WhisperTranscriberServicer_to_server(WhisperTranscriber(), server)
+    server = grpc.aio.server(options=[
+        # Allow the bridge's pooled channels to keep idle connections alive
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.min_ping_interval_without_data_ms", 10000),
+        ("grpc.http2.max_pings_without_data", 0),
+    ])
+    transcriber = WhisperTranscriber()
+    transcriber.second_pass.start()
+    await transcriber.load_index()
+    await transcriber.store.start()
+    transcription_pb2_grpc.add_WhisperTranscriberServicer_to_server(transcriber, server)
+    # Standard gRPC health checks, for orchestrators and probes; NOT_SERVING
+    # from the start of a drain
+    health_servicer = health.aio.HealthServicer()
+    health_pb2_grpc.add_HealthServicer_to_server(health_servicer, server)
+    for service in ("", transcription_pb2.DESCRIPTOR.services_by_name["WhisperTranscriber"].full_name):
+        await health_servicer.set(service, health_pb2.HealthCheckResponse.SERVING)
     server.add_insecure_port("[::]:" + port)
     await server.start()
     print(f"Server started on {port}", flush=True)
+    start_metrics_server()
+    retention = asyncio.create_task(run_retention())
+    peaks = asyncio.create_task(asyncio.to_thread(backfill_peaks))
 
     async def server_graceful_shutdown():
-        print("Starting graceful shutdown...")
+        if transcriber.draining:
+            # A second signal skips the rest of the drain
+            print("Stopping immediately...", flush=True)
+            await server.stop(0)
+            return
+        # Rolling restarts: stop taking streams, let open ones finish their
+        # current utterance (see WhisperTranscriber.drain), then flush
+        # recordings and transcripts before exiting
+        print("Starting graceful shutdown...", flush=True)
+        await health_servicer.enter_graceful_shutdown()
+        await transcriber.drain()
         await server.stop(5)
+        await transcriber.store.close()
 
     loop = asyncio.get_running_loop()
     for signal in (SIGINT, SIGTERM):
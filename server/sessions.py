@@ -0,0 +1,182 @@
+import asyncio
+import collections
+import logging
+import os
+import secrets
+import time
+import uuid
+
+import metrics
+
+# Finals replayed to a subscriber that joins mid-session
+SNAPSHOT_FINALS = int(os.environ.get("SUBSCRIBE_SNAPSHOT_FINALS", "50"))
+# Finals a subscriber may fall behind by before it is cut off
+SUBSCRIBER_MAX_FINALS = int(os.environ.get("SUBSCRIBER_MAX_FINALS", "200"))
+# How long a dropped stream's state is kept for the client to resume it
+RESUME_GRACE_SECONDS = float(os.environ.get("SESSION_RESUME_GRACE_SECONDS", "30"))
+
+
+class Subscriber:
+    # Bounded per-listener queue. A queued partial is replaced by anything
+    # newer; finals are kept until the listener falls SUBSCRIBER_MAX_FINALS
+    # behind, at which point it is closed and can re-subscribe for a snapshot.
+    def __init__(self, max_finals=SUBSCRIBER_MAX_FINALS):
+        self.max_finals = max_finals
+        self.overflowed = False
+        self._queue = collections.deque()
+        self._finals = 0
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def put(self, result):
+        if self._closed:
+            return
+        if self._queue and not self._queue[-1].is_final:
+            self._queue.pop()
+        self._queue.append(result)
+        if result.is_final:
+            self._finals += 1
+            if self._finals > self.max_finals:
+                self.overflowed = True
+                self.close()
+        self._ready.set()
+
+    def close(self):
+        self._closed = True
+        self._ready.set()
+
+    async def results(self):
+        # Can be iterated again after an earlier iteration was closed; a
+        # result interrupted mid-delivery is kept for the next one.
+        while True:
+            if self.overflowed:
+                return
+            while self._queue:
+                result = self._queue.popleft()
+                if result.is_final:
+                    self._finals -= 1
+                try:
+                    yield result
+                except GeneratorExit:
+                    self._queue.appendleft(result)
+                    if result.is_final:
+                        self._finals += 1
+                    raise
+            if self._closed:
+                return
+            await self._ready.wait()
+            self._ready.clear()
+
+
+class LiveSession:
+    # One inference stream, fanned out to any number of listeners. The decode
+    # loop reads audio from `input` and outlives the connection that feeds it:
+    # if that connection drops, the session is detached and waits
+    # RESUME_GRACE_SECONDS for a stream presenting `token` to take over.
+    def __init__(self, session_id):
+        self.id = session_id
+        self.token = secrets.token_urlsafe(24)
+        self.recent_finals = collections.deque(maxlen=SNAPSHOT_FINALS)
+        self.latest_partial = None
+        self.subscribers = set()
+
+        # Audio in: (monotonic, wall time, AudioChunk) items, None at the end
+        self.input = asyncio.Queue()
+        self.bytes_received = 0
+        self.ended = False
+        # Ended by a server drain rather than by the client
+        self.drained = False
+        # Audio bytes the decode loop took off input, set once it finishes
+        self.bytes_consumed = 0
+        # Results out to the client feeding the audio; survives reattachment
+        self.owner = Subscriber()
+        self.attached = False
+        # The decode loop's task, set by whoever starts it
+        self.task = None
+        self._expiry = None
+
+    def feed(self, chunk):
+        self.bytes_received += len(chunk.data)
+        self.input.put_nowait((time.monotonic(), time.time(), chunk))
+
+    def end(self):
+        # No more audio: the decode loop flushes and finishes
+        if not self.ended:
+            self.ended = True
+            self.input.put_nowait(None)
+
+    def attach(self):
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        self.attached = True
+
+    def detach(self, grace=RESUME_GRACE_SECONDS):
+        self.attached = False
+        if self.ended:
+            return
+        if grace <= 0:
+            self.end()
+            return
+        logging.info(f"Session {self.id} detached, resumable for {grace:.0f}s at byte {self.bytes_received}")
+        self._expiry = asyncio.get_running_loop().call_later(grace, self.end)
+
+    def publish(self, result):
+        if result.is_final:
+            self.recent_finals.append(result)
+            self.latest_partial = None
+        else:
+            self.latest_partial = result
+        self.owner.put(result)
+        for subscriber in list(self.subscribers):
+            subscriber.put(result)
+
+    def subscribe(self):
+        subscriber = Subscriber()
+        for result in self.recent_finals:
+            subscriber.put(result)
+        if self.latest_partial is not None:
+            subscriber.put(self.latest_partial)
+        self.subscribers.add(subscriber)
+        metrics.SUBSCRIBERS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.discard(subscriber)
+            metrics.SUBSCRIBERS.dec()
+
+    def close(self):
+        if self._expiry is not None:
+            self._expiry.cancel()
+        self.owner.close()
+        for subscriber in self.subscribers:
+            subscriber.close()
+
+
+class SessionRegistry:
+    def __init__(self):
+        self._sessions = {}
+        self._tokens = {}
+
+    def create(self):
+        session = LiveSession(uuid.uuid4().hex)
+        self._sessions[session.id] = session
+        self._tokens[session.token] = session
+        return session
+
+    def get(self, session_id):
+        return self._sessions.get(session_id)
+
+    def resume(self, token):
+        return self._tokens.get(token)
+
+    def live(self):
+        return list(self._sessions.values())
+
+    def close(self, session):
+        self._sessions.pop(session.id, None)
+        self._tokens.pop(session.token, None)
+        session.close()
+        if session.subscribers:
+            logging.info(f"Session {session.id} ended with {len(session.subscribers)} subscriber(s)")
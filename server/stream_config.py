@@ -0,0 +1,72 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import memory
+from protos import transcription_pb2
+from quality import QUALITY_LEVELS
+
+DEFAULT_MODEL = os.environ.get("WHISPER_MODEL", "tiny.en")
+
+# Model names behind each tier. Tiers left unset fall back to the default model.
+MODEL_TIERS = {
+    transcription_pb2.MODEL_TIER_DEFAULT: DEFAULT_MODEL,
+    transcription_pb2.MODEL_TIER_FAST: os.environ.get("MODEL_TIER_FAST", DEFAULT_MODEL),
+    transcription_pb2.MODEL_TIER_BALANCED: os.environ.get("MODEL_TIER_BALANCED", DEFAULT_MODEL),
+    transcription_pb2.MODEL_TIER_ACCURATE: os.environ.get("MODEL_TIER_ACCURATE", DEFAULT_MODEL),
+}
+
+MIN_TICK_INTERVAL = 0.25
+MAX_TICK_INTERVAL = 10.0
+MIN_WINDOW_DURATION = 2.0
+MAX_WINDOW_DURATION = 30.0
+
+
+@dataclass
+class StreamSettings:
+    model: str = DEFAULT_MODEL
+    language: Optional[str] = None
+    tick_interval: float = 1.0
+    window_duration: Optional[float] = None  # None: follow the quality ladder
+    partials: bool = True
+    encoding: int = transcription_pb2.AUDIO_ENCODING_F32LE
+    sample_rate: Optional[int] = None  # None: each chunk's own rate
+
+    @classmethod
+    def from_proto(cls, config):
+        # Raises ValueError for settings the server can't honour.
+        settings = cls()
+        if config.model_tier not in MODEL_TIERS:
+            raise ValueError(f"Unknown model tier: {config.model_tier}")
+        settings.model = MODEL_TIERS[config.model_tier]
+        settings.language = config.language or None
+
+        if config.tick_interval:
+            if not MIN_TICK_INTERVAL <= config.tick_interval <= MAX_TICK_INTERVAL:
+                raise ValueError(f"tick_interval must be {MIN_TICK_INTERVAL}-{MAX_TICK_INTERVAL}s")
+            settings.tick_interval = config.tick_interval
+        if config.window_duration:
+            if not MIN_WINDOW_DURATION <= config.window_duration <= MAX_WINDOW_DURATION:
+                raise ValueError(f"window_duration must be {MIN_WINDOW_DURATION}-{MAX_WINDOW_DURATION}s")
+            settings.window_duration = config.window_duration
+        # Each decode has to cover the audio since the previous one, so a tick
+        # can't be longer than any window the stream may get: its own, or the
+        # ladder's and memory pressure's smallest
+        if settings.window_duration is not None and settings.window_duration < settings.tick_interval:
+            raise ValueError("window_duration must be at least tick_interval")
+        smallest_window = min(
+            settings.window_duration or min(level.window_duration for level in QUALITY_LEVELS),
+            memory.PRESSURE_WINDOW_SECONDS,
+        )
+        settings.tick_interval = min(settings.tick_interval, smallest_window)
+
+        if config.HasField("partials"):
+            settings.partials = config.partials
+        if config.encoding not in (transcription_pb2.AUDIO_ENCODING_F32LE, transcription_pb2.AUDIO_ENCODING_S16LE):
+            raise ValueError(f"Unsupported encoding: {config.encoding}")
+        settings.encoding = config.encoding
+        if config.sample_rate < 0:
+            raise ValueError("sample_rate must be positive")
+        if config.sample_rate:
+            settings.sample_rate = config.sample_rate
+        return settings
@@ -1,25 +1,305 @@
+import asyncio
 import logging
-import wave
+import os
+import time
+from contextlib import aclosing
 import numpy as np
-from faster_whisper import WhisperModel
 
 import grpc
 from protos import transcription_pb2
 from protos import transcription_pb2_grpc
+import metrics
+import memory
+import finalization
+from finalization import SPLIT_STRENGTH, Finalizer
+from inference import InferenceScheduler
+from alignment import AligningWhisperModel
+from model_registry import ModelRegistry
+from quality import QualityLadder
+from recordings import RecordingWriter
+from second_pass import SecondPassQueue
+from sessions import SessionRegistry
+from stream_config import DEFAULT_MODEL, StreamSettings
+from transcript_index import TranscriptIndex
+from transcript_store import TRANSCRIPT_DB, TranscriptStore
+
+# Catch-up: once a tick is this far behind the wall clock and newer audio is
+# already queued, its partial decode is skipped in favour of the newest window.
+CATCHUP_LAG_SECONDS = float(os.environ.get("CATCHUP_LAG_SECONDS", "1.5"))
+
+# See receive_chunks
+HALF_CLOSE_SETTLE_SECONDS = 0.2
+
+# While draining, streams end at their next utterance boundary; whatever is
+# still buffered this long after the drain started is forced out as a final
+DRAIN_DEADLINE_SECONDS = float(os.environ.get("DRAIN_DEADLINE_SECONDS", "30"))
+
+
+def needs_word_alignment(segments_list):
+    # Word timings are only consulted to split after a word that ends in stop
+    # punctuation (see Finalizer), so a window without one never needs the
+    # alignment pass. Hyphens and decimal points inside a word ("real-time",
+    # "3.5") can't split. Forced fallback and partials work from segment
+    # text/timings alone.
+    for s in segments_list:
+        if s.no_speech_prob > 0.8 or s.avg_logprob < -1.0:
+            continue
+        if any(word[-1] in SPLIT_STRENGTH for word in s.text.split()):
+            return True
+    return False
+
+
+async def receive_chunks(requests, session):
+    # Pull chunks off the wire as they arrive so a slow decode doesn't hide
+    # how far behind the stream is. A clean half-close ends the session; a
+    # dropped connection just stops feeding it, so it can be resumed.
+    # Returns an error message if the client broke the protocol.
+    async for request in requests:
+        if request.HasField("config"):
+            session.end()
+            return "StreamConfig must be the first message"
+        session.feed(request.audio)
+    # gRPC ends the request stream the same way when the client drops, but
+    # then cancels the handler (and this task) right after. Only a stream
+    # that is still alive once this settles was a real half-close.
+    await asyncio.sleep(HALF_CLOSE_SETTLE_SECONDS)
+    session.end()
+
 
 class WhisperTranscriber(transcription_pb2_grpc.WhisperTranscriberServicer):
-    def __init__(self):
-        # Try to use GPU if available, otherwise fallback to CPU
+    def __init__(self, model=None, inference_workers=1):
+        # model: a preloaded stand-in for the default model (see
+        # benchmarks/simulate_stream.py); otherwise it is loaded on CUDA
+        # Models come from the local registry when it has them
+        self.registry = ModelRegistry()
+        if model is not None:
+            self.model = model
+        else:
+            try:
+                logging.info("Attempting to initialize Whisper model on CUDA (float16)...")
+                self.model = self.registry.load(
+                    DEFAULT_MODEL, model_class=AligningWhisperModel, device="cuda", compute_type="float16"
+                )
+                logging.info("Whisper model initialized on CUDA.")
+            except Exception as e:
+                logging.error(f"CUDA initialization failed: {e}. Exiting.")
+                exit(1)
+
+        # Other model tiers are loaded on first use
+        self.models = {DEFAULT_MODEL: self.model}
+        self._model_loads = {}
+
+        self.scheduler = InferenceScheduler(self.model, workers=inference_workers)
+        self.quality = QualityLadder(
+            self.scheduler,
+            start_level=os.environ.get("QUALITY_LEVEL", "standard"),
+            adaptive=os.environ.get("QUALITY_ADAPTIVE", "1") == "1",
+        )
+
+        # Finished recordings are re-transcribed in the background
+        self.second_pass = SecondPassQueue(self.scheduler, self._get_model)
+        # Finals are also kept in SQLite, linked to their recordings
+        self.store = TranscriptStore()
+        # Searchable in memory; rebuilt from the store at startup
+        self.index = TranscriptIndex()
+
+        self.active_streams = 0
+        self.sessions = SessionRegistry()
+        # Per-stream and global memory accounting (see memory.py)
+        self.memory = memory.MemoryBudget()
+        # Shutdown: no new streams once draining (see drain)
+        self.draining = False
+        self.drain_deadline = None
+        # Recordings still being finished by their writer threads
+        self._closing_recordings = set()
+
+    async def _get_model(self, name):
+        if name in self.models:
+            return self.models[name]
+        if name not in self._model_loads:
+            logging.info(f"Loading model {name} on CUDA (float16)...")
+            loop = asyncio.get_running_loop()
+            self._model_loads[name] = loop.run_in_executor(
+                None,
+                lambda: self.registry.load(name, model_class=AligningWhisperModel, device="cuda", compute_type="float16"),
+            )
+        try:
+            model = await self._model_loads[name]
+        except Exception:
+            self._model_loads.pop(name, None)
+            raise
+        self.models[name] = model
+        return model
+
+    async def _decode(self, model, audio, initial_prompt, level, settings, realtime_seconds):
+        # Word timestamps are added from the same decode when the finalizer can use them
+        return await self.scheduler.transcribe(
+            audio,
+            model=model,
+            realtime_seconds=realtime_seconds,
+            needs_alignment=needs_word_alignment if level.word_timestamps else None,
+            language=settings.language,
+            beam_size=level.beam_size,
+            temperature=level.temperature,
+            vad_filter=True,
+            vad_parameters=dict(min_silence_duration_ms=500, speech_pad_ms=200),
+            no_speech_threshold=0.6,
+            log_prob_threshold=-0.5,
+            compression_ratio_threshold=2.4,
+            condition_on_previous_text=False,
+            initial_prompt=initial_prompt
+        )
+
+    @staticmethod
+    def _window_duration(settings, level, pressure):
+        window_duration = settings.window_duration or level.window_duration
+        if pressure == memory.DEGRADED:
+            window_duration = min(window_duration, memory.PRESSURE_WINDOW_SECONDS)
+        return window_duration
+
+    def _record_final(self, session_id, start_time, end_time, text, kind, words=()):
+        self.store.add_segment(session_id, start_time, end_time, text, kind, words)
+        self.index.add_segment(session_id, start_time, text, words)
+
+    async def load_index(self):
+        if TRANSCRIPT_DB:
+            await asyncio.to_thread(self.index.load, TRANSCRIPT_DB)
+
+    async def drain(self, deadline=DRAIN_DEADLINE_SECONDS):
+        # Graceful shutdown: refuse new streams, let the open ones end at
+        # their next utterance boundary (forcing out what's left at the
+        # deadline), then wait for their recordings to be written
+        self.draining = True
+        self.drain_deadline = time.monotonic() + deadline
+        tasks = [session.task for session in self.sessions.live() if session.task is not None]
+        logging.info(f"Draining {len(tasks)} stream(s), deadline {deadline:g}s")
+        # Streams check the deadline as audio arrives; idle ones are woken by
+        # ending their input
+        timer = asyncio.get_running_loop().call_later(deadline, self._expire_drain)
+        try:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            timer.cancel()
+        if self._closing_recordings:
+            logging.info(f"Waiting for {len(self._closing_recordings)} recording(s) to be written")
+            await asyncio.gather(
+                *(asyncio.wrap_future(closed) for closed in list(self._closing_recordings)), return_exceptions=True
+            )
+        logging.info("Drain complete")
+
+    def _expire_drain(self):
+        for session in self.sessions.live():
+            if not session.ended:
+                session.drained = True
+                session.end()
+
+    async def Search(self, request, context):
+        started = time.perf_counter()
+        total, hits = self.index.search(request.query, request.limit or 50)
+        metrics.SEARCH_SECONDS.observe(time.perf_counter() - started)
+        return transcription_pb2.SearchResponse(
+            hits=[transcription_pb2.SearchHit(**hit) for hit in hits], total=total
+        )
+
+    async def GetLoad(self, request, context):
+        return transcription_pb2.LoadReport(
+            active_streams=self.active_streams,
+            queue_depth=self.scheduler.queue_depth,
+            rtf=self.scheduler.recent_rtf(),
+            quality_level=self.quality.index,
+            memory_bytes=self.memory.total,
+            draining=self.draining,
+        )
+
+    async def Subscribe(self, request, context):
+        session = self.sessions.get(request.session_id)
+        if session is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, f"No live session {request.session_id}")
+        subscriber = session.subscribe()
         try:
-            logging.info("Attempting to initialize Whisper model on CUDA (float16)...")
-            self.model = WhisperModel("tiny.en", device="cuda", compute_type="float16")
-            logging.info("Whisper model initialized on CUDA.")
-        except Exception as e:
-            logging.error(f"CUDA initialization failed: {e}. Exiting.")
-            exit(1)
+            async for result in subscriber.results():
+                yield result
+            if subscriber.overflowed:
+                await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Subscriber fell too far behind")
+        finally:
+            session.unsubscribe(subscriber)
+
+    async def _open_session(self, first, context):
+        # A new session from the leading StreamConfig (if any), or an existing
+        # one when the config carries a resume token
+        config = first.config if first is not None and first.HasField("config") else None
+        if config is not None and config.resume_token:
+            session = self.sessions.resume(config.resume_token)
+            if session is None or session.ended:
+                await context.abort(grpc.StatusCode.NOT_FOUND, "Session expired or unknown")
+            if session.attached:
+                await context.abort(grpc.StatusCode.ABORTED, "Session is still attached to another stream")
+            logging.info(f"Resuming session {session.id} at byte {session.bytes_received}")
+            return session
+
+        if self.draining:
+            await context.abort(grpc.StatusCode.UNAVAILABLE, "Server is draining")
+        settings = StreamSettings()
+        model = self.model
+        if config is not None:
+            try:
+                settings = StreamSettings.from_proto(config)
+            except ValueError as e:
+                await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+            try:
+                model = await self._get_model(settings.model)
+            except Exception as e:
+                logging.error(f"Failed to load model {settings.model}: {e}")
+                await context.abort(grpc.StatusCode.UNAVAILABLE, f"Model {settings.model} unavailable")
+            logging.info(f"Stream config: {settings}")
+
+        session = self.sessions.create()
+        if first is not None and config is None:
+            session.feed(first.audio)
+        elif first is None:
+            session.end()
+        session.task = asyncio.create_task(self._run_session(session, settings, model))
+        return session
+
+    async def _run_session(self, session, settings, model):
+        # Every result goes to the session's owner and subscribers
+        try:
+            async for result in self._transcribe_stream(session, settings, model):
+                session.publish(result)
+        finally:
+            self.sessions.close(session)
 
     async def StreamTranscription(self, request_iterator, context):
+        requests = aiter(request_iterator)
+        session = await self._open_session(await anext(requests, None), context)
+        session.attach()
+        receiver = asyncio.create_task(receive_chunks(requests, session))
+        try:
+            yield transcription_pb2.TranscriptionResult(
+                session_id=session.id, resume_token=session.token, resume_offset=session.bytes_received
+            )
+            # Closed before detaching, so an undelivered result waits for the next attachment
+            async with aclosing(session.owner.results()) as results:
+                async for result in results:
+                    yield result
+            if receiver.done() and not receiver.cancelled() and receiver.result():
+                await context.abort(grpc.StatusCode.INVALID_ARGUMENT, receiver.result())
+            if session.owner.overflowed:
+                await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Client fell too far behind")
+            if session.drained:
+                # Ended by the server, not the client: the client starts a new
+                # session elsewhere with the audio this one never got to
+                yield transcription_pb2.TranscriptionResult(drained=True, resume_offset=session.bytes_consumed)
+                await context.abort(grpc.StatusCode.UNAVAILABLE, "Server is draining")
+        finally:
+            receiver.cancel()
+            session.detach()
+
+    async def _transcribe_stream(self, session, settings, model):
         logging.info("Started new transcription stream")
+        self.active_streams += 1
+        metrics.ACTIVE_STREAMS.set(self.active_streams)
+        self.store.session_started(session.id, settings.model, settings.language)
         
         # Audio state
         utterance_buffer = []  # Audio for current growing utterance
@@ -28,80 +308,157 @@ class WhisperTranscriber(transcription_pb2_grpc.WhisperTranscriberServicer):
         
         # Stream timing
         samples_per_second = 16000
-        transcribe_interval_samples = 16000  # Strict 1s cooldown
+        transcribe_interval_samples = int(settings.tick_interval * samples_per_second)
         # Max duration per utterance before forcing a split (samples)
         # 30 seconds is the optimal Whisper window size
         max_utterance_samples = 30 * samples_per_second
 
         # Transcription state
         absolute_start_time = 0.0
-        last_speech_text = ""
-        last_text_change_time = 0.0
-        transcription_history = []  # List of finalized strings
+        finalizer = Finalizer()
         
-        # WPM tracking (session-wide)
-        total_words_finalized = 0
-        total_speech_seconds = 0.0
-        
-        recording_buffer = []
+        # Encoded to disk as it arrives (see recordings.py)
+        recording = None
         target_sample_rate = 16000
         
         # Volume threshold for gating (RMS).
         AMPLITUDE_THRESHOLD = 0.005 # Back to a middle ground to filter out noise floor
         consecutive_quiet_intervals = 0
+        # Audio at the end of the buffer that must be quiet for a drain to stop there
+        edge_samples = int(finalization.NEXT_WORD_GAP * samples_per_second)
+
+        # Lazy alignment stats (decode ticks vs ticks that needed word timings)
+        decode_ticks = 0
+        aligned_ticks = 0
+        decode_seconds = 0.0
+
+        # Catch-up state
+        chunk_queue = session.input
+        samples_since_last_decode = 0
+        skipped_ticks = 0
+        max_lag = 0.0
+
+        # Memory accounting and budget state
+        usage = self.memory.open()
+        bytes_consumed = 0
+        pressure = memory.NORMAL
+        utterance_limit = max_utterance_samples
 
         try:
-            async for chunk in request_iterator:
-                # 1. Process received audio - explicitly Little Endian Float32
-                received_data = np.frombuffer(chunk.data, dtype='<f4')
-                received_rate = chunk.sample_rate if chunk.sample_rate > 0 else target_sample_rate
+            while True:
+                item = await chunk_queue.get()
+                # Past the drain deadline, one last tick forces out whatever
+                # is buffered, this chunk included; audio still queued behind
+                # it is left to the client to resend (see StreamTranscription)
+                flush = self.draining and time.monotonic() >= self.drain_deadline
+                if flush and item is not None:
+                    logging.warning(f"Drain deadline passed with {chunk_queue.qsize()} chunk(s) undecoded")
+                    session.drained = True
+                if item is None:
+                    if not flush or samples_in_utterance == 0:
+                        break
+                    received_at, received_wall = time.monotonic(), time.time()
+                else:
+                    received_at, received_wall, chunk = item
+                    bytes_consumed += len(chunk.data)
+
+                    # 1. Process received audio - explicitly Little Endian (Float32 unless configured)
+                    if settings.encoding == transcription_pb2.AUDIO_ENCODING_S16LE:
+                        received_data = np.frombuffer(chunk.data, dtype='<i2').astype(np.float32) / 32768.0
+                    else:
+                        received_data = np.frombuffer(chunk.data, dtype='<f4')
+                    # The stream's configured rate wins; 16kHz if neither says
+                    received_rate = settings.sample_rate or (chunk.sample_rate if chunk.sample_rate > 0 else target_sample_rate)
                 
-                if received_rate != target_sample_rate:
-                    # Log once or periodically to avoid spamming if resampling is still happening
-                    if samples_in_utterance == 0:
-                        logging.warning(f"Resampling required: Received {received_rate}Hz, target {target_sample_rate}Hz. This may cause crackling.")
+                    if received_rate != target_sample_rate:
+                        # Log once or periodically to avoid spamming if resampling is still happening
+                        if samples_in_utterance == 0:
+                            logging.warning(f"Resampling required: Received {received_rate}Hz, target {target_sample_rate}Hz. This may cause crackling.")
                     
-                    duration = len(received_data) / received_rate
-                    target_len = int(duration * target_sample_rate)
-                    x = np.arange(len(received_data))
-                    x_new = np.linspace(0, len(received_data) - 1, target_len)
-                    audio_chunk = np.interp(x_new, x, received_data).astype(np.float32)
-                else:
-                    audio_chunk = received_data
+                        duration = len(received_data) / received_rate
+                        target_len = int(duration * target_sample_rate)
+                        x = np.arange(len(received_data))
+                        x_new = np.linspace(0, len(received_data) - 1, target_len)
+                        audio_chunk = np.interp(x_new, x, received_data).astype(np.float32)
+                    else:
+                        audio_chunk = received_data
 
-                utterance_buffer.append(audio_chunk)
-                recording_buffer.append(audio_chunk)
-                samples_in_utterance += len(audio_chunk)
-                samples_since_last_transcribe += len(audio_chunk)
+                    utterance_buffer.append(audio_chunk)
+                    if recording is None:
+                        recording = RecordingWriter()
+                        self.index.set_recording(session.id, recording.path)
+                    recording.write(audio_chunk)
+                    samples_in_utterance += len(audio_chunk)
+                    samples_since_last_transcribe += len(audio_chunk)
+                    samples_since_last_decode += len(audio_chunk)
+                    usage.set(memory.INPUT, session.bytes_received - bytes_consumed)
+                    usage.set(memory.UTTERANCE, samples_in_utterance * audio_chunk.itemsize)
+                    usage.set(memory.RECORDING, recording.pending_bytes)
 
                 # Check for updates strictly every 1.0s
-                if samples_since_last_transcribe >= transcribe_interval_samples:
+                if flush or samples_since_last_transcribe >= transcribe_interval_samples:
                     samples_since_last_transcribe = 0 # Reset cooldown
+
+                    # --- Memory Budget ---
+                    # Over budget, recording audio spills to disk first; if that
+                    # isn't enough, windows and utterances get shorter.
+                    if usage.update_pressure() != pressure:
+                        pressure = usage.pressure
+                        logging.warning(
+                            f"Memory pressure -> {memory.PRESSURE_NAMES[pressure]} "
+                            f"(stream {usage.total / 2**20:.1f} MiB, all streams {self.memory.total / 2**20:.1f} MiB)"
+                        )
+                        recording.spill(pressure >= memory.SPILL)
+                        utterance_limit = max_utterance_samples if pressure < memory.DEGRADED \
+                            else int(memory.PRESSURE_WINDOW_SECONDS * samples_per_second)
+
+                    # Decode parameters follow global load (see quality.py). Picked
+                    # before the catch-up check, since a step down shortens the window
+                    level = self.quality.select()
+
+                    # --- Lag-aware Catch-up ---
+                    # If this audio arrived long ago and newer chunks are already waiting,
+                    # skip straight to them. Never skip once the audio since the last decode
+                    # would slide out of the window, or when the safety cap forces a split.
+                    # Skipped audio has to fit the window of the next tick too, which the
+                    # ladder may have stepped down by then.
+                    lag = time.monotonic() - received_at
+                    max_lag = max(max_lag, lag)
+                    metrics.STREAM_LAG_SECONDS.observe(lag)
+                    window_limit = min(
+                        self._window_duration(settings, level, pressure),
+                        self._window_duration(settings, self.quality.next_down, pressure),
+                    ) * samples_per_second - transcribe_interval_samples
+                    if lag > CATCHUP_LAG_SECONDS and not chunk_queue.empty() and not flush \
+                            and samples_since_last_decode < window_limit \
+                            and samples_in_utterance < utterance_limit:
+                        skipped_ticks += 1
+                        metrics.SKIPPED_TICKS.inc()
+                        continue
                     
-                    v_audio = np.concatenate(utterance_buffer)
-                    rms = np.sqrt(np.mean(np.square(v_audio)))
+                    # One contiguous copy per tick, shared by the gate and the decode
+                    full_audio_v = np.concatenate(utterance_buffer)
+                    utterance_buffer = [full_audio_v]
+                    rms = np.sqrt(np.mean(np.square(full_audio_v)))
                     
                     # Amplitude Gate (Broad filter)
                     if rms < AMPLITUDE_THRESHOLD:
                         consecutive_quiet_intervals += 1
-                        if consecutive_quiet_intervals < 2 and samples_in_utterance < max_utterance_samples:
+                        if consecutive_quiet_intervals < 2 and samples_in_utterance < utterance_limit and not flush:
                             continue
                     else:
                         consecutive_quiet_intervals = 0
 
+                    decision = None
                     try:
-                        # Contextual Prompting: Pass recent history to maintain quality
-                        # More history helps with slow narrators
-                        history_prompt = " ".join(transcription_history)[-500:].strip()
-                        initial_prompt = f"I am transcribing live speech. Context: {history_prompt}" if history_prompt else "I am transcribing live speech."
+                        initial_prompt = finalizer.prompt()
 
                         # --- GPU Optimization: Sliding Window ---
                         # Instead of transcribing the FULL buffer (which grows O(N^2)), 
-                        # we only transcribe the last 12s for performance.
-                        full_audio_v = np.concatenate(utterance_buffer)
+                        # we only transcribe the last few seconds (12s at standard quality).
                         total_duration = len(full_audio_v) / samples_per_second
                         
-                        window_duration = 12.0
+                        window_duration = self._window_duration(settings, level, pressure)
                         if total_duration > window_duration:
                             window_samples = int(window_duration * samples_per_second)
                             v_audio = full_audio_v[-window_samples:]
@@ -110,266 +467,104 @@ class WhisperTranscriber(transcription_pb2_grpc.WhisperTranscriberServicer):
                             v_audio = full_audio_v
                             window_offset = 0.0
 
-                        # Transcribe with tuned VAD and Word Timestamps
-                        segments, _ = self.model.transcribe(
-                            v_audio, 
-                            beam_size=1,
-                            vad_filter=True,
-                            vad_parameters=dict(min_silence_duration_ms=500, speech_pad_ms=200),
-                            word_timestamps=True,
-                            no_speech_threshold=0.6,
-                            log_prob_threshold=-0.5,
-                            compression_ratio_threshold=2.4,
-                            condition_on_previous_text=False,
-                            initial_prompt=initial_prompt
-                        )
-                        
-                        segments_list = list(segments)
-                        
-                        # Calculate rough WPM from the window for heuristics
-                        window_text = " ".join([s.text.strip() for s in segments_list if s.no_speech_prob < 0.4]).strip()
-                        num_words_window = len(window_text.split())
-                        has_strong_punctuation = any(window_text.endswith(p) for p in [".", "?", "!"])
-                        
-                        avg_wpm = (total_words_finalized / (total_speech_seconds / 60)) if total_speech_seconds > 5 else 150
-                        
-                        # Dynamic Thresholds
-                        if avg_wpm > 180: # Fast (YouTube style)
-                            base_required_silence = 0.6
-                            stall_threshold = 1.0 if has_strong_punctuation else 1.4
-                        elif avg_wpm < 85: # Gothic Narrator (Wizard of Oz style)
-                            # Deep patience for dramatic pauses
-                            base_required_silence = 4.0
-                            stall_threshold = 5.0 if has_strong_punctuation else 7.0
-                        elif avg_wpm < 110: # Narrator (Books)
-                            base_required_silence = 2.5
-                            stall_threshold = 3.0 if has_strong_punctuation else 4.0
-                        elif avg_wpm < 140: # Slow
-                            base_required_silence = 1.5
-                            stall_threshold = 2.0 if has_strong_punctuation else 2.8
-                        else: # Normal
-                            base_required_silence = 1.0
-                            stall_threshold = 1.5 if has_strong_punctuation else 2.2
-
-                        required_silence = base_required_silence
-                        if has_strong_punctuation:
-                            # If someone just said a period, we can be much snappier
-                            required_silence = min(required_silence, 0.4 if avg_wpm < 130 else 0.3)
-                        
-                        if num_words_window > 15 or total_duration > 15.0:
-                            required_silence = min(required_silence, 0.6)
+                        samples_since_last_decode = 0
+                        decode_started = time.perf_counter()
+                        tick_seconds = transcribe_interval_samples / samples_per_second
+                        decode = await self._decode(model, v_audio, initial_prompt, level, settings, tick_seconds)
+                        segments_list = decode.segments
+                        aligned_ticks += decode.aligned
+                        decode_ticks += 1
+                        decode_seconds += time.perf_counter() - decode_started
 
-                        # --- Word-Level Incremental Finalization ---
-                        last_finalized_end_rel = 0.0
-                        
-                        current_sentence_words = []
-                        all_speech_text_parts = []
-                        
-                        # Split hierarchies
-                        STRONG_STOP = [".", "?", "!", "..."]
-                        SOFT_STOP = [",", ";", ":", "-"] # Commas allow splitting but with more patience
-                        
-                        for s_idx, s in enumerate(segments_list):
-                            # Filter out low-confidence segments (hallucinations)
-                            if s.no_speech_prob > 0.8 or s.avg_logprob < -1.0: 
-                                continue
-                            
-                            if not s.words:
-                                s_text = s.text.strip()
-                                if not s_text: continue
-                                is_stop = any(s_text.endswith(p) for p in STRONG_STOP)
-                                if is_stop:
-                                    yield transcription_pb2.TranscriptionResult(
-                                        text=s_text, 
-                                        is_final=True, 
-                                        start_time=absolute_start_time + window_offset + s.start
-                                    )
-                                    logging.info(f"FINAL (Segment): {s_text}")
-                                    last_finalized_end_rel = s.end
-                                    total_words_finalized += len(s_text.split())
-                                    total_speech_seconds += max(0.2, s.end - s.start)
-                                    transcription_history.append(s_text)
-                                    transcription_history = transcription_history[-5:]
-                                else:
-                                    all_speech_text_parts.append(s_text)
-                                continue
-
-                            for w_idx, w in enumerate(s.words):
-                                w_text = w.word.strip()
-                                if not w_text: continue
-                                current_sentence_words.append(w_text)
-                                
-                                # --- Contextual Split Protection ---
-                                has_strong = any(w_text.endswith(p) for p in STRONG_STOP)
-                                has_soft = any(w_text.endswith(p) for p in SOFT_STOP)
-                                is_stop = False
-                                
-                                # 1. Look Ahead: Is there another word IMMEDIATELY following this one?
-                                # This is the highest priority - don't split if speech is continuous.
-                                has_next_soon = False
-                                if w_idx < len(s.words) - 1:
-                                    next_w = s.words[w_idx + 1]
-                                    if (next_w.start - w.end) < 0.4:
-                                        has_next_soon = True
-                                elif s_idx < len(segments_list) - 1:
-                                    next_s = segments_list[s_idx + 1]
-                                    if (next_s.start - w.end) < 0.4:
-                                        has_next_soon = True
-                                
-                                if not has_next_soon:
-                                    # Edge Protection variables
-                                    is_absolute_last = (w_idx == len(s.words) - 1) and (s_idx == len(segments_list) - 1)
-                                    silence_at_edge = total_duration - (window_offset + w.end)
-                                    
-                                    # Conjunction/Continuation check in next segments
-                                    is_followed_by_continuation = False
-                                    if s_idx < len(segments_list) - 1:
-                                        next_text = segments_list[s_idx + 1].text.strip().lower()
-                                        continuations = ["when", "and", "which", "but", "while", "that", "because", "the", "a"]
-                                        if any(next_text.startswith(c) for c in continuations):
-                                            is_followed_by_continuation = True
-                                    
-                                    # Higher word count for narrators to keep paragraphs whole
-                                    min_words = 12 if avg_wpm < 100 else 6
-                                    is_too_short = len(current_sentence_words) < min_words
-                                    
-                                    if has_strong:
-                                        if is_absolute_last:
-                                            # Edge word: require massive silence for narrators
-                                            required = (2.5 if avg_wpm < 100 else 1.5) if is_too_short else 0.8
-                                            is_stop = (silence_at_edge >= required)
-                                        else:
-                                            # Mid-segment: inhibit split if it's followed by a continuation
-                                            # or if it's too short
-                                            is_stop = not (is_too_short or is_followed_by_continuation)
-                                    elif has_soft:
-                                        # Soft split (comma)
-                                        if is_absolute_last:
-                                            is_stop = (silence_at_edge >= 1.5)
-                                        else:
-                                            is_stop = (silence_at_edge >= 1.0)
-
-                                if is_stop:
-                                    sentence_text = " ".join(current_sentence_words)
-                                    yield transcription_pb2.TranscriptionResult(
-                                        text=sentence_text,
-                                        is_final=True,
-                                        start_time=absolute_start_time + window_offset + w.start
-                                    )
-                                    logging.info(f"FINAL (Word): [{absolute_start_time + window_offset + w.start:06.2f}s] {sentence_text}")
-                                    
-                                    total_words_finalized += len(current_sentence_words)
-                                    duration_finalized = (w.end - (w.start if len(current_sentence_words) == 1 else s.words[0].start))
-                                    total_speech_seconds += max(0.1, duration_finalized)
-                                    
-                                    transcription_history.append(sentence_text)
-                                    transcription_history = transcription_history[-5:]
-                                    
-                                    # Slicing cushion
-                                    last_finalized_end_rel = min(total_duration - window_offset, w.end + 0.05)
-                                    current_sentence_words = []
-
-                        # Remaining text for partial update or forced finalization
-                        remaining_text = " ".join(current_sentence_words + all_speech_text_parts).strip()
-                        
-                        # --- Force Finalization Check (Outside Loop) ---
-                        latest_speech_timestamp_rel = 0.0
-                        for s in segments_list:
-                            if s.no_speech_prob < 0.4:
-                                latest_speech_timestamp_rel = max(latest_speech_timestamp_rel, s.end)
-                        
-                        total_silence = total_duration - (window_offset + latest_speech_timestamp_rel)
-                        
-                        if remaining_text != last_speech_text:
-                            last_speech_text = remaining_text
-                            last_text_change_time = total_duration
-                        total_stall = total_duration - last_text_change_time
-
-                        # Fallback triggers (silence, stall, safety cap)
-                        global_trigger = (samples_in_utterance >= max_utterance_samples) or (consecutive_quiet_intervals >= 2)
-                        should_force_fallback = (total_silence >= required_silence) or \
-                                               (total_stall >= stall_threshold and total_silence >= 0.4)
+                        # In-band latency telemetry, attached to every result from this tick
+                        timing = transcription_pb2.ResultTiming(
+                            audio_end=absolute_start_time + total_duration,
+                            receive_timestamp=received_wall,
+                            decode_seconds=decode.decode_seconds,
+                            queue_wait_seconds=decode.queue_wait,
+                        )
                         
-                        if (global_trigger or should_force_fallback) and remaining_text:
-                            # Anti-Hallucination Sink: Catch common "politeness" hallucinations during pauses
-                            words = remaining_text.split()
-                            clean_text = remaining_text.lower().replace(".", "").replace("!", "").replace("?", "").strip()
-                            
-                            # Whisper often hallucinations these during silence gaps
-                            SINK_WORDS = ["please", "thanks", "thank you", "bye", "you", "it", "with", "the"]
-                            is_hallucination = (len(words) == 1 and clean_text in SINK_WORDS)
-                            
-                            is_junk = (len(words) < 3 and (not any(p in remaining_text for p in STRONG_STOP) or total_silence > 1.0)) or is_hallucination
-                            
-                            if is_junk:
-                                # Carry over
-                                pass
+                        decision = finalizer.tick(
+                            segments_list, absolute_start_time, window_offset, total_duration,
+                            flush or samples_in_utterance >= utterance_limit, consecutive_quiet_intervals,
+                        )
+                        for final in decision.finals:
+                            yield transcription_pb2.TranscriptionResult(
+                                text=final.text, is_final=True, start_time=final.start_time, timing=timing
+                            )
+                            if final.kind == "segment":
+                                logging.info(f"FINAL (Segment): {final.text}")
                             else:
-                                # Finalize the entire remainder as one block
-                                yield transcription_pb2.TranscriptionResult(
-                                    text=remaining_text, is_final=True, start_time=absolute_start_time + window_offset
-                                )
-                                logging.info(f"FINAL (Forced): [{absolute_start_time + window_offset:06.2f}s] {remaining_text}")
-                                
-                                # Complete reset
-                                utterance_buffer = []
-                                samples_in_utterance = 0
-                                absolute_start_time += total_duration
-                                last_speech_text = ""
-                                last_text_change_time = total_duration
-                                # Mark as fully processed
-                                remaining_text = "" 
-                        elif last_finalized_end_rel > 0:
+                                logging.info(f"FINAL ({final.kind.capitalize()}): [{final.start_time:06.2f}s] {final.text}")
+                            self._record_final(session.id, *final.span, final.text, final.kind, final.words)
+
+                        if decision.action == finalization.SPLIT:
                             # Tail preservation based on last punctuation split
-                            actual_split_time = window_offset + last_finalized_end_rel
-                            split_sample = int(actual_split_time * samples_per_second)
+                            split_sample = int(decision.split_at * samples_per_second)
                             
-                            tail_audio = full_audio_v[split_sample:]
-                            absolute_start_time += actual_split_time
+                            # A copy, so the tail doesn't keep the whole utterance alive
+                            tail_audio = full_audio_v[split_sample:].copy()
+                            absolute_start_time += decision.split_at
                             utterance_buffer = [tail_audio] if len(tail_audio) > 0 else []
                             samples_in_utterance = len(tail_audio)
-                            
-                            last_speech_text = ""
-                            last_text_change_time = 0.0
-                        else:
-                            # Emergency Cleanup for silent/stuck buffers
-                            if global_trigger or consecutive_quiet_intervals >= 10:
+                        elif decision.action in (finalization.FORCED, finalization.RESET):
+                            if decision.action == finalization.RESET:
                                 logging.info(f"EMERGENCY Cleanup ({total_duration:.1f}s)")
-                                utterance_buffer = []
-                                samples_in_utterance = 0
-                                absolute_start_time += total_duration
-                                last_speech_text = ""
-                            elif remaining_text:
-                                # Regular partial update
+                            # Complete reset
+                            utterance_buffer = []
+                            samples_in_utterance = 0
+                            absolute_start_time += total_duration
+                        elif decision.action == finalization.PARTIAL:
+                            # Regular partial update
+                            if settings.partials:
                                 yield transcription_pb2.TranscriptionResult(
-                                    text=remaining_text, is_final=False, start_time=absolute_start_time + window_offset
+                                    text=decision.text, is_final=False, start_time=absolute_start_time + window_offset, timing=timing
                                 )
-                                logging.info(f"DEBUG: dur={total_duration:.1f}s, silence={total_silence:.1f}s, words={num_words_window}")
+                            logging.info(f"DEBUG: dur={total_duration:.1f}s, silence={decision.silence:.1f}s, words={decision.window_words}")
                                 
                     except Exception as e:
                         logging.error(f"Transcription error: {e}")
+
+                    # Draining: stop at the first utterance boundary, i.e. once
+                    # nothing undelivered is left in the buffer and no word is
+                    # still being spoken at its edge
+                    if flush or (self.draining and decision is not None and (
+                            decision.action in (finalization.FORCED, finalization.RESET) or not decision.text)
+                            and np.sqrt(np.mean(np.square(full_audio_v[-edge_samples:]))) < AMPLITUDE_THRESHOLD):
+                        logging.info(f"Stream drained at {absolute_start_time:.1f}s")
+                        # A flush after the client's own half-close isn't a drain
+                        session.drained = session.drained or not flush
+                        break
         finally:
-            # ... Wave file saving logic ...
-            if recording_buffer:
-                try:
-                    import os
-                    from datetime import datetime
-                    full_recording = np.concatenate(recording_buffer)
-                    audio_int16 = (np.clip(full_recording, -1.0, 1.0) * 32767).astype(np.int16)
-                    
-                    recordings_dir = "/app/recordings"
-                    os.makedirs(recordings_dir, exist_ok=True)
-                    
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    output_path = os.path.join(recordings_dir, f"recording_{timestamp}.wav")
-                    
-                    logging.info(f"Saving {len(full_recording)/target_sample_rate:.2f}s of audio to {output_path}")
-                    
-                    with wave.open(output_path, "wb") as wf:
-                        wf.setnchannels(1)
-                        wf.setsampwidth(2) # 16-bit
-                        wf.setframerate(target_sample_rate)
-                        wf.writeframes(audio_int16.tobytes())
-                    logging.info(f"Recording saved successfully to {output_path}")
-                except Exception as e:
-                    logging.error(f"Failed to save recording: {e}")
\ No newline at end of file
+            self.active_streams -= 1
+            metrics.ACTIVE_STREAMS.set(self.active_streams)
+            session.bytes_consumed = bytes_consumed
+            if session.drained and session.bytes_received > bytes_consumed:
+                logging.info(
+                    f"Drained session {session.id} left {session.bytes_received - bytes_consumed} received "
+                    f"bytes undecoded; its client resends them from byte {bytes_consumed}"
+                )
+            usage.close()
+            logging.info(f"Stream memory peaked at {usage.peak / 2**20:.1f} MiB")
+            if skipped_ticks:
+                logging.info(f"Catch-up skipped {skipped_ticks} ticks, max lag {max_lag:.1f}s")
+            if decode_ticks:
+                logging.info(f"Word alignment ran on {aligned_ticks}/{decode_ticks} ticks, avg decode {decode_seconds / decode_ticks * 1000:.0f}ms")
+
+            self.store.session_ended(
+                session.id,
+                recording.path if recording is not None else None,
+                recording.samples / target_sample_rate if recording is not None else 0.0,
+            )
+            if recording is not None:
+                # Finishes on the writer thread; the second pass picks it up from there
+                loop = asyncio.get_running_loop()
+
+                def saved(done):
+                    loop.call_soon_threadsafe(self._closing_recordings.discard, done)
+                    if done.exception() is None and done.result():
+                        loop.call_soon_threadsafe(self.second_pass.submit, done.result())
+
+                closed = recording.close()
+                self._closing_recordings.add(closed)
+                closed.add_done_callback(saved)
@@ -0,0 +1,176 @@
+import bisect
+import logging
+import os
+import re
+import sqlite3
+import time
+from array import array
+
+import numpy as np
+
+import metrics
+
+# Word characters plus inner apostrophes ("don't"), case-folded
+TOKEN_RE = re.compile(r"\w+(?:'\w+)*")
+# A prefix query expands to at most this many vocabulary terms
+MAX_PREFIX_TERMS = 512
+
+
+def normalize(text):
+    return [token.casefold() for token in TOKEN_RE.findall(text)]
+
+
+def _contains(sorted_positions, values):
+    # Membership mask of values in a sorted array, O(len(values) log n)
+    found = np.searchsorted(sorted_positions, values)
+    mask = found < len(sorted_positions)
+    mask[mask] = sorted_positions[found[mask]] == values[mask]
+    return mask
+
+
+class TranscriptIndex:
+    # In-memory inverted index over finalized words. Every indexed word gets
+    # a position in arrival order. Live sessions interleave their finals, so
+    # adjacency is kept per session instead: each word links to the previous
+    # and next word of its own session, and a phrase is a chain of those
+    # links. Postings are per-term arrays of positions (sorted, since
+    # positions only grow), searched as numpy views without copying.
+    def __init__(self):
+        self._terms = {}  # token -> array("i") of positions
+        self._vocabulary = []  # Sorted tokens, for prefix expansion
+        # Per position; -1 links mark a session's first/last word
+        self._word_segment = array("i")
+        self._word_time = array("f")
+        self._word_prev = array("i")
+        self._word_next = array("i")
+        # Per segment
+        self._segment_session = array("i")
+        self._segment_start = array("d")
+        self._segment_text = []
+        # Per session index: [session id, recording path, last position]
+        self._sessions = []
+        self._session_index = {}
+
+    def __len__(self):
+        return len(self._word_time)
+
+    def set_recording(self, session_id, recording_path):
+        self._session(session_id)[1] = recording_path
+
+    def _session(self, session_id):
+        index = self._session_index.get(session_id)
+        if index is None:
+            index = self._session_index[session_id] = len(self._sessions)
+            self._sessions.append([session_id, None, -1])
+        return self._sessions[index]
+
+    def add_segment(self, session_id, start_time, text, words=()):
+        # words: (start, end, word, probability) tuples; without them every
+        # token is placed at the segment start
+        session = self._session(session_id)
+        segment = len(self._segment_text)
+        self._segment_session.append(self._session_index[session_id])
+        self._segment_start.append(start_time)
+        self._segment_text.append(text)
+        timed = [(token, w[0]) for w in words for token in normalize(w[2])] if words else \
+            [(token, start_time) for token in normalize(text)]
+        for token, word_time in timed:
+            position = len(self._word_time)
+            postings = self._terms.get(token)
+            if postings is None:
+                postings = self._terms[token] = array("i")
+                bisect.insort(self._vocabulary, token)
+            postings.append(position)
+            self._word_segment.append(segment)
+            self._word_time.append(word_time)
+            previous = session[2]
+            if previous >= 0:
+                self._word_next[previous] = position
+            self._word_prev.append(previous)
+            self._word_next.append(-1)
+            session[2] = position
+        metrics.INDEXED_WORDS.set(len(self._word_time))
+
+    def load(self, db_path):
+        # Rebuilds the index from the transcript store, oldest session first
+        if not os.path.exists(db_path):
+            return
+        started = time.perf_counter()
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            for session_id, recording_path in conn.execute(
+                "SELECT id, recording_path FROM sessions ORDER BY started_at"
+            ):
+                self.set_recording(session_id, recording_path)
+            segments = conn.execute(
+                "SELECT s.id, s.session_id, s.start_time, s.text FROM segments s "
+                "JOIN sessions ON sessions.id = s.session_id ORDER BY sessions.started_at, s.id"
+            ).fetchall()
+            words = {}
+            for segment_id, start_time, end_time, word, probability in conn.execute(
+                "SELECT segment_id, start_time, end_time, word, probability FROM words ORDER BY segment_id, start_time"
+            ):
+                words.setdefault(segment_id, []).append((start_time, end_time, word, probability))
+            for segment_id, session_id, start_time, text in segments:
+                self.add_segment(session_id, start_time, text, words.get(segment_id, ()))
+        finally:
+            conn.close()
+        logging.info(
+            f"Indexed {len(self):,} words in {len(self._segment_text):,} segments from {db_path} "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+    def _positions(self, token):
+        # Sorted positions of a token, or of every term starting with it if it ends in *
+        if not token.endswith("*"):
+            postings = self._terms.get(token)
+            return np.frombuffer(postings, dtype=np.int32) if postings else np.empty(0, np.int32)
+        prefix = token[:-1]
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        matches = []
+        for term in self._vocabulary[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            matches.append(np.frombuffer(self._terms[term], dtype=np.int32))
+        return np.sort(np.concatenate(matches)) if matches else np.empty(0, np.int32)
+
+    def search(self, query, limit=50):
+        # Phrase search: every query token must appear in order, adjacent and
+        # in one session. A trailing * makes a token a prefix. Returns
+        # (total matches, newest-first hits).
+        tokens = [t + "*" if raw.endswith("*") else t for raw in query.split() for t in normalize(raw)]
+        if not tokens:
+            return 0, []
+        postings = [self._positions(token) for token in tokens]
+        # Start from the rarest token, step back to where its phrase would
+        # start, then follow the session's word links checking each token
+        anchor = min(range(len(tokens)), key=lambda i: len(postings[i]))
+        previous = np.frombuffer(self._word_prev, dtype=np.int32)
+        following = np.frombuffer(self._word_next, dtype=np.int32)
+        starts = postings[anchor]
+        for _ in range(anchor):
+            starts = previous[starts]
+            starts = starts[starts >= 0]
+        current = starts
+        for i, positions in enumerate(postings):
+            if i:
+                current = following[current]
+                found = current >= 0
+                starts, current = starts[found], current[found]
+            if i != anchor:
+                found = _contains(positions, current)
+                starts, current = starts[found], current[found]
+        starts = np.sort(starts)
+
+        hits = []
+        for position in starts[::-1][:limit]:
+            segment = self._word_segment[position]
+            session_id, recording_path, _ = self._sessions[self._segment_session[segment]]
+            hits.append({
+                "session_id": session_id,
+                "recording": os.path.basename(recording_path) if recording_path else "",
+                "start_time": self._word_time[position],
+                "segment_start": self._segment_start[segment],
+                "text": self._segment_text[segment],
+            })
+        return len(starts), hits
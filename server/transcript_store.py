@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from recordings import RECORDINGS_DIR
+
+# SQLite database of finalized transcripts. Empty disables the store.
+TRANSCRIPT_DB = os.environ.get("TRANSCRIPT_DB", os.path.join(RECORDINGS_DIR, "transcripts.db"))
+# Upper bound on queued operations committed in one transaction
+MAX_BATCH = 2000
+# The writer waits up to this long after the first queued operation, unless
+# LINGER_OPS are already pending, so a commit carries more than one final
+LINGER_SECONDS = float(os.environ.get("TRANSCRIPT_STORE_LINGER_MS", "5")) / 1000
+LINGER_OPS = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    model TEXT,
+    language TEXT,
+    recording_path TEXT,
+    duration REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_started_at ON sessions(started_at);
+
+-- Times are seconds from the start of the session's recording
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    text TEXT NOT NULL,
+    kind TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_session_time ON segments(session_id, start_time, end_time);
+
+CREATE TABLE IF NOT EXISTS words (
+    segment_id INTEGER NOT NULL REFERENCES segments(id),
+    session_id TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    word TEXT NOT NULL,
+    probability REAL
+);
+CREATE INDEX IF NOT EXISTS words_session_time ON words(session_id, start_time);
+CREATE INDEX IF NOT EXISTS words_segment ON words(segment_id);
+"""
+
+
+def connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # With WAL, NORMAL only risks the last commits on power loss, never corruption
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class TranscriptStore:
+    # Durable record of every session's finals. Callers on the streaming path
+    # only append to an in-memory queue; one writer task drains whatever has
+    # accumulated into a single transaction on a dedicated thread, so the
+    # batch grows with load (group commit) and disk never blocks the loop.
+    def __init__(self, path=TRANSCRIPT_DB):
+        self.path = path
+        self._queue = asyncio.Queue()
+        self._batch_ready = asyncio.Event()  # LINGER_OPS are pending
+        self._task = None
+        self._conn = None
+        # SQLite connections are used from the one thread that writes
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcript-store")
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        loop = asyncio.get_running_loop()
+        self._conn = await loop.run_in_executor(self._executor, connect, self.path)
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        # Flush everything queued so far, then stop
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._conn.close)
+
+    def _put(self, op):
+        if self._task is not None:
+            self._queue.put_nowait(op)
+            metrics.TRANSCRIPT_STORE_PENDING.set(self._queue.qsize())
+            if self._queue.qsize() >= LINGER_OPS:
+                self._batch_ready.set()
+
+    def session_started(self, session_id, model=None, language=None):
+        self._put(("session", (session_id, time.time(), model, language)))
+
+    def add_segment(self, session_id, start_time, end_time, text, kind, words=()):
+        # words: (start_time, end_time, word, probability) tuples
+        self._put(("segment", (session_id, start_time, end_time, text, kind), words))
+
+    def session_ended(self, session_id, recording_path=None, duration=None):
+        self._put(("end", (time.time(), recording_path, duration, session_id)))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = [await self._queue.get()]
+            if batch[0] is not None and LINGER_SECONDS > 0 and self._queue.qsize() < LINGER_OPS:
+                self._batch_ready.clear()
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), LINGER_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            while len(batch) < MAX_BATCH and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if batch[-1] is None:
+                stopping = True
+                batch.pop()
+            metrics.TRANSCRIPT_STORE_PENDING.set(self._queue.qsize())
+            if not batch:
+                continue
+            try:
+                await loop.run_in_executor(self._executor, self._write, batch)
+            except Exception as e:
+                logging.error(f"Transcript store dropped {len(batch)} writes: {e}")
+
+    def _write(self, batch):
+        words_written = 0
+        with self._conn:
+            for op in batch:
+                if op[0] == "segment":
+                    _, segment, words = op
+                    cursor = self._conn.execute(
+                        "INSERT INTO segments (session_id, start_time, end_time, text, kind) VALUES (?, ?, ?, ?, ?)",
+                        segment,
+                    )
+                    if words:
+                        self._conn.executemany(
+                            "INSERT INTO words (segment_id, session_id, start_time, end_time, word, probability) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            [(cursor.lastrowid, segment[0], *word) for word in words],
+                        )
+                        words_written += len(words)
+                elif op[0] == "session":
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO sessions (id, started_at, model, language) VALUES (?, ?, ?, ?)", op[1]
+                    )
+                elif op[0] == "end":
+                    self._conn.execute(
+                        "UPDATE sessions SET ended_at = ?, recording_path = ?, duration = ? WHERE id = ?", op[1]
+                    )
+        metrics.TRANSCRIPT_STORE_BATCHES.inc()
+        metrics.TRANSCRIPT_STORE_ROWS.inc(len(batch) + words_written)
+
+
+def session_segments(conn, session_id, start_time=None, end_time=None):
+    # Segments of a session overlapping [start_time, end_time), oldest first
+    query = "SELECT id, start_time, end_time, text, kind FROM segments WHERE session_id = ?"
+    params = [session_id]
+    if end_time is not None:
+        query += " AND start_time < ?"
+        params.append(end_time)
+    if start_time is not None:
+        query += " AND end_time > ?"
+        params.append(start_time)
+    return conn.execute(query + " ORDER BY start_time", params).fetchall()